@@ -0,0 +1,324 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from answer_options import MULTISELECT_COLUMNS
+from connections import open_connection
+from csv_import import RESPONSE_FIELDS
+from fulltext import TEXT_COLUMNS
+from option_vocabulary import OPTION_LABELS, load_answers
+from tracing import traced
+
+try:
+    import duckdb
+except ImportError:  # Without DuckDB the dashboard filters the cached pandas frame
+    duckdb = None
+
+# Optional analytical read path for the scientist dashboard. A columnar copy
+# of the responses is kept in an in-memory DuckDB database, and the keyword
+# and multi-select filters, the facet counts and the cross-tabs run there as
+# SQL instead of over a pandas frame of every row. Writes stay in SQLite; the
+# copy is rebuilt in the background when the data version has changed,
+# at most once per SURVEY_ANALYTICS_REFRESH seconds, so the dashboard can lag
+# the database by that long.
+#
+# Enable with SURVEY_ANALYTICS=duckdb (needs the duckdb package). The copy is
+# read from SQLite by this process rather than through DuckDB's sqlite
+# extension, which DuckDB would otherwise download on first use.
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.environ.get('SURVEY_ANALYTICS') == 'duckdb' and duckdb is not None
+REFRESH_INTERVAL = float(os.environ.get('SURVEY_ANALYTICS_REFRESH', '30'))
+REFRESH_BATCH_SIZE = 50000  # Rows read from SQLite per batch while copying
+
+# After a failed build the next attempt waits RETRY_DELAY seconds, doubling
+# with each failure in a row up to MAX_RETRY_DELAY
+RETRY_DELAY = 5.0
+MAX_RETRY_DELAY = 300.0
+
+COPIED_COLUMNS = ['id', *RESPONSE_FIELDS, 'approved', 'version']
+
+
+def _column_type(column):
+    return 'BIGINT' if column in ('id', 'approved', 'version') else 'VARCHAR'
+
+
+def _options_sql(column):
+    # (id, question, option) for each answer of column, labelled like the
+    # response_options table in SQLite: JSON lists are unnested and codes
+    # looked up in option_labels, other text is a single answer. Codes are
+    # matched on their JSON text, so that the join is a hash join and a text
+    # answer "5" isn't taken for code 5.
+    return f"""SELECT answers.id, '{column}' AS question,
+                      upper(COALESCE(option_labels.label, answers.answer ->> '$')) AS option
+               FROM (SELECT id, unnest(json_extract({column}, '$[*]')) AS answer
+                     FROM copied WHERE json_valid({column})) AS answers
+               LEFT JOIN option_labels ON option_labels.question = '{column}'
+                    AND option_labels.answer = CAST(answers.answer AS VARCHAR)
+               UNION ALL
+               SELECT id, '{column}', upper({column}) FROM copied
+               WHERE NOT json_valid({column}) AND {column} != ''"""
+
+
+@traced()
+def build_analytics_db(conn, filter_options, batch_size=REFRESH_BATCH_SIZE):
+    # In-memory DuckDB database with the responses read from the SQLite
+    # connection conn. Each multi-select column gets a bitmask column,
+    # <column>_bits, with bit i set when the response has the i-th option of
+    # its filter (after 'ALL'); the last bit is 'OTHER'. The unnested answers
+    # are kept in response_options for the keyword search.
+    db = duckdb.connect()
+    db.execute(f"""CREATE TABLE copied
+                   ({', '.join(f'{column} {_column_type(column)}' for column in COPIED_COLUMNS)})""")
+    query = f"SELECT {', '.join(COPIED_COLUMNS)} FROM responses ORDER BY id"
+    for batch in pd.read_sql_query(query, conn, chunksize=batch_size):
+        db.register('batch', batch)
+        db.execute("INSERT INTO copied SELECT * FROM batch")
+        db.unregister('batch')
+
+    labels = pd.DataFrame([(column, str(code), label) for column, column_labels in OPTION_LABELS.items()
+                           for code, label in enumerate(column_labels, start=1)],
+                          columns=['question', 'answer', 'label'])
+    bits = pd.DataFrame([(column, option, bit) for column, options in filter_options.items()
+                         for bit, option in enumerate(options[1:])],
+                        columns=['question', 'option', 'bit'])
+    db.register('labels', labels)
+    db.register('bits', bits)
+    db.execute("CREATE TABLE option_labels AS SELECT * FROM labels")
+    db.execute("CREATE TABLE option_bits AS SELECT * FROM bits")
+    db.unregister('labels')
+    db.unregister('bits')
+
+    db.execute(f"""CREATE TABLE response_options AS
+                   {' UNION ALL '.join(_options_sql(column) for column in MULTISELECT_COLUMNS)}""")
+    # Answers that aren't predefined options set the 'OTHER' bit
+    bitmasks = ", ".join(f"bit_or(1 << bit) FILTER (WHERE question = '{column}') AS {column}_bits"
+                         for column in MULTISELECT_COLUMNS)
+    db.execute(f"""CREATE TABLE responses AS
+                   WITH answer_bits AS (
+                       SELECT response_options.id, response_options.question,
+                              COALESCE(option_bits.bit, other.bit) AS bit
+                       FROM response_options
+                       JOIN option_bits AS other ON other.question = response_options.question
+                            AND other.option = 'OTHER'
+                       LEFT JOIN option_bits ON option_bits.question = response_options.question
+                            AND option_bits.option = response_options.option)
+                   SELECT copied.*, {', '.join(f'COALESCE({column}_bits, 0) AS {column}_bits'
+                                                for column in MULTISELECT_COLUMNS)}
+                   FROM copied LEFT JOIN (SELECT id, {bitmasks} FROM answer_bits GROUP BY id) AS bitmasks USING (id)
+                   ORDER BY id""")
+    db.execute("DROP TABLE copied")
+    return db
+
+
+class AnalyticsStore:
+    # The current DuckDB copy. Each query runs on its own cursor of the copy
+    # it started with, so a refresh swaps in the new copy without waiting for
+    # running queries. A failed build is logged and retried with backoff;
+    # until a first copy exists, available() is false and the dashboard
+    # filters in pandas instead.
+    def __init__(self, db_path, filter_options):
+        self.db_path = db_path
+        self.filter_options = filter_options
+        self.error = None  # Why the last build failed, until one succeeds
+        self._lock = threading.Lock()
+        self._db = None
+        self._version = None
+        self._built_at = 0.0
+        self._refreshing = False
+        self._failures = 0
+        self._retry_at = 0.0
+
+    def refresh(self, data_version):
+        # Builds the first copy right away; later copies are built on a
+        # background thread while queries keep using the current one
+        with self._lock:
+            if self._refreshing or time.time() < self._retry_at:
+                return
+            if self._db is not None and (data_version == self._version
+                                         or time.time() - self._built_at < REFRESH_INTERVAL):
+                return
+            first = self._db is None
+            self._refreshing = True
+        if first:
+            self._rebuild(data_version)
+        else:
+            threading.Thread(target=self._rebuild, args=(data_version,), name="analytics-refresh",
+                             daemon=True).start()
+
+    def _rebuild(self, data_version):
+        try:
+            conn = open_connection(self.db_path)
+            try:
+                db = build_analytics_db(conn, self.filter_options)
+            finally:
+                conn.close()
+        except Exception as e:
+            with self._lock:
+                self._failures += 1
+                delay = min(RETRY_DELAY * 2 ** (self._failures - 1), MAX_RETRY_DELAY)
+                self._retry_at = time.time() + delay
+                self.error = e
+            logger.warning("Building the analytics copy failed (attempt %d); retrying in %.0fs: %s",
+                           self._failures, delay, e)
+        else:
+            with self._lock:
+                self._db, self._version, self._built_at = db, data_version, time.time()
+                self._failures, self._retry_at, self.error = 0, 0.0, None
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def available(self):
+        return self._db is not None
+
+    def is_current(self, data_version):
+        return data_version == self._version
+
+    def built_at(self):
+        return datetime.fromtimestamp(self._built_at)
+
+    def _cursor(self):
+        with self._lock:
+            return self._db.cursor()
+
+    def count(self):
+        cursor = self._cursor()
+        try:
+            return cursor.execute("SELECT count(*) FROM responses").fetchone()[0]
+        finally:
+            cursor.close()
+
+    def _bit(self, column, option):
+        return 1 << (self.filter_options[column].index(option) - 1)
+
+    def _conditions(self, selections):
+        # SQL condition per active multi-select filter: any selected bit set
+        conditions = {}
+        for column, selected in selections.items():
+            if selected and 'ALL' not in selected:
+                mask = sum(self._bit(column, option) for option in set(selected))
+                conditions[column] = f"({column}_bits & {mask}) != 0"
+        return conditions
+
+    @staticmethod
+    def _and(conditions, excluded=None):
+        return " AND ".join(condition for name, condition in conditions.items() if name != excluded) or "TRUE"
+
+    @traced("analytics filter")
+    def filter(self, keyword, matching_ids, behavior_change, selections):
+        # Returns (ids of the matching responses, ranked by the keyword search
+        # if there is one and by id otherwise, counts per behavior change
+        # answer, facet counts per multi-select column), the same figures the
+        # in-memory path computes
+        behavior_change = behavior_change if behavior_change and behavior_change != 'ALL' else None
+        conditions = self._conditions(selections)
+
+        # Facets: per behavior change answer, the responses matching the
+        # multi-select filters, and per option those matching all the other
+        # multi-select filters; the behavior change filter is applied below.
+        # They are summed over the distinct combinations of answer and
+        # bitmasks, which are far fewer than the responses.
+        aggregates, keys = [f"sum(n) FILTER (WHERE {self._and(conditions)})"], [None]
+        for column in selections:
+            others = self._and(conditions, column)
+            aggregates.append(f"sum(n) FILTER (WHERE {others})")
+            keys.append((column, 'ALL'))
+            for option in self.filter_options[column][1:]:
+                aggregates.append(f"sum(n) FILTER (WHERE {others} AND ({column}_bits & {self._bit(column, option)}) != 0)")
+                keys.append((column, option))
+        bitmasks = ', '.join(f'{column}_bits' for column in MULTISELECT_COLUMNS)
+
+        cursor = self._cursor()
+        try:
+            if matching_ids is None and keyword:
+                # Without FTS5 every text column and answer is searched; stored
+                # text is uppercase, like the keyword
+                scan = " OR ".join(f"contains({column}, $keyword)" for column in TEXT_COLUMNS)
+                matching_ids = cursor.execute(f"""SELECT id FROM responses WHERE {scan}
+                                                  OR id IN (SELECT id FROM response_options
+                                                            WHERE contains(option, $keyword))
+                                                  ORDER BY id""", {'keyword': keyword}).fetchnumpy()['id']
+            if matching_ids is not None:
+                cursor.register('keyword_ids', pd.DataFrame({'id': np.asarray(matching_ids, dtype=np.int64),
+                                                             'rank': np.arange(len(matching_ids))}))
+                keyword_condition = "id IN (SELECT id FROM keyword_ids)"
+            else:
+                keyword_condition = "TRUE"
+            where, params = self._and(conditions), []
+            if behavior_change:
+                where, params = f"{where} AND q2_behavior_change = ?", [behavior_change]
+            if matching_ids is not None:
+                query = f"""SELECT id FROM responses JOIN keyword_ids USING (id)
+                            WHERE {where} ORDER BY keyword_ids.rank"""
+            else:
+                query = f"SELECT id FROM responses WHERE {where} ORDER BY id"
+            ids = pd.Index(cursor.execute(query, params).fetchnumpy()['id'])
+
+            groups = cursor.execute(f"""WITH combinations AS (SELECT q2_behavior_change, {bitmasks}, count(*) AS n
+                                                              FROM responses WHERE {keyword_condition}
+                                                              GROUP BY ALL)
+                                        SELECT q2_behavior_change, {', '.join(aggregates)} FROM combinations
+                                        GROUP BY ALL""").fetchall()
+        finally:
+            cursor.close()
+
+        behavior_change_counts = {'ALL': 0}
+        facets = {column: dict.fromkeys(self.filter_options[column], 0) for column in selections}
+        for value, *counts in groups:
+            counts = [n or 0 for n in counts]
+            behavior_change_counts[value] = counts[0]
+            behavior_change_counts['ALL'] += counts[0]
+            if behavior_change is None or value == behavior_change:
+                for key, n in zip(keys[1:], counts[1:]):
+                    facets[key[0]][key[1]] += n
+        return ids, behavior_change_counts, facets
+
+    @traced("analytics rows")
+    def rows(self, ids):
+        # Frame of the responses with the given ids, in that order, shaped
+        # like the dashboard's cached frame: multi-select cells are parsed
+        # into lists of codes
+        cursor = self._cursor()
+        try:
+            cursor.register('wanted', pd.DataFrame({'id': np.asarray(ids, dtype=np.int64),
+                                                    'position': np.arange(len(ids))}))
+            df = cursor.execute(f"""SELECT {', '.join(f'responses.{column}' for column in COPIED_COLUMNS)}
+                                    FROM wanted JOIN responses USING (id) ORDER BY wanted.position""").df()
+        finally:
+            cursor.close()
+        for column in MULTISELECT_COLUMNS:
+            df[column] = df[column].map(load_answers)
+        return df.set_index('id', drop=False).rename_axis(None)
+
+    @traced("analytics crosstab")
+    def crosstab(self, row_column, column_column, ids):
+        # Responses among ids per pair of options of two multi-select
+        # columns, as a frame indexed by the options of row_column. The
+        # responses are first counted per pair of bitmasks, which are then
+        # unnested into their bits.
+        rows = self.filter_options[row_column][1:]
+        columns = self.filter_options[column_column][1:]
+        cursor = self._cursor()
+        try:
+            cursor.register('selected', pd.DataFrame({'id': np.asarray(ids, dtype=np.int64)}))
+            pairs = cursor.execute(f"""WITH masks AS (SELECT {row_column}_bits AS a, {column_column}_bits AS b,
+                                                             count(*) AS n
+                                                      FROM responses WHERE id IN (SELECT id FROM selected)
+                                                      GROUP BY ALL)
+                                       SELECT row_bit, column_bit, sum(n)
+                                       FROM masks, range(?) AS r(row_bit), range(?) AS c(column_bit)
+                                       WHERE (a >> row_bit) & 1 = 1 AND (b >> column_bit) & 1 = 1
+                                       GROUP BY ALL""", [len(rows), len(columns)]).fetchall()
+        finally:
+            cursor.close()
+        counts = np.zeros((len(rows), len(columns)), dtype=np.int64)
+        for row_bit, column_bit, n in pairs:
+            counts[row_bit, column_bit] = n
+        return pd.DataFrame(counts, index=rows, columns=columns)
@@ -0,0 +1,79 @@
+from option_vocabulary import QUESTION_OPTIONS, option_label_sql
+
+# Multi-select questions that are stored as JSON lists on the responses table.
+# Each selected option is also kept as a row in response_options, by its label,
+# so the filters' membership index and the option counts are read from it
+# instead of parsing every JSON cell in Python.
+MULTISELECT_COLUMNS = list(QUESTION_OPTIONS)
+
+
+def _insert_options_sql(source):
+    # One INSERT per question. Valid JSON is unnested with json_each, anything
+    # else is stored as a single option so it still shows up under "OTHER".
+    statements = []
+    for col in MULTISELECT_COLUMNS:
+        statements.append(f"""
+            INSERT OR IGNORE INTO response_options (response_id, question, option)
+            SELECT {source}.id, '{col}', upper({option_label_sql(col)}) FROM json_each({source}.{col})
+            WHERE json_valid({source}.{col});
+            INSERT OR IGNORE INTO response_options (response_id, question, option)
+            SELECT {source}.id, '{col}', upper({source}.{col})
+            WHERE NOT json_valid({source}.{col}) AND {source}.{col} IS NOT NULL AND {source}.{col} != '';""")
+    return "".join(statements)
+
+
+def create_answer_options_table(conn):
+    c = conn.cursor()
+    c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'response_options'")
+    exists = c.fetchone() is not None
+
+    c.executescript(f"""
+        CREATE TABLE IF NOT EXISTS response_options
+            (response_id INTEGER NOT NULL,
+             question TEXT NOT NULL,
+             option TEXT NOT NULL,
+             PRIMARY KEY (question, option, response_id)) WITHOUT ROWID;
+
+        CREATE INDEX IF NOT EXISTS idx_response_options_response_id
+            ON response_options (response_id);
+
+        DROP TRIGGER IF EXISTS responses_options_insert;
+        CREATE TRIGGER responses_options_insert AFTER INSERT ON responses
+        BEGIN
+            {_insert_options_sql('NEW')}
+        END;
+
+        DROP TRIGGER IF EXISTS responses_options_update;
+        CREATE TRIGGER responses_options_update
+        AFTER UPDATE OF {', '.join(MULTISELECT_COLUMNS)} ON responses
+        BEGIN
+            DELETE FROM response_options WHERE response_id = OLD.id;
+            {_insert_options_sql('NEW')}
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS responses_options_delete AFTER DELETE ON responses
+        BEGIN
+            DELETE FROM response_options WHERE response_id = OLD.id;
+        END;
+    """)
+
+    if not exists:
+        backfill_answer_options(conn)
+    conn.commit()
+
+
+def backfill_answer_options(conn):
+    # Rebuild the child table from the JSON columns of every existing response
+    c = conn.cursor()
+    c.execute("DELETE FROM response_options")
+    for col in MULTISELECT_COLUMNS:
+        c.execute(f"""
+            INSERT OR IGNORE INTO response_options (response_id, question, option)
+            SELECT responses.id, '{col}', upper({option_label_sql(col)}) FROM responses, json_each(responses.{col})
+            WHERE json_valid(responses.{col})""")
+        c.execute(f"""
+            INSERT OR IGNORE INTO response_options (response_id, question, option)
+            SELECT id, '{col}', upper({col}) FROM responses
+            WHERE NOT json_valid({col}) AND {col} IS NOT NULL AND {col} != ''""")
+    conn.commit()
+
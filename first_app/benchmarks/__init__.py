@@ -0,0 +1,15 @@
+import os
+import sys
+
+# Benchmarks of the app's hot paths over synthetic survey data. Run from the
+# app directory:
+#
+#     python -m benchmarks.run --rows 10000 100000 --output results.json
+#
+# The app's modules import each other as top-level modules, so the app
+# directory goes on the path the same way Streamlit puts it there.
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
@@ -0,0 +1,344 @@
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+from benchmarks import APP_DIR
+from benchmarks.synthetic import fit_survey_model, write_csv
+from connections import ConnectionPool, open_connection
+from csv_import import import_csv
+from index_cards import card_fields, write_index_cards_pdf
+from migrations import migrate
+from near_duplicates import update_duplicate_index
+from option_vocabulary import OPTION_LABELS, decode_frame
+from similar_responses import update_similarity_index
+from write_queue import GroupCommitWriter
+
+# Times the app's hot paths over synthetic responses of each requested size
+# and saves the results as JSON, optionally next to an earlier run's. Pages
+# are driven headless through Streamlit's AppTest, with the apps pointed at a
+# temporary database through SURVEY_DB_PATH.
+#
+#     python -m benchmarks.run [--rows N ...] [--repeat N] [--cards N]
+#                              [--only NAME ...] [--output PATH] [--compare PATH]
+
+BENCHMARKS = ['csv_import', 'index_build', 'dashboard_load', 'dashboard_rerun', 'keyword_filter',
+              'multiselect_filter', 'pdf_export', 'pdf_export_cached', 'pm_edit', 'pm_approve',
+              'concurrent_submit', 'concurrent_submit_grouped']
+
+# Benchmarks that build the database; they run once per size whatever is selected
+SETUP_BENCHMARKS = ['csv_import', 'index_build']
+
+DEFAULT_ROWS = [10000]
+DEFAULT_REPEAT = 3
+DEFAULT_CARDS = 50
+
+# Sessions submitting the survey at once, and submissions each
+SUBMITTERS = 8
+SUBMISSIONS_PER_SUBMITTER = 25
+
+# As v1.py's save_survey_response writes a survey submission
+INSERT_SURVEY_RESPONSE = """INSERT INTO responses (q1_problem, q2_behavior_change, q3_whose_behavior, q4_beneficiary,
+                                                  q5_current_behavior, q6_desired_behavior, q7_frictions, q7_explain,
+                                                  q8_address_problem, q9_patient_journey, q10_settings)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+
+APP_TIMEOUT = 900  # Seconds an AppTest run may take; a cold 1M-row dashboard is slow
+
+
+def summarize(runs):
+    return {'runs': [round(seconds, 6) for seconds in runs], 'min': min(runs),
+            'median': statistics.median(runs), 'max': max(runs)}
+
+
+def timed_run(at):
+    start = time.perf_counter()
+    at.run()
+    elapsed = time.perf_counter() - start
+    if at.exception:
+        raise RuntimeError(f"{at.exception[0].message}\n{at.exception[0].stack_trace}")
+    return elapsed
+
+
+def by_label(widgets, label):
+    return next(widget for widget in widgets if widget.label == label)
+
+
+def app_test(script, **session_state):
+    at = AppTest.from_file(os.path.join(APP_DIR, script), default_timeout=APP_TIMEOUT)
+    for key, value in session_state.items():
+        at.session_state[key] = value
+    return at
+
+
+def bench_csv_import(context):
+    conn = open_connection(context['db_path'])
+    start = time.perf_counter()
+    migrate(conn)
+    rows = sum(import_csv(conn, context['csv_path'], defaults={'approved': 0}).values())
+    elapsed = time.perf_counter() - start
+    conn.close()
+    return [elapsed], {'rows_per_second': rows / elapsed}
+
+
+def bench_index_build(context):
+    # Duplicate and similarity indexing of everything the import queued
+    conn = open_connection(context['db_path'])
+    start = time.perf_counter()
+    update_duplicate_index(conn)
+    update_similarity_index(conn)
+    elapsed = time.perf_counter() - start
+    conn.close()
+    return [elapsed], {}
+
+
+def bench_dashboard_load(context):
+    # Cold start of the scientist dashboard: table load, JSON parse and
+    # membership index, then the first page
+    runs = []
+    for _ in range(context['repeat']):
+        st.cache_resource.clear()
+        runs.append(timed_run(app_test('v1.py', page='scientist')))
+    return runs, {}
+
+
+def bench_dashboard_rerun(context):
+    at = app_test('v1.py', page='scientist')
+    timed_run(at)
+    return [timed_run(at) for _ in range(context['repeat'])], {}
+
+
+def bench_keyword_filter(context):
+    at = app_test('v1.py', page='scientist')
+    timed_run(at)
+    runs = []
+    for keyword in context['keywords']:
+        by_label(at.text_input, "Filter responses by keyword:").input(keyword)
+        runs.append(timed_run(at))
+    return runs, {'keywords': context['keywords']}
+
+
+def bench_multiselect_filter(context):
+    at = app_test('v1.py', page='scientist')
+    timed_run(at)
+    runs = []
+    for run in range(context['repeat']):
+        whose = OPTION_LABELS['q3_whose_behavior']
+        settings = OPTION_LABELS['q10_settings']
+        at.multiselect(key='filter_q3_whose_behavior').set_value([whose[run % len(whose)]])
+        at.multiselect(key='filter_q10_settings').set_value([settings[run % len(settings)],
+                                                              settings[(run + 1) % len(settings)]])
+        runs.append(timed_run(at))
+    return runs, {}
+
+
+def _export_cards(context):
+    conn = open_connection(context['db_path'])
+    df = pd.read_sql_query("SELECT * FROM responses ORDER BY id LIMIT ?", conn, params=[context['cards']])
+    conn.close()
+    return [card_fields(row) for _, row in decode_frame(df).iterrows()]
+
+
+def bench_pdf_export(context):
+    # Every card rendered, with an empty card cache each time
+    cards = _export_cards(context)
+    runs = []
+    for _ in range(context['repeat']):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            start = time.perf_counter()
+            write_index_cards_pdf(cards, io.BytesIO(), cache_dir=cache_dir)
+            runs.append(time.perf_counter() - start)
+    return runs, {'cards': len(cards)}
+
+
+def bench_pdf_export_cached(context):
+    cards = _export_cards(context)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        write_index_cards_pdf(cards, io.BytesIO(), cache_dir=cache_dir)
+        runs = []
+        for _ in range(context['repeat']):
+            start = time.perf_counter()
+            write_index_cards_pdf(cards, io.BytesIO(), cache_dir=cache_dir)
+            runs.append(time.perf_counter() - start)
+    return runs, {'cards': len(cards)}
+
+
+def bench_pm_edit(context):
+    # Saving a changed title on the PM dashboard of v1.py, one submission per run
+    conn = open_connection(context['db_path'])
+    submission_ids = [row[0] for row in conn.execute("SELECT id FROM responses ORDER BY id LIMIT ?",
+                                                     (context['repeat'],))]
+    conn.close()
+
+    at = app_test('v1.py', page='project_manager', logged_in=True)
+    timed_run(at)
+    runs = []
+    for run, submission_id in enumerate(submission_ids):
+        by_label(at.selectbox, "Select a submission to edit:").set_value(submission_id)
+        timed_run(at)
+        at.text_input(key=f"{submission_id}_title").input(f"BENCHMARK EDIT {run}")
+        at.button(key=f"update_{submission_id}").click()
+        runs.append(timed_run(at))
+        # The picker labels only show the new title from the next run on
+        timed_run(at)
+    return runs, {}
+
+
+def bench_pm_approve(context):
+    # Approving the first unapproved response on the PM dashboard of main.py
+    at = app_test('main.py', page='project_manager', pm_logged_in=True)
+    timed_run(at)
+    runs = []
+    for _ in range(context['repeat']):
+        response_id = by_label(at.selectbox, "Select a response to review:").value
+        at.button(key=f"approve_button_{response_id}").click()
+        runs.append(timed_run(at))
+    return runs, {}
+
+
+def _submit_concurrently(context, submit):
+    # Seconds for SUBMITTERS threads to make their submissions through submit(values)
+    conn = open_connection(context['db_path'])
+    values = conn.execute("""SELECT q1_problem, q2_behavior_change, q3_whose_behavior, q4_beneficiary,
+                                    q5_current_behavior, q6_desired_behavior, q7_frictions, q7_explain,
+                                    q8_address_problem, q9_patient_journey, q10_settings
+                             FROM responses ORDER BY id LIMIT 1""").fetchone()
+    conn.close()
+
+    def submitter():
+        for _ in range(SUBMISSIONS_PER_SUBMITTER):
+            submit(values)
+
+    threads = [threading.Thread(target=submitter) for _ in range(SUBMITTERS)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def _submit_stats(runs):
+    return {'submitters': SUBMITTERS,
+            'submissions_per_second': SUBMITTERS * SUBMISSIONS_PER_SUBMITTER / statistics.median(runs)}
+
+
+def bench_concurrent_submit(context):
+    # Survey submissions from many sessions at once, each committed durably
+    # on a pooled connection as v1.py does without group commit
+    pool = ConnectionPool(context['db_path'])
+
+    def submit(values):
+        with pool.connection(durable=True) as conn:
+            conn.execute(INSERT_SURVEY_RESPONSE, values)
+
+    runs = [_submit_concurrently(context, submit) for _ in range(context['repeat'])]
+    pool.close()
+    return runs, _submit_stats(runs)
+
+
+def bench_concurrent_submit_grouped(context):
+    # The same through the group-commit writer (SURVEY_GROUP_COMMIT=1)
+    writer = GroupCommitWriter(context['db_path'])
+    runs = [_submit_concurrently(context, lambda values: writer.submit(INSERT_SURVEY_RESPONSE, values))
+            for _ in range(context['repeat'])]
+    return runs, _submit_stats(runs)
+
+
+def sample_keywords(model, count, seed=0):
+    # Words from the middle of the vocabulary: common enough to match, not so
+    # common that every response does
+    words, probabilities = model['vocabulary']
+    candidates = [word for word in words[len(words) // 20:len(words) // 5] if word.isalpha() and len(word) > 3]
+    return list(np.random.default_rng(seed).choice(candidates, count, replace=False))
+
+
+def run_benchmarks(rows, repeat=DEFAULT_REPEAT, cards=DEFAULT_CARDS, only=None, seed=0, progress=print):
+    model = fit_survey_model()
+    selected = [name for name in BENCHMARKS if name in SETUP_BENCHMARKS or not only or name in only]
+    results = {}
+    for size in rows:
+        with tempfile.TemporaryDirectory() as work_dir:
+            context = {'db_path': os.path.join(work_dir, 'survey_responses.db'),
+                       'csv_path': os.path.join(work_dir, 'responses.csv'),
+                       'repeat': repeat, 'cards': cards, 'keywords': sample_keywords(model, repeat, seed)}
+            start = time.perf_counter()
+            write_csv(context['csv_path'], size, seed, model=model)
+            progress(f"{size} rows: generated in {time.perf_counter() - start:.1f}s")
+
+            os.environ['SURVEY_DB_PATH'] = context['db_path']
+            st.cache_resource.clear()
+            try:
+                results[size] = {}
+                for name in selected:
+                    runs, extra = globals()[f"bench_{name}"](context)
+                    results[size][name] = {**summarize(runs), **extra}
+                    progress(f"{size} rows: {name} median {results[size][name]['median']:.3f}s")
+            finally:
+                os.environ.pop('SURVEY_DB_PATH', None)
+                st.cache_resource.clear()
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=APP_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    # Lines of median timings against the baseline's, slowest change first
+    lines = []
+    for size, benchmarks in results.items():
+        for name, result in benchmarks.items():
+            before = baseline['results'].get(str(size), {}).get(name)
+            if before:
+                ratio = result['median'] / before['median'] if before['median'] else float('inf')
+                lines.append((ratio, f"{size:>8} {name:<20} {before['median']:>9.3f}s -> {result['median']:>9.3f}s"
+                                     f"  ({ratio:.2f}x)"))
+    return [line for _, line in sorted(lines, reverse=True)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the survey app over synthetic responses.")
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROWS, help="dataset sizes to run")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help="timed runs per benchmark")
+    parser.add_argument('--cards', type=int, default=DEFAULT_CARDS, help="index cards per PDF export")
+    parser.add_argument('--only', nargs='+', choices=BENCHMARKS, help="benchmarks to run besides the setup ones")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', help="earlier results to compare the medians with")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.rows, args.repeat, args.cards, args.only, args.seed)
+    report = {'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+              'commit': _git_commit(),
+              'python': platform.python_version(),
+              'platform': platform.platform(),
+              'repeat': args.repeat,
+              'seed': args.seed,
+              'results': {str(size): benchmarks for size, benchmarks in results.items()}}
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved results to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"Compared with {args.compare} ({baseline.get('commit')}, {baseline.get('created_at')}):")
+        for line in compare(results, baseline):
+            print(line)
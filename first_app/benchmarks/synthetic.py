@@ -0,0 +1,127 @@
+import argparse
+import os
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks import APP_DIR
+from connections import open_connection
+from csv_import import CSV_COLUMN_MAP, insert_chunk, prepare_chunk, read_csv_chunks
+from migrations import migrate
+from option_vocabulary import QUESTION_OPTIONS, load_answers
+
+# Synthetic survey responses in the survey vendor's CSV layout. Answers are
+# drawn from distributions fitted to the Opportunity Map export: words per
+# text answer for each question, word frequencies over all answers, how many
+# options a multi-select answer picks, how often each option is picked, and
+# how often a free-text ("other") answer is given instead.
+
+SOURCE_CSV = os.path.join(APP_DIR, 'Opportunity Map Survey Responses - Sheet1 (1).csv')
+
+CSV_HEADERS = {column: header for header, column in CSV_COLUMN_MAP.items()}
+
+# Answers taken from a fixed set of choices rather than written
+CHOICE_COLUMNS = ['q2_behavior_change']
+
+DEFAULT_CHUNK_SIZE = 20000
+
+
+def fit_survey_model(source=SOURCE_CSV):
+    responses = pd.concat(prepare_chunk(chunk) for chunk in read_csv_chunks(source))
+    model = {'text': {}, 'choices': {}, 'options': {}}
+
+    text_columns = [column for column in responses.columns
+                    if column not in QUESTION_OPTIONS and column not in CHOICE_COLUMNS]
+    words = pd.Series(re.findall(r"\S+", " ".join(responses[text_columns].to_numpy().ravel()))).value_counts()
+    model['vocabulary'] = (words.index.to_numpy(), (words / words.sum()).to_numpy())
+
+    for column in text_columns:
+        model['text'][column] = responses[column].str.split().str.len().to_numpy()
+
+    for column in CHOICE_COLUMNS:
+        counts = responses[column].value_counts()
+        model['choices'][column] = (counts.index.to_numpy(), (counts / counts.sum()).to_numpy())
+
+    for column, labels in QUESTION_OPTIONS.items():
+        answers = responses[column].map(load_answers)
+        picked = [answer for row in answers for answer in row]
+        codes = [answer for answer in picked if isinstance(answer, int)]
+        other_answers = [answer for answer in picked if not isinstance(answer, int)]
+        # Every option can be picked, however rare it was in the export
+        frequency = np.bincount(codes, minlength=len(labels) + 1)[1:] + 1
+        model['options'][column] = (np.maximum(answers.map(len).to_numpy(), 1), frequency / frequency.sum(),
+                                    len(other_answers) / max(len(picked), 1), other_answers)
+    return model
+
+
+def _text_answers(rng, size, word_counts, vocabulary):
+    words, probabilities = vocabulary
+    counts = np.maximum(rng.choice(word_counts, size) + rng.integers(-2, 3, size), 1)
+    sampled = words[rng.choice(len(words), counts.sum(), p=probabilities)]
+    ends = np.cumsum(counts)
+    return [" ".join(sampled[end - count:end]) for count, end in zip(counts, ends)]
+
+
+def _multiselect_answers(rng, size, answer_counts, frequency, other_rate, other_answers, labels):
+    counts = np.minimum(rng.choice(answer_counts, size), len(labels))
+    # Weighted sampling without replacement: the largest log(p) + Gumbel noise
+    order = np.argsort(-(np.log(frequency) + rng.gumbel(size=(size, len(labels)))), axis=1)
+    other = rng.random((size, len(labels))) < other_rate
+    answers = []
+    for row, count in enumerate(counts):
+        picked = [other_answers[rng.integers(len(other_answers))] if other[row, i] and other_answers else labels[j]
+                  for i, j in enumerate(order[row, :count])]
+        answers.append(", ".join(picked))
+    return answers
+
+
+def generate_chunks(rows, seed=0, chunk_size=DEFAULT_CHUNK_SIZE, model=None):
+    # Vendor-format DataFrames of up to chunk_size synthetic responses
+    model = model or fit_survey_model()
+    rng = np.random.default_rng(seed)
+    for start in range(0, rows, chunk_size):
+        size = min(chunk_size, rows - start)
+        chunk = {}
+        for column, header in CSV_HEADERS.items():
+            if column in model['options']:
+                chunk[header] = _multiselect_answers(rng, size, *model['options'][column], QUESTION_OPTIONS[column])
+            elif column in model['choices']:
+                values, probabilities = model['choices'][column]
+                chunk[header] = rng.choice(values, size, p=probabilities)
+            else:
+                chunk[header] = _text_answers(rng, size, model['text'][column], model['vocabulary'])
+        yield pd.DataFrame(chunk)
+
+
+def write_csv(path, rows, seed=0, model=None):
+    for number, chunk in enumerate(generate_chunks(rows, seed, model=model)):
+        chunk.to_csv(path, mode='w' if number == 0 else 'a', header=number == 0, index=False)
+    return rows
+
+
+def create_database(path, rows, seed=0, model=None):
+    # A database at the current schema version holding rows synthetic
+    # responses, inserted the way the PM dashboard imports vendor CSVs
+    conn = open_connection(path)
+    migrate(conn)
+    for chunk in generate_chunks(rows, seed, model=model):
+        insert_chunk(conn, prepare_chunk(chunk), defaults={'approved': 0})
+    conn.close()
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Write synthetic survey responses to a CSV or SQLite file.")
+    parser.add_argument('path', help="a .csv path for a vendor export, anything else for a database")
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.path.endswith('.csv'):
+        write_csv(args.path, args.rows, args.seed)
+    else:
+        create_database(args.path, args.rows, args.seed)
+    print(f"Wrote {args.rows} responses to {args.path} in {time.perf_counter() - start:.1f}s")
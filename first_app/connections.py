@@ -0,0 +1,73 @@
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from tracing import ENABLED as TRACING_ENABLED, TracedConnection
+
+# SQLite connections shared by all Streamlit sessions. The database runs in
+# WAL mode so dashboard reads never block survey submissions (and vice versa),
+# and each script thread checks out its own connection instead of sharing one
+# global cursor.
+#
+# Connections run with synchronous = NORMAL: in WAL mode a commit can't
+# corrupt the database, but the last commits before a power loss or OS crash
+# may be rolled back. That is fine for edits, approvals and the indexes,
+# which the user sees succeed or can redo. Survey submissions check out a
+# durable connection (synchronous = FULL) instead, so a respondent is only
+# thanked once their answers are on disk, as with the group-commit writer.
+
+
+def open_connection(db_path, busy_timeout=5000):
+    # Traced connections time every statement when SURVEY_TRACING=1
+    conn = sqlite3.connect(db_path, timeout=busy_timeout / 1000, check_same_thread=False,
+                           factory=TracedConnection if TRACING_ENABLED else sqlite3.Connection)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA busy_timeout = {int(busy_timeout)}")
+    return conn
+
+
+class ConnectionPool:
+    def __init__(self, db_path, size=8, busy_timeout=5000):
+        self.db_path = db_path
+        self.busy_timeout = busy_timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._local = threading.local()
+
+    @contextmanager
+    def connection(self, durable=False):
+        # Commits when the block succeeds and rolls back when it raises. Nested
+        # use in the same thread reuses the outer connection and transaction.
+        # With durable, the commit returns only once it has reached the disk;
+        # SQLite can't change that inside a transaction, so the outermost use
+        # decides.
+        current = getattr(self._local, 'conn', None)
+        if current is not None:
+            yield current
+            return
+
+        with self._slots:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = open_connection(self.db_path, self.busy_timeout)
+            if durable:
+                conn.execute("PRAGMA synchronous = FULL")
+            self._local.conn = conn
+            try:
+                with conn:
+                    yield conn
+            finally:
+                if durable:
+                    conn.execute("PRAGMA synchronous = NORMAL")
+                self._local.conn = None
+                self._idle.put(conn)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
@@ -0,0 +1,339 @@
+import hashlib
+import json
+import os
+import re
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from option_vocabulary import NORMALIZED_TEXT_COLUMNS, QUESTION_OPTIONS, load_answers, option_code
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:  # Without pyarrow, Parquet files can't be imported
+    pa = pc = pq = None
+
+try:
+    import openpyxl
+except ImportError:  # Without openpyxl, Excel files can't be imported
+    openpyxl = None
+
+# Survey vendor CSV headers and the responses columns they are loaded into
+CSV_COLUMN_MAP = {
+    'title (generated by manual input from admin)': 'title',
+    '1 what problem from your healthcare setting do you want to tackle': 'q1_problem',
+    '2 will a change in behavior address this problem': 'q2_behavior_change',
+    '3 whose behaviour should primarily be changed': 'q3_whose_behavior',
+    '4 who will the primary beneficiary of this behaviour change be': 'q4_beneficiary',
+    '5 current behaviour what are they currently doing': 'q5_current_behavior',
+    '6 desired behaviour what should they be doing that might solve the problem': 'q6_desired_behavior',
+    '7 why might they not be doing the desired behavior': 'q7_frictions',
+    'please describe your response': 'q7_explain',
+    '8 how will the behaviour change address the problem': 'q8_address_problem',
+    '9 at which stage of the patient journey map does this problem arise': 'q9_patient_journey',
+    '10 does this problem manifest itself in any of the following settings': 'q10_settings',
+}
+
+# Multi-select answers arrive as comma-separated text and are stored as JSON lists
+# of option codes
+CSV_LIST_COLUMNS = list(QUESTION_OPTIONS)
+
+RESPONSE_FIELDS = list(CSV_COLUMN_MAP.values())
+
+DEFAULT_CHUNK_SIZE = 20000
+
+# Imported responses are identified by a hash of their normalized answers, kept
+# in a UNIQUE column, so importing the same export twice adds nothing. The
+# title is left out: the admin sets it and may correct it in a later export.
+CONTENT_HASH_COLUMNS = [column for column in RESPONSE_FIELDS if column != 'title']
+
+# Extra headers to accept, as a JSON object of header -> responses column,
+# e.g. for another vendor's export. Headers are matched after normalization
+# (case, punctuation and spacing are ignored), and the responses column names
+# themselves are always accepted, so the dashboard's data exports import too.
+IMPORT_MAPPING_PATH = os.environ.get('SURVEY_IMPORT_MAPPING')
+
+# Upload extensions -> file format, for the formats whose reader is installed
+IMPORT_FORMATS = {'csv': 'csv'}
+if pq is not None:
+    IMPORT_FORMATS['parquet'] = 'parquet'
+if openpyxl is not None:
+    IMPORT_FORMATS['xlsx'] = 'xlsx'
+
+
+def normalize_header(header):
+    return " ".join(re.sub(r'[^0-9a-z]+', ' ', str(header).lower()).split())
+
+
+def import_mapping(path=IMPORT_MAPPING_PATH):
+    # Normalized header -> responses column
+    mapping = {normalize_header(header): column for header, column in CSV_COLUMN_MAP.items()}
+    mapping.update({normalize_header(column): column for column in RESPONSE_FIELDS})
+    if path:
+        with open(path) as f:
+            for header, column in json.load(f).items():
+                if column not in RESPONSE_FIELDS:
+                    raise ValueError(f"Import mapping {path} maps {header!r} to unknown column {column!r}")
+                mapping[normalize_header(header)] = column
+    return mapping
+
+
+def import_format(file_name):
+    extension = os.path.splitext(file_name)[1].lstrip('.').lower()
+    if extension not in IMPORT_FORMATS:
+        raise ValueError(f"Can't import .{extension} files; expected one of {', '.join(IMPORT_FORMATS)}")
+    return IMPORT_FORMATS[extension]
+
+
+def _rewind(source):
+    if hasattr(source, 'seek'):
+        source.seek(0)
+
+
+def read_headers(source, file_format):
+    # Column headers of the file, without reading its rows
+    _rewind(source)
+    try:
+        if file_format == 'csv':
+            # Columns with an empty header are unnamed and can't be mapped
+            return [header for header in pd.read_csv(source, nrows=0).columns if not header.startswith('Unnamed: ')]
+        if file_format == 'parquet':
+            return pq.ParquetFile(source).schema_arrow.names
+        workbook = openpyxl.load_workbook(source, read_only=True, data_only=True)
+        try:
+            header_row = next(workbook.active.iter_rows(max_row=1, values_only=True), ())
+        finally:
+            workbook.close()
+        return [header for header in header_row if header is not None]
+    finally:
+        _rewind(source)
+
+
+def match_headers(headers, mapping=None):
+    # Returns ({header: responses column}, responses columns without a header,
+    # headers without a column). Where several headers map to one column the
+    # first wins and the others count as unmatched.
+    mapping = mapping or import_mapping()
+    columns = {}
+    unmatched = []
+    for header in headers:
+        column = mapping.get(normalize_header(header))
+        if column is None or column in columns.values():
+            unmatched.append(header)
+        else:
+            columns[header] = column
+    missing = [column for column in RESPONSE_FIELDS if column not in columns.values()]
+    return columns, missing, unmatched
+
+
+def read_csv_chunks(source, chunksize=DEFAULT_CHUNK_SIZE, columns=None):
+    # Only the mapped columns are parsed, everything as text, so memory is
+    # bounded by the chunk size rather than the file size
+    columns = columns or CSV_COLUMN_MAP
+    for chunk in pd.read_csv(source, chunksize=chunksize, dtype=str, keep_default_na=False,
+                             usecols=lambda header: header in columns):
+        yield chunk.rename(columns=columns)
+
+
+def _read_parquet_chunks(source, chunksize, columns):
+    # Record batches of the mapped columns only. List columns (e.g. the
+    # dashboard's exports) are kept as lists, anything else is cast to text.
+    parquet_file = pq.ParquetFile(source)
+    for batch in parquet_file.iter_batches(batch_size=chunksize, columns=list(columns)):
+        chunk = {}
+        for header, values in zip(batch.schema.names, batch.columns):
+            if pa.types.is_list(values.type) or pa.types.is_large_list(values.type):
+                chunk[columns[header]] = values.to_pandas()
+            else:
+                chunk[columns[header]] = pc.fill_null(values.cast(pa.string()), '').to_pandas()
+        yield pd.DataFrame(chunk)
+
+
+def _read_xlsx_chunks(source, chunksize, columns):
+    # The first sheet, streamed row by row in read-only mode
+    workbook = openpyxl.load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header_row = next(rows, ())
+        positions = {columns[header]: i for i, header in enumerate(header_row)
+                     if header is not None and header in columns}
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == chunksize:
+                yield _xlsx_frame(batch, positions)
+                batch = []
+        if batch:
+            yield _xlsx_frame(batch, positions)
+    finally:
+        workbook.close()
+
+
+def _xlsx_frame(rows, positions):
+    return pd.DataFrame({column: pd.Series([row[i] if i < len(row) else None for row in rows], dtype=object)
+                         .fillna('').astype(str) for column, i in positions.items()})
+
+
+def read_chunks(source, file_format, columns, chunksize=DEFAULT_CHUNK_SIZE):
+    # DataFrames of up to chunksize rows, with the matched headers renamed to
+    # responses columns
+    _rewind(source)
+    if file_format == 'csv':
+        return read_csv_chunks(source, chunksize, columns)
+    if file_format == 'parquet':
+        return _read_parquet_chunks(source, chunksize, columns)
+    return _read_xlsx_chunks(source, chunksize, columns)
+
+
+def encode_answer_column(column, values):
+    # A whole column of multi-select cells to stored JSON lists of codes, as
+    # dump_answers would write them. Cells are comma-separated text, lists, or
+    # JSON arrays of labels; each distinct answer is only looked up once, and
+    # labels split on their own commas are repaired.
+    lists = values.str.split(',')
+    lists = lists.where(lists.notna(), values)  # Cells that already are lists
+    json_cells = values.str.startswith('[', na=False)
+    if json_cells.any():
+        lists[json_cells] = values[json_cells].map(load_answers)
+
+    answers = lists.reset_index(drop=True).explode()
+    answers = answers[answers.notna()].astype(str).str.strip().str.upper()
+    answers = answers[answers != '']
+    tokens = {}
+    for answer in answers.unique():
+        code = option_code(column, answer, repair=True)
+        tokens[answer] = str(code) if code is not None else json.dumps(answer)
+
+    # Answers stay in row order through explode, so each row's tokens are a
+    # contiguous run
+    encoded = pd.DataFrame({'row': answers.index, 'token': answers.map(tokens).to_numpy(dtype=object)})
+    encoded = encoded.drop_duplicates()
+    rows = encoded['row'].to_numpy()
+    tokens = encoded['token'].tolist()
+    bounds = np.append(np.flatnonzero(np.diff(rows, prepend=-1)), len(rows))
+    cells = np.full(len(values), '[]', dtype=object)
+    cells[rows[bounds[:-1]]] = ['[' + ','.join(tokens[start:end]) + ']' for start, end in zip(bounds[:-1], bounds[1:])]
+    return pd.Series(cells, index=values.index)
+
+
+def prepare_chunk(chunk):
+    # Map a chunk of rows onto normalized responses columns, one column at a time
+    chunk = chunk.rename(columns=CSV_COLUMN_MAP).reindex(columns=RESPONSE_FIELDS, fill_value='')
+    for col in CSV_LIST_COLUMNS:
+        chunk[col] = encode_answer_column(col, chunk[col])
+    for col in NORMALIZED_TEXT_COLUMNS:
+        chunk[col] = chunk[col].str.strip().str.upper()
+    return chunk
+
+
+# Answers accepted for the yes/no question once normalized
+BEHAVIOR_CHANGE_ANSWERS = ('', 'YES', 'NO')
+
+
+def validate_chunk(chunk):
+    # Split a prepared chunk into the rows to insert and a count of rejected
+    # rows per reason
+    blank = ((chunk[NORMALIZED_TEXT_COLUMNS] == '').all(axis=1) & (chunk[CSV_LIST_COLUMNS] == '[]').all(axis=1))
+    bad_behavior_change = ~blank & ~chunk['q2_behavior_change'].isin(BEHAVIOR_CHANGE_ANSWERS)
+    rejected = {'blank row': int(blank.sum()), 'unknown behavior change answer': int(bad_behavior_change.sum())}
+    return chunk[~(blank | bad_behavior_change)], {reason: count for reason, count in rejected.items() if count}
+
+
+def content_hash(values):
+    # 128 bits of SHA-256 over the values of CONTENT_HASH_COLUMNS, as stored
+    text = '\x1f'.join('' if value is None else str(value) for value in values)
+    return hashlib.sha256(text.encode('utf-8')).digest()[:16]
+
+
+def add_content_hashes(chunk):
+    columns = [chunk[col].tolist() for col in CONTENT_HASH_COLUMNS]
+    chunk['content_hash'] = [content_hash(values) for values in zip(*columns)]
+    return chunk
+
+
+def hash_responses_batch(conn, after_id, batch_size):
+    # Backfill for the migration runner: hash the next batch of responses
+    # after after_id, without committing. Batches go in id order, so of
+    # responses with the same answers only the one with the lowest id gets the
+    # hash. Returns the last id, or None when done.
+    rows = conn.execute(f"""SELECT id, {', '.join(CONTENT_HASH_COLUMNS)} FROM responses
+                            WHERE id > ? ORDER BY id LIMIT ?""", (after_id, batch_size)).fetchall()
+    if not rows:
+        return None
+    conn.executemany("UPDATE OR IGNORE responses SET content_hash = ? WHERE id = ?",
+                     [(content_hash(row[1:]), row[0]) for row in rows])
+    return rows[-1][0]
+
+
+def insert_rows(conn, chunk, defaults=None, update_titles=False):
+    # Insert a chunk without committing. Rows whose answers are already in
+    # responses are skipped, or with update_titles get the chunk's title if it
+    # has one. Returns a Counter of inserted, updated and skipped rows.
+    #
+    # Rows go into a temporary staging table first and reach responses in one
+    # INSERT ... SELECT: row by row, every insert would be its own statement,
+    # and FTS5 flushes its pending terms into a new segment whenever a
+    # statement that triggers it starts.
+    defaults = defaults or {}
+    for col, value in defaults.items():
+        chunk[col] = value
+    if 'content_hash' not in chunk.columns:
+        add_content_hashes(chunk)
+    columns = ', '.join(chunk.columns)
+    conn.execute("DROP TABLE IF EXISTS temp.responses_staging")
+    conn.execute(f"CREATE TEMP TABLE responses_staging ({columns})")
+    # Rows from lists of column values; iterating the frame's string columns row by row is much slower
+    conn.executemany(f"INSERT INTO temp.responses_staging VALUES ({', '.join('?' * len(chunk.columns))})",
+                     zip(*(chunk[col].tolist() for col in chunk.columns)))
+
+    updated = 0
+    if update_titles:
+        # A separate UPDATE rather than an upsert, whose conflict clause would
+        # override the OR IGNORE of the index queue triggers
+        updated = conn.execute("""UPDATE responses SET title = staged.title
+                                  FROM temp.responses_staging AS staged
+                                  WHERE responses.content_hash = staged.content_hash
+                                  AND staged.title != '' AND responses.title IS NOT staged.title
+                                  AND staged.rowid IN (SELECT MIN(rowid) FROM temp.responses_staging
+                                                       GROUP BY content_hash)""").rowcount
+    # Repeats within the chunk count as skipped, like rows already present
+    inserted = conn.execute(f"""INSERT INTO responses ({columns})
+                                SELECT {columns} FROM temp.responses_staging
+                                WHERE rowid IN (SELECT MIN(rowid) FROM temp.responses_staging GROUP BY content_hash)
+                                ORDER BY rowid
+                                ON CONFLICT (content_hash) DO NOTHING""").rowcount
+    conn.execute("DROP TABLE temp.responses_staging")
+    return Counter(inserted=inserted, updated=updated, skipped=len(chunk) - inserted - updated)
+
+
+def insert_chunk(conn, chunk, defaults=None, update_titles=False):
+    # One transaction per chunk
+    with conn:
+        return insert_rows(conn, chunk, defaults, update_titles)
+
+
+def import_file(conn, source, file_format, defaults=None, chunksize=DEFAULT_CHUNK_SIZE, progress=None,
+                mapping=None, update_titles=False):
+    # Stream a CSV, Parquet or Excel file into responses. Headers are matched
+    # before any row is read; a file without any known header is rejected.
+    # defaults sets extra columns on every row (e.g. approved=0) and
+    # progress(rows_so_far) is called per chunk. Returns a Counter of
+    # inserted, updated and skipped rows.
+    columns, _, _ = match_headers(read_headers(source, file_format), mapping)
+    if not columns:
+        raise ValueError("None of the file's headers match a responses column")
+    counts = Counter(inserted=0, updated=0, skipped=0)
+    rows_processed = 0
+    for chunk in read_chunks(source, file_format, columns, chunksize):
+        counts.update(insert_chunk(conn, prepare_chunk(chunk), defaults, update_titles))
+        rows_processed += len(chunk)
+        if progress:
+            progress(rows_processed)
+    return counts
+
+
+def import_csv(conn, source, defaults=None, chunksize=DEFAULT_CHUNK_SIZE, progress=None, update_titles=False):
+    return import_file(conn, source, 'csv', defaults, chunksize, progress, update_titles=update_titles)
@@ -0,0 +1,115 @@
+import csv
+import io
+import json
+import tempfile
+
+from csv_import import RESPONSE_FIELDS
+from option_vocabulary import QUESTION_OPTIONS, decode_answers, option_label_sql
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Without pyarrow, filtered responses can only be exported as CSV
+    pa = pq = None
+
+# Filtered responses exported as data. Every format is written a batch of
+# rows at a time into a temporary file, so only the finished file, not the
+# rows it was built from, is held in memory. Multi-select answers are
+# exported as lists of labels: list<string> columns in Parquet and Arrow, JSON
+# arrays in CSV.
+
+EXPORT_COLUMNS = ['id', *RESPONSE_FIELDS]
+
+# Format -> (file extension, MIME type)
+EXPORT_FORMATS = {'CSV': ('csv', 'text/csv')}
+if pa is not None:
+    EXPORT_FORMATS['Parquet'] = ('parquet', 'application/vnd.apache.parquet')
+    EXPORT_FORMATS['Arrow'] = ('arrow', 'application/vnd.apache.arrow.file')
+
+EXPORT_BATCH_SIZE = 10000
+
+
+def export_schema():
+    fields = [pa.field('id', pa.int64())]
+    fields += [pa.field(column, pa.list_(pa.string()) if column in QUESTION_OPTIONS else pa.string())
+               for column in RESPONSE_FIELDS]
+    return pa.schema(fields)
+
+
+def _record_batches(ids, rows, schema):
+    # Record batches of the responses with the given ids. rows(ids) returns
+    # their frame as the dashboard reads it, with multi-select cells parsed
+    # into lists of codes. Text columns are handed to Arrow as they are; only
+    # the answers of each batch are decoded.
+    for start in range(0, len(ids), EXPORT_BATCH_SIZE):
+        batch = rows(ids[start:start + EXPORT_BATCH_SIZE])
+        arrays = []
+        for field in schema:
+            if field.name in QUESTION_OPTIONS:
+                arrays.append(pa.array([decode_answers(field.name, answers) for answers in batch[field.name]],
+                                       type=field.type))
+            else:
+                arrays.append(pa.array(batch[field.name], type=field.type, from_pandas=True))
+        yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def write_parquet(ids, rows, target):
+    schema = export_schema()
+    with pq.ParquetWriter(target, schema) as writer:
+        for batch in _record_batches(ids, rows, schema):
+            writer.write_batch(batch)
+
+
+def write_arrow(ids, rows, target):
+    # Arrow IPC file format (Feather v2)
+    schema = export_schema()
+    with pa.ipc.new_file(target, schema) as writer:
+        for batch in _record_batches(ids, rows, schema):
+            writer.write_batch(batch)
+
+
+def _csv_column(column):
+    # Multi-select answers are turned into JSON arrays of labels by SQLite,
+    # the same lookup the full-text triggers use
+    if column not in QUESTION_OPTIONS:
+        return f"responses.{column}"
+    return f"""CASE WHEN json_valid(responses.{column})
+                    THEN (SELECT json_group_array({option_label_sql(column)}) FROM json_each(responses.{column}))
+                    WHEN COALESCE(responses.{column}, '') = '' THEN '[]'
+                    ELSE json_array(responses.{column}) END"""
+
+
+def write_csv(conn, ids, target):
+    # Rows of the responses with the given ids, in that order, read from the
+    # database a batch at a time. target is a binary file.
+    text = io.TextIOWrapper(target, encoding='utf-8', newline='')
+    writer = csv.writer(text)
+    writer.writerow(EXPORT_COLUMNS)
+    # CROSS JOIN keeps json_each as the outer loop, so rows come out in the
+    # order of ids without sorting the wide rows
+    query = f"""SELECT {', '.join(_csv_column(column) for column in EXPORT_COLUMNS)}
+                FROM json_each(?) AS wanted CROSS JOIN responses ON responses.id = wanted.value"""
+    ids = [int(response_id) for response_id in ids]
+    for start in range(0, len(ids), EXPORT_BATCH_SIZE):
+        cursor = conn.execute(query, (json.dumps(ids[start:start + EXPORT_BATCH_SIZE]),))
+        while rows := cursor.fetchmany(1000):
+            writer.writerows(rows)
+    text.flush()
+    text.detach()  # Leave target open for the caller
+
+
+def export_file(export_format, ids, rows, conn=None):
+    # The filtered responses with the given ids in export_format, as bytes
+    # for st.download_button, which doesn't take temporary files. The rows
+    # are still written a batch at a time. CSV is read from conn.
+    with tempfile.TemporaryFile() as target:
+        if export_format == 'CSV':
+            write_csv(conn, ids, target)
+        elif export_format == 'Parquet':
+            write_parquet(ids, rows, target)
+        elif export_format == 'Arrow':
+            write_arrow(ids, rows, target)
+        else:
+            raise ValueError(f"Unknown export format: {export_format}")
+        target.seek(0)
+        return target.read()
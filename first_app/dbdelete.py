@@ -1,5 +1,14 @@
 import sqlite3
 
+from migrations import migrate
+
+# Tables derived from responses; dropped with it so they don't keep stale rows.
+# The app recreates and backfills them on its next start.
+DERIVED_TABLES = ['response_options', 'responses_fts', 'response_stats', 'response_option_counts',
+                  'responses_version', 'option_labels', 'response_minhash', 'response_lsh',
+                  'duplicate_flags', 'duplicate_queue', 'response_terms', 'similarity_queue',
+                  'import_checkpoints', 'schema_migrations']
+
 # Connect to the SQLite database
 conn = sqlite3.connect('survey_responses.db')
 cursor = conn.cursor()
@@ -7,26 +16,15 @@ cursor = conn.cursor()
 try:
     # Drop the responses table if it exists
     cursor.execute("DROP TABLE IF EXISTS responses")
-    
-    # Recreate the responses table
-    cursor.execute('''CREATE TABLE responses
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  title TEXT, 
-                  q1_problem TEXT,
-                  q2_behavior_change TEXT,
-                  q3_whose_behavior TEXT,
-                  q4_beneficiary TEXT,
-                  q5_current_behavior TEXT,
-                  q6_desired_behavior TEXT,
-                  q7_frictions TEXT,
-                  q7_explain TEXT,
-                  q8_address_problem TEXT,
-                  q9_patient_journey TEXT,
-                  q10_settings TEXT)''')
-    
+    for table in DERIVED_TABLES:
+        cursor.execute(f"DROP TABLE IF EXISTS {table}")
+
     # Commit the changes
     conn.commit()
-    
+
+    # Recreate the responses table at the current schema version
+    migrate(conn)
+
     print("The responses table has been dropped and recreated.")
 
 except sqlite3.Error as e:
@@ -34,4 +32,4 @@ except sqlite3.Error as e:
 
 finally:
     # Close the connection
-    conn.close()
\ No newline at end of file
+    conn.close()
@@ -0,0 +1,81 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from index_cards import CARD_CACHE_DIR, card_key, write_index_cards_pdf
+
+# Index-card exports run in a small worker pool outside the Streamlit script
+# thread. Finished PDFs are kept in an artifact directory under a name derived
+# from the selected cards, so asking for the same selection again is served
+# from the existing file.
+
+ARTIFACT_DIR = os.environ.get('EXPORT_ARTIFACT_DIR', os.path.join(tempfile.gettempdir(), 'index_card_exports'))
+
+# Finished exports older than this are removed when new jobs are submitted
+ARTIFACT_TTL = 24 * 60 * 60
+
+
+class ExportJobManager:
+    def __init__(self, artifact_dir=ARTIFACT_DIR, cache_dir=CARD_CACHE_DIR, max_workers=2):
+        self.artifact_dir = artifact_dir
+        self.cache_dir = cache_dir
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="index-card-export")
+        self._jobs = {}
+        self._lock = threading.Lock()
+        os.makedirs(artifact_dir, exist_ok=True)
+
+    def submit(self, cards):
+        # cards is a list of card field dicts; returns the job id
+        job_id = hashlib.sha256("".join(card_key(fields) for fields in cards).encode('utf-8')).hexdigest()
+        path = os.path.join(self.artifact_dir, f"{job_id}.pdf")
+
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job and job['status'] in ('queued', 'running'):
+                return job_id
+            if os.path.exists(path):
+                os.utime(path)  # Keep reused exports from expiring
+                self._jobs[job_id] = {'status': 'done', 'done': len(cards), 'total': len(cards),
+                                      'path': path, 'error': None}
+                return job_id
+            self._jobs[job_id] = {'status': 'queued', 'done': 0, 'total': len(cards),
+                                  'path': path, 'error': None}
+
+        self._prune_artifacts()
+        self._executor.submit(self._run, job_id, cards, path)
+        return job_id
+
+    def status(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def _update(self, job_id, **changes):
+        with self._lock:
+            self._jobs[job_id].update(changes)
+
+    def _run(self, job_id, cards, path):
+        self._update(job_id, status='running')
+
+        def report_progress(done, total):
+            self._update(job_id, done=done, total=total)
+
+        try:
+            write_index_cards_pdf(cards, path, self.cache_dir, progress=report_progress)
+        except Exception as e:
+            self._update(job_id, status='failed', error=str(e))
+        else:
+            self._update(job_id, status='done', done=len(cards))
+
+    def _prune_artifacts(self):
+        cutoff = time.time() - ARTIFACT_TTL
+        for name in os.listdir(self.artifact_dir):
+            path = os.path.join(self.artifact_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass  # Already removed by another process
@@ -0,0 +1,122 @@
+import re
+import sqlite3
+
+import pandas as pd
+
+from answer_options import MULTISELECT_COLUMNS
+from option_vocabulary import option_label_sql
+
+# Free-text fields of a response that take part in keyword search. The
+# multi-select answers are indexed as their option labels joined by spaces, with
+# option codes looked up in option_labels.
+TEXT_COLUMNS = ['title', 'q1_problem', 'q5_current_behavior', 'q6_desired_behavior', 'q7_explain', 'q8_address_problem']
+FTS_COLUMNS = TEXT_COLUMNS + MULTISELECT_COLUMNS
+
+
+def _labels_sql(source, col):
+    return f"""CASE WHEN json_valid({source}.{col})
+                    THEN (SELECT group_concat({option_label_sql(col)}, ' ') FROM json_each({source}.{col}))
+                    ELSE {source}.{col} END"""
+
+
+def _row_values_sql(source):
+    values = [f"{source}.{col}" for col in TEXT_COLUMNS]
+    values += [_labels_sql(source, col) for col in MULTISELECT_COLUMNS]
+    return ", ".join(values)
+
+
+def create_fulltext_index(conn):
+    # Returns False when this SQLite build has no FTS5, so callers can fall
+    # back to scanning the DataFrame.
+    c = conn.cursor()
+    c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'responses_fts'")
+    exists = c.fetchone() is not None
+
+    try:
+        c.execute(f"""CREATE VIRTUAL TABLE IF NOT EXISTS responses_fts USING fts5(
+                          {', '.join(FTS_COLUMNS)},
+                          tokenize = 'unicode61 remove_diacritics 2',
+                          prefix = '2 3')""")
+    except sqlite3.OperationalError:
+        return False
+
+    columns = ", ".join(FTS_COLUMNS)
+    c.executescript(f"""
+        DROP TRIGGER IF EXISTS responses_fts_insert;
+        CREATE TRIGGER responses_fts_insert AFTER INSERT ON responses
+        BEGIN
+            INSERT INTO responses_fts (rowid, {columns}) SELECT NEW.id, {_row_values_sql('NEW')};
+        END;
+
+        DROP TRIGGER IF EXISTS responses_fts_update;
+        CREATE TRIGGER responses_fts_update AFTER UPDATE OF {columns} ON responses
+        BEGIN
+            DELETE FROM responses_fts WHERE rowid = OLD.id;
+            INSERT INTO responses_fts (rowid, {columns}) SELECT NEW.id, {_row_values_sql('NEW')};
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS responses_fts_delete AFTER DELETE ON responses
+        BEGIN
+            DELETE FROM responses_fts WHERE rowid = OLD.id;
+        END;
+    """)
+
+    if not exists:
+        rebuild_fulltext_index(conn)
+    conn.commit()
+    return True
+
+
+def rebuild_fulltext_index(conn):
+    c = conn.cursor()
+    c.execute("DELETE FROM responses_fts")
+    c.execute(f"""INSERT INTO responses_fts (rowid, {', '.join(FTS_COLUMNS)})
+                  SELECT responses.id, {_row_values_sql('responses')} FROM responses""")
+    conn.commit()
+
+
+def match_expression(keyword):
+    # Turn free user input into an FTS5 query: every word must match, each
+    # as a prefix, and quoting keeps FTS5 operators in the input harmless.
+    words = re.findall(r'\w+', keyword or '')
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def search_response_ids(conn, keyword, limit=None):
+    # Matching response ids, best bm25 rank first
+    expression = match_expression(keyword)
+    if not expression:
+        return []
+    query = "SELECT rowid FROM responses_fts WHERE responses_fts MATCH ? ORDER BY rank"
+    params = [expression]
+    if limit:
+        query += " LIMIT ?"
+        params.append(limit)
+    return [row[0] for row in conn.execute(query, params)]
+
+
+def search_submissions(conn, text, limit=20, use_fts=True):
+    # Top matches on title and problem for the submission picker, as a frame of
+    # id, title and q1_problem. A number also matches that submission id.
+    frames = []
+    if text.strip().isdigit():
+        frames.append(pd.read_sql_query("SELECT id, title, q1_problem FROM responses WHERE id = ?",
+                                        conn, params=[int(text)]))
+
+    expression = match_expression(text)
+    if expression and use_fts:
+        frames.append(pd.read_sql_query("""
+            SELECT responses.id, responses.title, responses.q1_problem
+            FROM responses_fts JOIN responses ON responses.id = responses_fts.rowid
+            WHERE responses_fts MATCH ? ORDER BY responses_fts.rank LIMIT ?""",
+            conn, params=[f"{{title q1_problem}} : ({expression})", limit]))
+    elif expression:
+        pattern = f"%{text.strip()}%"
+        frames.append(pd.read_sql_query("""
+            SELECT id, title, q1_problem FROM responses
+            WHERE title LIKE ? OR q1_problem LIKE ? ORDER BY id LIMIT ?""",
+            conn, params=[pattern, pattern, limit]))
+
+    if not frames:
+        return pd.DataFrame(columns=['id', 'title', 'q1_problem'])
+    return pd.concat(frames, ignore_index=True).drop_duplicates('id').head(limit)
@@ -0,0 +1,265 @@
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import re
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak
+
+from option_vocabulary import QUESTION_OPTIONS, decode_answers
+
+try:
+    from pypdf import PdfReader, PdfWriter
+except ImportError:  # Without pypdf, cards are rendered into a single document
+    PdfReader = PdfWriter = None
+
+# Index cards are rendered one response at a time and cached on disk as small
+# PDFs keyed by a hash of the fields they show, so an export only renders the
+# cards that changed and stitches the rest together page by page.
+
+CARD_FIELDS = ['title', 'q1_problem', 'q2_behavior_change', 'q4_beneficiary', 'q5_current_behavior',
+               'q6_desired_behavior', 'q7_frictions', 'q8_address_problem', 'q9_patient_journey', 'q10_settings']
+
+# Bump when the card layout changes so stale cached cards are not reused
+CARD_LAYOUT_VERSION = 1
+
+CARD_CACHE_DIR = os.environ.get('INDEX_CARD_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'index_card_cache'))
+
+# Cached cards that no export used for this long are removed, checked at most
+# once per CARD_CACHE_PRUNE_INTERVAL
+CARD_CACHE_TTL = 7 * 24 * 60 * 60
+CARD_CACHE_PRUNE_INTERVAL = 60 * 60
+
+# Rendering in worker processes only pays off beyond a handful of cards
+PARALLEL_THRESHOLD = 8
+
+_styles = None
+_last_prune = {}  # Cache directory -> when it was last pruned
+
+
+def get_styles():
+    global _styles
+    if _styles is None:
+        styles = getSampleStyleSheet()
+        styles.add(ParagraphStyle(name='SectionTitle',
+                                  fontSize=18,
+                                  textColor=colors.Color(1,0.71,0,1),  # FFB600 in RGB
+                                  spaceAfter=10))
+        styles.add(ParagraphStyle(name='Entry',
+                                  fontSize=12,
+                                  spaceAfter=5))
+        _styles = styles
+    return _styles
+
+
+def strip_question_number(header):
+    return re.sub(r'^\[?\d+\]?\s*', '', header)
+
+
+def as_list(value):
+    # Multi-select answers may still be JSON text rather than parsed lists
+    if isinstance(value, list):
+        return value
+    try:
+        value = json.loads(value)
+    except (TypeError, json.JSONDecodeError):
+        pass
+    return value if isinstance(value, list) else [str(value)]
+
+
+def card_elements(row):
+    styles = get_styles()
+    elements = []
+
+    # Title Section
+    if row['title']:
+        elements.append(Paragraph(f"<b>Title</b>", styles['SectionTitle']))
+        elements.append(Paragraph(f"{row['title']}", styles['Entry']))
+        elements.append(Spacer(1, 20))
+
+    # Problem Statement Section
+    problem_statements = []
+    if row['q1_problem']:
+        problem_statements.append(f"<b>{strip_question_number('q1_problem')}:</b> {row['q1_problem']}")
+    if row['q9_patient_journey']:
+        journey = ', '.join(as_list(row['q9_patient_journey']))
+        problem_statements.append(f"<b>{strip_question_number('q9_patient_journey')}:</b> {journey}")
+    if row['q10_settings']:
+        settings = ', '.join(as_list(row['q10_settings']))
+        problem_statements.append(f"<b>{strip_question_number('q10_settings')}:</b> {settings}")
+
+    if problem_statements:
+        elements.append(Paragraph("<b>Problem Statement</b>", styles['SectionTitle']))
+        for statement in problem_statements:
+            elements.append(Paragraph(statement, styles['Entry']))
+        elements.append(Spacer(1, 20))
+
+    # The Behaviour Change Section
+    behaviour_changes = []
+    if row['q2_behavior_change']:
+        behaviour_changes.append(f"<b>{strip_question_number('q2_behavior_change')}:</b> {row['q2_behavior_change']}")
+    if row['q5_current_behavior']:
+        behaviour_changes.append(f"<b>{strip_question_number('q5_current_behavior').replace('CURRENT BEHAVIOUR', '')}:</b> {row['q5_current_behavior']}")
+    if row['q6_desired_behavior']:
+        behaviour_changes.append(f"<b>{strip_question_number('q6_desired_behavior').replace('DESIRED BEHAVIOUR', '')}:</b> {row['q6_desired_behavior']}")
+
+    if behaviour_changes:
+        elements.append(Paragraph("<b>The Behaviour Change</b>", styles['SectionTitle']))
+        for change in behaviour_changes:
+            elements.append(Paragraph(change, styles['Entry']))
+        elements.append(Spacer(1, 20))
+
+    # Barriers to Change Section
+    if row['q7_frictions']:
+        elements.append(Paragraph("<b>Barriers to Change</b>", styles['SectionTitle']))
+        frictions = ', '.join(as_list(row['q7_frictions']))
+        elements.append(Paragraph(f"<b>{strip_question_number('q7_frictions')}:</b> {frictions}", styles['Entry']))
+        elements.append(Spacer(1, 20))
+
+    # The Desired Outcome Section
+    desired_outcomes = []
+    if row['q8_address_problem']:
+        desired_outcomes.append(f"<b>{strip_question_number('q8_address_problem')}:</b> {row['q8_address_problem']}")
+    if row['q4_beneficiary']:
+        beneficiary = ', '.join(as_list(row['q4_beneficiary']))
+        desired_outcomes.append(f"<b>{strip_question_number('q4_beneficiary')}:</b> {beneficiary}")
+
+    if desired_outcomes:
+        elements.append(Paragraph("<b>The Desired Outcome</b>", styles['SectionTitle']))
+        for outcome in desired_outcomes:
+            elements.append(Paragraph(outcome, styles['Entry']))
+
+    return elements
+
+
+def render_pdf(rows):
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    elements = []
+    for row in rows:
+        elements.extend(card_elements(row))
+        elements.append(PageBreak())
+    doc.build(elements)
+    return buffer.getvalue()
+
+
+def render_card(fields):
+    return render_pdf([fields])
+
+
+def card_fields(row):
+    fields = {}
+    for field in CARD_FIELDS:
+        value = row[field]
+        if isinstance(value, float) and value != value:
+            value = None  # NaN -> None
+        elif field in QUESTION_OPTIONS and value:
+            value = decode_answers(field, as_list(value))  # Option codes -> labels
+        fields[field] = value
+    return fields
+
+
+def card_key(fields):
+    payload = json.dumps([CARD_LAYOUT_VERSION, fields], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+@contextmanager
+def _atomic_file(path):
+    # Readers only ever see complete files, even with concurrent exports
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def render_cards(cards, cache_dir=CARD_CACHE_DIR, progress=None):
+    # cards is a list of card field dicts; returns their cached PDF paths in
+    # the same order, rendering the missing ones (in parallel if many).
+    # progress(done, total) is called as cards become available.
+    os.makedirs(cache_dir, exist_ok=True)
+    now = time.time()
+    if now - _last_prune.get(cache_dir, 0) >= CARD_CACHE_PRUNE_INTERVAL:
+        _last_prune[cache_dir] = now
+        prune_card_cache(cache_dir)
+    paths = [os.path.join(cache_dir, f"{card_key(fields)}.pdf") for fields in cards]
+
+    missing = {}
+    for path, fields in zip(paths, cards):
+        try:
+            os.utime(path)  # Keep cards in use from expiring
+        except FileNotFoundError:
+            missing[path] = fields
+    done = len(cards) - len(missing)
+    if progress:
+        progress(done, len(cards))
+
+    if len(missing) >= PARALLEL_THRESHOLD:
+        # Spawned rather than forked: exports run from threads of the Streamlit server
+        with ProcessPoolExecutor(mp_context=multiprocessing.get_context('spawn')) as executor:
+            rendered = executor.map(render_card, missing.values(), chunksize=4)
+            for path, pdf in zip(missing, rendered):
+                with _atomic_file(path) as f:
+                    f.write(pdf)
+                done += 1
+                if progress:
+                    progress(done, len(cards))
+    else:
+        for path, fields in missing.items():
+            with _atomic_file(path) as f:
+                f.write(render_card(fields))
+            done += 1
+            if progress:
+                progress(done, len(cards))
+    return paths
+
+
+def prune_card_cache(cache_dir=CARD_CACHE_DIR, ttl=CARD_CACHE_TTL):
+    # Remove cards (and leftover partial writes) not used for ttl seconds
+    cutoff = time.time() - ttl
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass  # Already removed by another export
+
+
+def write_index_cards_pdf(cards, output, cache_dir=CARD_CACHE_DIR, progress=None):
+    # Write the merged index cards for a list of card field dicts to output,
+    # a path or binary file object
+    if isinstance(output, str):
+        with _atomic_file(output) as f:
+            write_index_cards_pdf(cards, f, cache_dir, progress)
+        return
+
+    if PdfWriter is None:
+        output.write(render_pdf(cards))
+        if progress:
+            progress(len(cards), len(cards))
+        return
+
+    writer = PdfWriter()
+    for path in render_cards(cards, cache_dir, progress):
+        writer.append(PdfReader(path))
+    writer.write(output)
+
+
+def create_index_cards_pdf(df, cache_dir=CARD_CACHE_DIR):
+    buffer = io.BytesIO()
+    write_index_cards_pdf([card_fields(row) for _, row in df.iterrows()], buffer, cache_dir)
+    buffer.seek(0)
+    return buffer
@@ -0,0 +1,65 @@
+import logging
+import sqlite3
+import threading
+
+from connections import open_connection
+from near_duplicates import update_duplicate_index
+from similar_responses import update_similarity_index
+
+# Background indexing of new and edited responses. Triggers put every written
+# response on the index queues inside the writing transaction; this worker
+# works through the queues on a connection of its own, a batch per
+# transaction, so submits and edits only pay for the enqueue. notify() wakes
+# it after a write, and it also looks every POLL_INTERVAL seconds for rows
+# queued by other processes, e.g. loadingscript.py.
+
+logger = logging.getLogger(__name__)
+
+INDEX_BATCH_SIZE = 100  # Queued responses indexed per transaction
+POLL_INTERVAL = 5.0
+
+
+def index_queued_batch(conn, batch_size=INDEX_BATCH_SIZE):
+    # Index the next batch of each queue, one transaction per batch. Returns
+    # how many queued responses were indexed; 0 once the queues are empty.
+    return (update_duplicate_index(conn, batch_size, max_batches=1)
+            + update_similarity_index(conn, batch_size, max_batches=1))
+
+
+class IndexWorker:
+    def __init__(self, db_path, batch_size=INDEX_BATCH_SIZE, poll_interval=POLL_INTERVAL, busy_timeout=5000):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.busy_timeout = busy_timeout
+        self.error = None  # The last indexing error, until a drain succeeds
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="response-indexer", daemon=True)
+        self._thread.start()
+
+    def notify(self):
+        self._wake.set()
+
+    def stop(self, timeout=None):
+        self._stopped.set()
+        self._wake.set()
+        self._thread.join(timeout)
+
+    def _run(self):
+        conn = open_connection(self.db_path, self.busy_timeout)
+        try:
+            # Starts with whatever was queued before the worker was
+            while not self._stopped.is_set():
+                self._wake.clear()  # Writes from here on wake it up again
+                try:
+                    while not self._stopped.is_set() and index_queued_batch(conn, self.batch_size):
+                        pass
+                    self.error = None
+                except sqlite3.Error as e:
+                    # Left queued; retried on the next wake-up or poll
+                    logger.warning("Indexing queued responses failed: %s", e)
+                    self.error = e
+                self._wake.wait(self.poll_interval)
+        finally:
+            conn.close()
@@ -1,55 +1,235 @@
-import sqlite3
-import csv
+import argparse
 import json
 import os
+import signal
+import sqlite3
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+from connections import open_connection
+from csv_import import (DEFAULT_CHUNK_SIZE, add_content_hashes, import_format, insert_rows, match_headers,
+                        prepare_chunk, read_chunks, read_headers, validate_chunk)
+from migrations import migrate
+from near_duplicates import update_duplicate_index
+from similar_responses import update_similarity_index
+
+# Bulk load of survey exports (CSV, Parquet or Excel) from the command line.
+# The main process reads each file a chunk at a time; worker processes
+# normalize and validate the chunks, and the main process is the only writer,
+# committing each chunk in one transaction together with a checkpoint. An
+# interrupted load therefore resumes after the last committed chunk when it
+# is run again with the same file. Rows whose answers are already stored are
+# skipped (or get the file's title with --update-titles), so loading a file
+# again, even with --restart, doesn't duplicate responses. The loaded
+# responses are then indexed for duplicate and similarity search, so they
+# don't wait for the app's index worker, which may not be running.
+#
+#     python loadingscript.py FILE [FILE ...] [--db PATH] [--workers N] [--chunk-size N]
+#                             [--approved] [--update-titles] [--restart]
+
+DEFAULT_DB_PATH = os.environ.get('SURVEY_DB_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                 'survey_responses.db'))
+
+# Chunks handed to the workers ahead of the writer, per worker
+CHUNKS_IN_FLIGHT = 2
+
+
+def create_checkpoints_table(conn):
+    # One row per loaded file; a changed file (size or modification time)
+    # doesn't match its old checkpoint. rows_rejected holds the rejected rows
+    # per reason as a JSON object.
+    conn.execute('''CREATE TABLE IF NOT EXISTS import_checkpoints
+                    (source TEXT PRIMARY KEY,
+                     fingerprint TEXT NOT NULL,
+                     chunk_size INTEGER NOT NULL,
+                     chunks_done INTEGER NOT NULL DEFAULT 0,
+                     rows_read INTEGER NOT NULL DEFAULT 0,
+                     rows_inserted INTEGER NOT NULL DEFAULT 0,
+                     rows_updated INTEGER NOT NULL DEFAULT 0,
+                     rows_skipped INTEGER NOT NULL DEFAULT 0,
+                     rows_rejected TEXT NOT NULL DEFAULT '{}',
+                     started_at TEXT,
+                     completed_at TEXT)''')
+    # Checkpoints written before rejected rows were counted
+    if 'rows_rejected' not in [info[1] for info in conn.execute("PRAGMA table_info(import_checkpoints)")]:
+        conn.execute("ALTER TABLE import_checkpoints ADD COLUMN rows_rejected TEXT NOT NULL DEFAULT '{}'")
+    conn.commit()
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+
+def file_fingerprint(path):
+    stat = os.stat(path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def start_checkpoint(conn, source, chunk_size, restart=False):
+    # The checkpoint row of source, created if needed. Returns (chunk_size,
+    # chunks_done, rows_read, Counter of rows inserted, updated and skipped,
+    # Counter of rows rejected per reason, completed_at).
+    fingerprint = file_fingerprint(source)
+    with conn:
+        if restart:
+            conn.execute("DELETE FROM import_checkpoints WHERE source = ?", (source,))
+        row = conn.execute("""SELECT fingerprint, chunk_size, chunks_done, rows_read, rows_inserted,
+                                     rows_updated, rows_skipped, rows_rejected, completed_at
+                              FROM import_checkpoints WHERE source = ?""", (source,)).fetchone()
+        if row is None:
+            conn.execute("""INSERT INTO import_checkpoints (source, fingerprint, chunk_size, started_at)
+                            VALUES (?, ?, ?, ?)""", (source, fingerprint, chunk_size, _now()))
+            return chunk_size, 0, 0, Counter(inserted=0, updated=0, skipped=0), Counter(), None
+    if row[0] != fingerprint:
+        raise ValueError(f"{source} changed since it was partly loaded; use --restart to load it again from the start")
+    counts = Counter(inserted=row[4], updated=row[5], skipped=row[6])
+    return row[1], row[2], row[3], counts, Counter(json.loads(row[7])), row[8]
+
+
+def _ignore_interrupts():
+    # Ctrl-C is handled by the main process, which stops the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _prepare(chunk):
+    # Runs in a worker process
+    chunk, rejected = validate_chunk(prepare_chunk(chunk))
+    return add_content_hashes(chunk), rejected
+
+
+class Throughput:
+    # Rows and input bytes per second since the start of the load
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.rows = 0
+        self.bytes = 0
+
+    def add(self, rows, bytes_read):
+        self.rows += rows
+        self.bytes += bytes_read
+
+    def line(self):
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        return (f"{self.rows} rows in {elapsed:.1f}s ({self.rows / elapsed:.0f} rows/s, "
+                f"{self.bytes / elapsed / 1e6:.1f} MB/s)")
+
+
+def load_file(conn, source, executor, chunk_size, defaults, throughput, workers=1, restart=False,
+              update_titles=False):
+    # Returns (Counter of rows inserted, updated and skipped, rejected rows per
+    # reason), or None when the file was loaded completely before
+    chunk_size, chunks_done, rows_read, counts, rejected, completed_at = start_checkpoint(conn, source, chunk_size,
+                                                                                         restart)
+    if completed_at:
+        print(f"{source}: already loaded on {completed_at}; use --restart to load it again")
+        return None
+    if chunks_done:
+        print(f"{source}: resuming after {rows_read} rows ({chunks_done} chunks of {chunk_size})")
+
+    file_format = import_format(source)
+    with open(source, 'rb') as f:
+        columns, missing, unmatched = match_headers(read_headers(f, file_format))
+        if not columns:
+            raise ValueError(f"{source}: none of the headers match a responses column")
+        if missing:
+            print(f"{source}: no column for {', '.join(missing)}; these fields are loaded empty")
+        if unmatched:
+            print(f"{source}: ignoring columns {', '.join(str(header) for header in unmatched)}")
+
+        def write(number, rows, bytes_read, prepared):
+            nonlocal rows_read
+            chunk, chunk_rejected = prepared
+            rows_read += rows
+            rejected.update(chunk_rejected)
+            with conn:
+                counts.update(insert_rows(conn, chunk, defaults, update_titles))
+                conn.execute("""UPDATE import_checkpoints SET chunks_done = ?, rows_read = ?, rows_inserted = ?,
+                                       rows_updated = ?, rows_skipped = ?, rows_rejected = ?
+                                WHERE source = ?""", (number + 1, rows_read, counts['inserted'], counts['updated'],
+                                                       counts['skipped'], json.dumps(rejected), source))
+            throughput.add(rows, bytes_read)
+            print(f"{os.path.basename(source)}: {throughput.line()}", end='\r', flush=True)
+
+        # Chunks committed before an interruption are read again but skipped
+        in_flight = deque()
+        position = 0
+        for number, chunk in enumerate(read_chunks(f, file_format, columns, chunk_size)):
+            bytes_read, position = f.tell() - position, f.tell()
+            if number < chunks_done:
+                continue
+            if executor is None:
+                write(number, len(chunk), bytes_read, _prepare(chunk))
+                continue
+            in_flight.append((number, len(chunk), bytes_read, executor.submit(_prepare, chunk)))
+            if len(in_flight) >= workers * CHUNKS_IN_FLIGHT:
+                *written, future = in_flight.popleft()
+                write(*written, future.result())
+        while in_flight:
+            *written, future = in_flight.popleft()
+            write(*written, future.result())
+
+    with conn:
+        conn.execute("UPDATE import_checkpoints SET completed_at = ? WHERE source = ?", (_now(), source))
+    return counts, rejected
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load survey exports (CSV, Parquet or Excel) into the survey database.")
+    parser.add_argument('files', nargs='+', help="files to load, in order")
+    parser.add_argument('--db', default=DEFAULT_DB_PATH, help="database path (default: %(default)s)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="processes normalizing chunks; 1 does everything in this process")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="rows per chunk and per transaction; a resumed load keeps its original size")
+    parser.add_argument('--approved', action='store_true', help="mark the loaded responses as approved")
+    parser.add_argument('--update-titles', action='store_true',
+                        help="give responses that are already stored the file's title")
+    parser.add_argument('--restart', action='store_true',
+                        help="ignore checkpoints and load every file from the start")
+    args = parser.parse_args(argv)
+
+    conn = open_connection(args.db)
+    migrate(conn)
+    create_checkpoints_table(conn)
+    defaults = {'approved': 1 if args.approved else 0}
+
+    executor = ProcessPoolExecutor(max_workers=args.workers, initializer=_ignore_interrupts) if args.workers > 1 else None
+    throughput = Throughput()
+    failed = False
+    try:
+        for source in args.files:
+            source = os.path.abspath(source)
+            try:
+                result = load_file(conn, source, executor, args.chunk_size, defaults, throughput,
+                                   args.workers, args.restart, args.update_titles)
+            except (OSError, ValueError, sqlite3.Error) as e:
+                print(f"\n{source}: {e}", file=sys.stderr)
+                failed = True
+                continue
+            if result is not None:
+                counts, rejected = result
+                print(f"\n{source}: {counts['inserted']} rows inserted, {counts['updated']} updated, "
+                      f"{counts['skipped']} already stored")
+                for reason, count in rejected.items():
+                    print(f"  {count} rows rejected: {reason}")
+
+        print("Indexing loaded responses...", end=' ', flush=True)
+        duplicates = update_duplicate_index(conn)
+        print(f"{duplicates} checked for duplicates, {update_similarity_index(conn)} for similarity search")
+    except KeyboardInterrupt:
+        print("\nInterrupted; run the same command again to resume after the last committed chunk.")
+        failed = True
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        conn.close()
+
+    print(f"Total: {throughput.line()}")
+    return 1 if failed else 0
+
 
-# Get the directory of the current script
-script_dir = os.path.dirname(os.path.abspath(__file__))
-
-# Connect to the SQLite database in the same directory as the script
-db_path = os.path.join(script_dir, 'survey_responses.db')
-conn = sqlite3.connect(db_path)
-cursor = conn.cursor()
-
-def safe_json_dumps(value):
-    if value:
-        try:
-            return json.dumps(value.split(','))
-        except:
-            return json.dumps([])
-    else:
-        return json.dumps([])
-
-# Path to your CSV file
-csv_file_path = '/Users/kamalalalwan/Desktop/streamlit/streamlit/first_app/Opportunity Map Survey Responses - Sheet1 (1).csv'  # Replace with your actual CSV file path
-
-# Read the CSV and insert into the database
-with open(csv_file_path, 'r') as csv_file:
-    csv_reader = csv.DictReader(csv_file)
-    for row in csv_reader:
-        cursor.execute("""
-            INSERT INTO responses (
-                title, q1_problem, q2_behavior_change, q3_whose_behavior, q4_beneficiary,
-                q5_current_behavior, q6_desired_behavior, q7_frictions, q7_explain,
-                q8_address_problem, q9_patient_journey, q10_settings
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            row.get('title (generated by manual input from admin)'),
-            row.get('1 what problem from your healthcare setting do you want to tackle', ''),
-            row.get('2 will a change in behavior address this problem', ''),
-            safe_json_dumps(row.get('3 whose behaviour should primarily be changed', '')),
-            safe_json_dumps(row.get('4 who will the primary beneficiary of this behaviour change be', '')),
-            row.get('5 current behaviour what are they currently doing', ''),
-            row.get('6 desired behaviour what should they be doing that might solve the problem', ''),
-            safe_json_dumps(row.get('7 why might they not be doing the desired behavior', '')),
-            row.get('please describe your response', ''),
-            row.get('8 how will the behaviour change address the problem', ''),
-            safe_json_dumps(row.get('9 at which stage of the patient journey map does this problem arise', '')),
-            safe_json_dumps(row.get('10 does this problem manifest itself in any of the following settings', ''))
-        ))
-
-# Commit the changes and close the connection
-conn.commit()
-conn.close()
-
-print("CSV data has been successfully inserted into the database.")
\ No newline at end of file
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,14 +2,21 @@ import streamlit as st
 import sqlite3
 import pandas as pd
 import hashlib
-from reportlab.lib.pagesizes import A6, letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, PageBreak, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib import colors
-import io
 import json
+import os
 import csv
-import re
+from collections import Counter
+
+from answer_options import create_answer_options_table
+from connections import ConnectionPool
+from csv_import import (IMPORT_FORMATS, hash_responses_batch, import_file, import_format, match_headers, read_chunks,
+                        read_headers)
+from index_cards import create_index_cards_pdf
+from migrations import BackfillWorker, backfill_position, migrate
+from option_vocabulary import QUESTION_OPTIONS, create_option_labels_table, decode_frame, dump_answers, normalize_text
+from pagination import count_responses, fetch_page, fetch_row_numbers, page_start_id, pager, record_page_end
+from response_stats import get_option_counts, get_response_counts
+from tracing import show_trace_panel, span, trace_rerun, traced
 
 def safe_json_loads(json_str):
     try:
@@ -17,27 +24,30 @@ def safe_json_loads(json_str):
     except json.JSONDecodeError:
         return []  # Return an empty list if JSON decoding fails
 
-# Initialize SQLite database
-conn = sqlite3.connect('survey_responses.db', check_same_thread=False)
-c = conn.cursor()
-
-# Create the table if it doesn't exist
-c.execute('''CREATE TABLE IF NOT EXISTS responses
-             (id INTEGER PRIMARY KEY AUTOINCREMENT,
-              approved INTEGER DEFAULT 0,
-              title TEXT,
-              q1_problem TEXT,
-              q2_behavior_change TEXT,
-              q3_whose_behavior TEXT,
-              q4_beneficiary TEXT,
-              q5_current_behavior TEXT,
-              q6_desired_behavior TEXT,
-              q7_frictions TEXT,
-              q7_explain TEXT,
-              q8_address_problem TEXT,
-              q9_patient_journey TEXT,
-              q10_settings TEXT)''')
-conn.commit()
+# Pool of WAL-mode connections, created once per server process rather than
+# reconnecting on every rerun
+@st.cache_resource
+def get_connection_pool():
+    return ConnectionPool(os.environ.get('SURVEY_DB_PATH', 'survey_responses.db'))
+
+pool = get_connection_pool()
+
+@st.cache_resource
+def initialize_database():
+    with pool.connection() as conn:
+        # Bring the responses table up to the current schema version; the
+        # backfills of new migrations run in the background
+        migrate(conn, backfills=False)
+        create_option_labels_table(conn)
+        create_answer_options_table(conn)
+
+initialize_database()
+
+@st.cache_resource(on_release=lambda worker: worker.stop())
+def get_backfill_worker():
+    return BackfillWorker(pool.db_path)
+
+backfill_worker = get_backfill_worker()
 
 def main():
     st.set_page_config(page_title="BEAR's North Star", page_icon="🐻", layout="wide")
@@ -48,17 +58,20 @@ def main():
     if 'csv_data' not in st.session_state:
         st.session_state.csv_data = None
 
-    show_sidebar()
+    # Timing spans of this rerun, when tracing is enabled
+    with trace_rerun(st.session_state.page):
+        show_sidebar()
 
-    if st.session_state.page == 'home':
-        show_home()
-    elif st.session_state.page == 'problem':
-        show_problem_survey()
-    elif st.session_state.page == 'scientist':
-        show_scientist_dashboard()
-    elif st.session_state.page == 'project_manager':
-        show_project_manager_view()
+        if st.session_state.page == 'home':
+            show_home()
+        elif st.session_state.page == 'problem':
+            show_problem_survey()
+        elif st.session_state.page == 'scientist':
+            show_scientist_dashboard()
+        elif st.session_state.page == 'project_manager':
+            show_project_manager_view()
 
+@traced()
 def show_project_manager_view():
     st.title("Project Manager Dashboard")
 
@@ -87,6 +100,7 @@ def show_project_manager_view():
         st.session_state.pm_logged_in = False
         st.rerun()
 
+@traced()
 def show_project_manager_dashboard():
     st.subheader("Project Manager Dashboard")
 
@@ -94,43 +108,79 @@ def show_project_manager_dashboard():
 
      # Debug section
     st.subheader("Debug Information")
-    total_responses = pd.read_sql_query("SELECT COUNT(*) FROM responses", conn).iloc[0, 0]
-    approved_responses = pd.read_sql_query("SELECT COUNT(*) FROM responses WHERE approved = 1", conn).iloc[0, 0]
-    unapproved_responses = pd.read_sql_query("SELECT COUNT(*) FROM responses WHERE approved = 0", conn).iloc[0, 0]
+    with pool.connection() as conn:
+        total_responses, approved_responses, unapproved_responses = get_response_counts(conn)
+        option_counts = get_option_counts(conn)
     
     st.write(f"Total responses in database: {total_responses}")
     st.write(f"Approved responses: {approved_responses}")
     st.write(f"Unapproved responses: {unapproved_responses}")
+    with st.expander("Answers per option"):
+        st.dataframe(option_counts, hide_index=True)
+
+    # Timing spans and SQL statements of recent reruns
+    show_trace_panel()
 
     with col1:
-        # CSV Upload
-        uploaded_file = st.file_uploader("Choose a CSV file", type="csv", key="csv_uploader")
+        # Upload of survey responses as CSV, Parquet or Excel
+        uploaded_file = st.file_uploader("Choose a CSV, Parquet or Excel file", type=list(IMPORT_FORMATS),
+                                         key="csv_uploader")
         
         if uploaded_file is not None:
-            if st.button("Process CSV"):
-                df = pd.read_csv(uploaded_file)
-                st.session_state.csv_data = df
-                num_records = process_csv_upload(df)
-                st.success(f"Successfully processed {num_records} records.")
+            # Headers are matched to the responses columns before any row is imported
+            columns = {}
+            try:
+                file_format = import_format(uploaded_file.name)
+                columns, missing, unmatched = match_headers(read_headers(uploaded_file, file_format))
+            except (ValueError, OSError) as e:
+                st.error(f"Could not read {uploaded_file.name}: {str(e)}")
+            else:
+                if not columns:
+                    st.error("None of the file's headers match a survey question. Check the file or the import mapping.")
+                elif missing:
+                    st.warning(f"No column found for {', '.join(missing)}; these fields are imported empty.")
+                if unmatched:
+                    st.info(f"Ignored columns: {', '.join(str(header) for header in unmatched)}")
+            
+            # Responses already in the database are skipped; optionally their title is updated
+            update_titles = st.checkbox("Update the titles of responses imported before", key="import_update_titles")
+            with pool.connection() as conn:
+                # Rows the content hash backfill hasn't reached can't be matched yet
+                hashing = backfill_position(conn, hash_responses_batch) is not None
+            if hashing:
+                st.info("Imports are available again once the database upgrade has finished; try again shortly.")
+            elif columns and st.button("Import File"):
+                counts = process_upload(uploaded_file, file_format, update_titles)
+                # Keep only a preview of the upload in the session
+                st.session_state.csv_data = next(iter(read_chunks(uploaded_file, file_format, columns, 100)), None)
+                st.success(f"Imported {counts['inserted']} new responses, updated {counts['updated']} and "
+                           f"skipped {counts['skipped']} already in the database.")
 
         if st.session_state.csv_data is not None:
-            st.write("Uploaded CSV data:")
+            st.write("Uploaded data (first 100 rows):")
             st.write(st.session_state.csv_data)
 
     with col2:
         # Show unapproved responses
         show_unapproved_responses()
 
+@traced()
 def show_unapproved_responses():
     st.subheader("Unapproved Responses")
     
-    # Load unapproved responses
-    df = pd.read_sql_query("SELECT * FROM responses WHERE approved = 0", conn)
+    with pool.connection() as conn:
+        total_unapproved = count_responses(conn, "approved = 0")
     
-    if df.empty:
+    if total_unapproved == 0:
         st.write("No unapproved responses to review.")
     else:
-        st.write(f"Number of unapproved responses: {len(df)}")
+        st.write(f"Number of unapproved responses: {total_unapproved}")
+        
+        # Load only the current page of unapproved responses
+        _, page_size = pager('unapproved_page', total_unapproved, keyset=True)
+        with pool.connection() as conn:
+            df = fetch_page(conn, page_start_id('unapproved_page'), page_size, "approved = 0", columns="id")
+        record_page_end('unapproved_page', df)
         
         # Select a response to review
         response_id = st.selectbox("Select a response to review:", df['id'].tolist())
@@ -138,17 +188,19 @@ def show_unapproved_responses():
         if response_id:
             review_response(response_id)
 
+@traced()
 def review_response(response_id):
     # Fetch the selected response
     query = f"SELECT * FROM responses WHERE id = {response_id}"
-    df = pd.read_sql_query(query, conn)
+    with pool.connection() as conn:
+        df = decode_frame(pd.read_sql_query(query, conn))
     row = df.iloc[0]
 
     st.subheader(f"Response {row['id']}")
     
     # Display all fields without allowing edits
     for column in df.columns:
-        if column != 'id' and column != 'approved':
+        if column not in ('id', 'approved', 'version', 'content_hash'):
             st.write(f"{column}: {row[column]}")
 
     if st.button("Approve", key=f'approve_button_{response_id}'):
@@ -157,12 +209,12 @@ def review_response(response_id):
         st.rerun()
 
 def approve_response(response_id):
-    c.execute("UPDATE responses SET approved = 1 WHERE id = ?", (response_id,))
-    conn.commit()
+    with pool.connection() as conn:
+        conn.execute("UPDATE responses SET approved = 1 WHERE id = ?", (response_id,))
     
     # Verify the update
-    c.execute("SELECT approved FROM responses WHERE id = ?", (response_id,))
-    result = c.fetchone()
+    with pool.connection() as conn:
+        result = conn.execute("SELECT approved FROM responses WHERE id = ?", (response_id,)).fetchone()
     if result and result[0] == 1:
         st.success(f"Response {response_id} approved successfully!")
     else:
@@ -171,24 +223,25 @@ def approve_response(response_id):
 def update_response(response_id, title, q1_problem, q2_behavior_change, q3_whose_behavior, q4_beneficiary,
                     q5_current_behavior, q6_desired_behavior, q7_frictions, q7_explain,
                     q8_address_problem, q9_patient_journey, q10_settings):
-    c.execute("""
-        UPDATE responses
-        SET title=?, q1_problem=?, q2_behavior_change=?, q3_whose_behavior=?, q4_beneficiary=?,
-            q5_current_behavior=?, q6_desired_behavior=?, q7_frictions=?, q7_explain=?,
-            q8_address_problem=?, q9_patient_journey=?, q10_settings=?
-        WHERE id=?
-    """, (title, q1_problem, q2_behavior_change, 
-          json.dumps(q3_whose_behavior), 
-          json.dumps(q4_beneficiary),
-          q5_current_behavior, q6_desired_behavior, 
-          json.dumps(q7_frictions), 
-          q7_explain,
-          q8_address_problem, 
-          json.dumps(q9_patient_journey), 
-          json.dumps(q10_settings), 
-          response_id))
-    conn.commit()
+    with pool.connection() as conn:
+        conn.execute("""
+            UPDATE responses
+            SET title=?, q1_problem=?, q2_behavior_change=?, q3_whose_behavior=?, q4_beneficiary=?,
+                q5_current_behavior=?, q6_desired_behavior=?, q7_frictions=?, q7_explain=?,
+                q8_address_problem=?, q9_patient_journey=?, q10_settings=?
+            WHERE id=?
+        """, (normalize_text(title), normalize_text(q1_problem), normalize_text(q2_behavior_change), 
+              dump_answers('q3_whose_behavior', q3_whose_behavior), 
+              dump_answers('q4_beneficiary', q4_beneficiary),
+              normalize_text(q5_current_behavior), normalize_text(q6_desired_behavior), 
+              dump_answers('q7_frictions', q7_frictions), 
+              normalize_text(q7_explain),
+              normalize_text(q8_address_problem), 
+              dump_answers('q9_patient_journey', q9_patient_journey), 
+              dump_answers('q10_settings', q10_settings), 
+              response_id))
 
+@traced()
 def show_home():
     st.title("BEAR's North Star")
     col1, col2 = st.columns(2)
@@ -203,6 +256,7 @@ def show_home():
             st.session_state.page = 'scientist'
             st.rerun()
 
+@traced()
 def show_problem_survey():
     st.title("Have a Behavioural Problem?")
     
@@ -213,9 +267,7 @@ def show_problem_survey():
                       ["Yes", "No"])
         
         q3 = st.multiselect("3. Whose behaviour should primarily be changed?", 
-                            ["Administrative Staff", "Dietician", "Educator", "Media", 
-                             "Nurse", "Nurse Practitioner", "Patient", "Pharmacist", 
-                             "Physician", "Public Health", "Social Worker", "Student", "Other"])
+                            QUESTION_OPTIONS['q3_whose_behavior'] + ["Other"])
         
         if "Other" in q3:
             q3_other = st.text_input("If 'Other' was selected for Q3, please expand on your choice below.")
@@ -223,9 +275,7 @@ def show_problem_survey():
             q3.append(q3_other)
         
         q4 = st.multiselect("4. Who will the primary beneficiary of this behaviour change be?",
-                            ["Administrative Staff", "Dietician", "Educator", "Media", 
-                             "Nurse", "Nurse Practitioner", "Patient", "Pharmacist", 
-                             "Physician", "Public Health", "Social Worker", "Student", "Other"])
+                            QUESTION_OPTIONS['q4_beneficiary'] + ["Other"])
         
         if "Other" in q4:
             q4_other = st.text_input("If 'Other' was selected for Q4, please expand on your choice below.")
@@ -237,13 +287,7 @@ def show_problem_survey():
         q6 = st.text_area("6. DESIRED BEHAVIOUR: What should they be doing that might solve the problem?")
         
         q7 = st.multiselect("7. Why might they not be doing the desired behavior? What might the frictions be?",
-                            ["Ambiguity: unclear guidance to users to adopt desired behaviour",
-                             "Low motivation or awareness: don't know, understand or appreciate the values of desired behaviour",
-                             "Systemic corporation: the desired behaviour involves some changes to upstream/downstream practice in the first place",
-                             "Complexity: nuances or variations of implementing interventions in real life",
-                             "Research lagging behind: Researchers and/or healthcare practitioners need further understanding",
-                             "Tech/tools constraints: the desired behaviour change is restricted due to underequipped or inaccessible technology/device/tools",
-                             "Other"])
+                            QUESTION_OPTIONS['q7_frictions'] + ["Other"])
         
         if "Other" in q7:
             q7_other = st.text_input("If 'Other' was selected for Q7, please expand on your choice below.")
@@ -255,11 +299,7 @@ def show_problem_survey():
         q8 = st.text_area("8. How will the behaviour change address the problem?")
         
         q9 = st.multiselect("9. At which stage of the patient journey map does this problem arise?",
-                            ["Stage 1: Prevention, Trigger Event",
-                             "Stage 2: Initial Visit, Diagnosis",
-                             "Stage 3: Treatment, Clinical Care",
-                             "Stage 4: Follow-Up, Ongoing Care",
-                             "Other"])
+                            QUESTION_OPTIONS['q9_patient_journey'] + ["Other"])
         
         if "Other" in q9:
             q9_other = st.text_input("If 'Other' was selected for Q9, please expand on your choice below.")
@@ -267,11 +307,7 @@ def show_problem_survey():
             q9.append(q9_other)
         
         q10 = st.multiselect("10. Does this problem manifest itself in any of the following settings?",
-                             ["Primary Care",
-                              "Hospital Care",
-                              "Home and Long-Term Care",
-                              "Community Care",
-                              "Other"])
+                             QUESTION_OPTIONS['q10_settings'] + ["Other"])
         
         if "Other" in q10:
             q10_other = st.text_input("If 'Other' was selected for Q10, please expand on your choice below.")
@@ -281,24 +317,28 @@ def show_problem_survey():
         submitted = st.form_submit_button("Submit")
         
         if submitted:
-            c.execute("""
-                INSERT INTO responses (
-                    q1_problem, q2_behavior_change, q3_whose_behavior, q4_beneficiary,
-                    q5_current_behavior, q6_desired_behavior, q7_frictions, q7_explain,
-                    q8_address_problem, q9_patient_journey, q10_settings
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                q1, q2, json.dumps(q3), json.dumps(q4),
-                q5, q6, json.dumps(q7), q7_explain,
-                q8, json.dumps(q9), json.dumps(q10)
-            ))
-            conn.commit()
+            with pool.connection(durable=True) as conn:
+                conn.execute("""
+                    INSERT INTO responses (
+                        q1_problem, q2_behavior_change, q3_whose_behavior, q4_beneficiary,
+                        q5_current_behavior, q6_desired_behavior, q7_frictions, q7_explain,
+                        q8_address_problem, q9_patient_journey, q10_settings
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, (
+                    normalize_text(q1), normalize_text(q2),
+                    dump_answers('q3_whose_behavior', q3), dump_answers('q4_beneficiary', q4),
+                    normalize_text(q5), normalize_text(q6),
+                    dump_answers('q7_frictions', q7), normalize_text(q7_explain),
+                    normalize_text(q8),
+                    dump_answers('q9_patient_journey', q9), dump_answers('q10_settings', q10)
+                ))
             st.success("Survey submitted successfully!")
     
     if st.button("Back to Home", key="problem_back_survey"):
         st.session_state.page = 'home'
         st.rerun()
 
+@traced()
 def show_sidebar():
     with st.sidebar:
         st.title("Navigation")
@@ -312,33 +352,46 @@ def show_sidebar():
             st.session_state.page = 'project_manager'
             st.rerun()
 
+@traced()
 def show_scientist_dashboard():
     st.title("Behavioural Scientist Dashboard")
     
-    # Load data
-    df = pd.read_sql_query("SELECT * FROM responses WHERE approved = 1", conn)
+    with pool.connection() as conn:
+        total_approved = count_responses(conn, "approved = 1")
     
-    if df.empty:
+    if total_approved == 0:
         st.write("No approved responses yet.")
         return
     
     # Display results in a table format
     st.write("Approved Responses:")
     
-    # Create a display dataframe
-    display_df = df.copy()
+    # Load only the visible page, starting after the last id of the previous one
+    page, page_size = pager('approved_page', total_approved, keyset=True)
+    with pool.connection() as conn:
+        df = fetch_page(conn, page_start_id('approved_page'), page_size, "approved = 1")
+    record_page_end('approved_page', df)
+    
+    # Create a display dataframe with option labels
+    with span("decode page"):
+        display_df = decode_frame(df)
     display_df = display_df.reset_index(drop=True)
-    display_df.index += 1  # Start index from 1 instead of 0
+    display_df.index += page * page_size + 1  # Number rows from 1 across pages
     
-    # Rename columns for better readability
+    # Rename columns for better readability; migrated databases may order them differently
     new_column_names = ['ID', 'Approved', 'Title', 'Problem', 'Behavior Change', 'Whose Behavior', 'Beneficiary',
                         'Current Behavior', 'Desired Behavior', 'Frictions', 'Friction Explanation',
                         'How It Addresses Problem', 'Patient Journey Stage', 'Settings']
+    column_order = ['id', 'approved', 'title', 'q1_problem', 'q2_behavior_change', 'q3_whose_behavior', 'q4_beneficiary',
+                    'q5_current_behavior', 'q6_desired_behavior', 'q7_frictions', 'q7_explain',
+                    'q8_address_problem', 'q9_patient_journey', 'q10_settings']
     
+    display_df = display_df[column_order]
     display_df.columns = new_column_names
     
     # Display the table
-    st.dataframe(display_df)
+    with span("st.dataframe"):
+        st.dataframe(display_df)
         
     # Input field for response numbers
     response_numbers = st.text_input("Enter response numbers to download (comma-separated, e.g., 1,3,5):")
@@ -348,9 +401,12 @@ def show_scientist_dashboard():
         if response_numbers:
             try:
                 selected_indices = [int(idx.strip()) for idx in response_numbers.split(',')]
-                selected_df = df.iloc[pd.Index(selected_indices) - 1]  # Adjust for 0-based indexing
+                with pool.connection() as conn:
+                    selected_df = fetch_row_numbers(conn, selected_indices, "approved = 1")
                 if not selected_df.empty:
-                    pdf = create_index_cards_pdf(selected_df)
+                    # Cards are cached on disk and only the changed ones rendered
+                    with span("create_index_cards_pdf"):
+                        pdf = create_index_cards_pdf(selected_df)
                     st.download_button(
                         label="Download PDF",
                         data=pdf,
@@ -374,117 +430,30 @@ def safe_json_loads(x):
     except json.JSONDecodeError:
         return []  # Return an empty list if JSON decoding fails
 
-def create_index_cards_pdf(df):
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    elements = []
-    
-    styles = getSampleStyleSheet()
-    styles.add(ParagraphStyle(name='SectionTitle', 
-                              fontSize=18, 
-                              textColor=colors.Color(1,0.71,0,1),  # FFB600 in RGB
-                              spaceAfter=10))
-    styles.add(ParagraphStyle(name='Entry', 
-                              fontSize=12, 
-                              spaceAfter=5))
-    
-    def strip_question_number(header):
-        return re.sub(r'^\[?\d+\]?\s*', '', header)
-    
-    for index, row in df.iterrows():
-        # Title Section
-        if row['q6_desired_behavior'] and row['q1_problem']:
-            elements.append(Paragraph(f"<b>Title</b>", styles['SectionTitle']))
-            elements.append(Paragraph(f"{row['q6_desired_behavior']} to solve {row['q1_problem']}", styles['Entry']))
-            elements.append(Spacer(1, 20))
-        
-        # Problem Statement Section
-        problem_statements = []
-        if row['q1_problem']:
-            problem_statements.append(f"<b>{strip_question_number('q1_problem')}:</b> {row['q1_problem']}")
-        if row['q9_patient_journey']:
-            problem_statements.append(f"<b>{strip_question_number('q9_patient_journey')}:</b> {', '.join(row['q9_patient_journey'])}")
-        if row['q10_settings']:
-            problem_statements.append(f"<b>{strip_question_number('q10_settings')}:</b> {', '.join(row['q10_settings'])}")
-        
-        if problem_statements:
-            elements.append(Paragraph("<b>Problem Statement</b>", styles['SectionTitle']))
-            for statement in problem_statements:
-                elements.append(Paragraph(statement, styles['Entry']))
-            elements.append(Spacer(1, 20))
-        
-        # The Behaviour Change Section
-        behaviour_changes = []
-        if row['q2_behavior_change']:
-            behaviour_changes.append(f"<b>{strip_question_number('q2_behavior_change')}:</b> {row['q2_behavior_change']}")
-        if row['q5_current_behavior']:
-            behaviour_changes.append(f"<b>{strip_question_number('q5_current_behavior').replace('CURRENT BEHAVIOUR', '')}:</b> {row['q5_current_behavior']}")
-        if row['q6_desired_behavior']:
-            behaviour_changes.append(f"<b>{strip_question_number('q6_desired_behavior').replace('DESIRED BEHAVIOUR', '')}:</b> {row['q6_desired_behavior']}")
-        
-        if behaviour_changes:
-            elements.append(Paragraph("<b>The Behaviour Change</b>", styles['SectionTitle']))
-            for change in behaviour_changes:
-                elements.append(Paragraph(change, styles['Entry']))
-            elements.append(Spacer(1, 20))
-        
-        # Barriers to Change Section
-        if row['q7_frictions']:
-            elements.append(Paragraph("<b>Barriers to Change</b>", styles['SectionTitle']))
-            elements.append(Paragraph(f"<b>{strip_question_number('q7_frictions')}:</b> {', '.join(row['q7_frictions'])}", styles['Entry']))
-            elements.append(Spacer(1, 20))
-        
-        # The Desired Outcome Section
-        desired_outcomes = []
-        if row['q8_address_problem']:
-            desired_outcomes.append(f"<b>{strip_question_number('q8_address_problem')}:</b> {row['q8_address_problem']}")
-        if row['q4_beneficiary']:
-            desired_outcomes.append(f"<b>{strip_question_number('q4_beneficiary')}:</b> {', '.join(row['q4_beneficiary'])}")
-        
-        if desired_outcomes:
-            elements.append(Paragraph("<b>The Desired Outcome</b>", styles['SectionTitle']))
-            for outcome in desired_outcomes:
-                elements.append(Paragraph(outcome, styles['Entry']))
-        
-        elements.append(PageBreak())
-    
-    doc.build(elements)
-    buffer.seek(0)
-    return buffer
-
-def process_csv_upload(df):
+@traced()
+def process_upload(uploaded_file, file_format, update_titles=False):
+    # Stream the file into the database in chunks, one transaction per chunk.
+    # Returns the counts of inserted, updated and skipped rows.
+    progress_bar = st.progress(0.0, text="Importing responses...")
+    total_bytes = uploaded_file.size or 1
     rows_processed = 0
-    for _, row in df.iterrows():
-        try:
-            c.execute("""
-                INSERT INTO responses (
-                    approved, title, q1_problem, q2_behavior_change, q3_whose_behavior,
-                    q4_beneficiary, q5_current_behavior, q6_desired_behavior,
-                    q7_frictions, q7_explain, q8_address_problem, q9_patient_journey,
-                    q10_settings
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                0,  # approved (set to 0 for unapproved)
-                row.get('title (generated by manual input from admin)', ''),
-                row.get('1 what problem from your healthcare setting do you want to tackle', ''),
-                row.get('2 will a change in behavior address this problem', ''),
-                json.dumps(row.get('3 whose behaviour should primarily be changed', '').split(',') if row.get('3 whose behaviour should primarily be changed') else []),
-                json.dumps(row.get('4 who will the primary beneficiary of this behaviour change be', '').split(',') if row.get('4 who will the primary beneficiary of this behaviour change be') else []),
-                row.get('5 current behaviour what are they currently doing', ''),
-                row.get('6 desired behaviour what should they be doing that might solve the problem', ''),
-                json.dumps(row.get('7 why might they not be doing the desired behavior', '').split(',') if row.get('7 why might they not be doing the desired behavior') else []),
-                row.get('please describe your response', ''),
-                row.get('8 how will the behaviour change address the problem', ''),
-                json.dumps(row.get('9 at which stage of the patient journey map does this problem arise', '').split(',') if row.get('9 at which stage of the patient journey map does this problem arise') else []),
-                json.dumps(row.get('10 does this problem manifest itself in any of the following settings', '').split(',') if row.get('10 does this problem manifest itself in any of the following settings') else [])
-            ))
-            rows_processed += 1
-        except Exception as e:
-            st.error(f"Error processing row: {str(e)}")
-            st.write(row)  # This will show the problematic row
-    
-    conn.commit()
-    return rows_processed
+    counts = Counter(inserted=0, updated=0, skipped=0)
+
+    def report_progress(rows_so_far):
+        nonlocal rows_processed
+        rows_processed = rows_so_far
+        progress_bar.progress(min(uploaded_file.tell() / total_bytes, 1.0),
+                              text=f"Imported {rows_processed} responses...")
+
+    try:
+        with pool.connection() as conn:
+            counts = import_file(conn, uploaded_file, file_format, defaults={'approved': 0}, progress=report_progress,
+                                 update_titles=update_titles)
+    except (sqlite3.Error, ValueError) as e:
+        # Chunks before the failing one are already committed
+        st.error(f"Error importing {uploaded_file.name} after {rows_processed} records: {str(e)}")
+    progress_bar.empty()
+    return counts
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+
+# Boolean membership matrices for the multi-select questions: one row per
+# response (in the order of the cached responses frame) and one column per
+# predefined option, plus a last column that is set when the response has any
+# answer outside the predefined options ("OTHER"). Filtering then becomes a
+# column lookup and an OR across the selected columns.
+
+
+def build_membership_index(conn, ids, question_options):
+    # ids is the index of response ids in frame order; question_options maps
+    # each multi-select column to its filter list ['ALL', ..., 'OTHER']
+    index = {}
+    for column, options in question_options.items():
+        predefined_options = [option for option in options if option not in ('ALL', 'OTHER')]
+        positions = {option: i for i, option in enumerate(predefined_options)}
+        other_position = len(predefined_options)
+
+        pairs = pd.read_sql_query("SELECT response_id, option FROM response_options WHERE question = ?",
+                                  conn, params=[column])
+        rows = ids.get_indexer(pairs['response_id'])
+        cols = pairs['option'].map(positions).fillna(other_position).astype(int).to_numpy()
+        known = rows >= 0  # Skip rows written after the frame was loaded
+
+        # Column-major so that selecting an option column is a contiguous read
+        matrix = np.zeros((len(ids), other_position + 1), dtype=bool, order='F')
+        matrix[rows[known], cols[known]] = True
+        index[column] = (matrix, positions)
+    return index
+
+
+def multiselect_mask(index, column, selected):
+    matrix, positions = index[column]
+    if not selected or 'ALL' in selected:
+        return np.ones(matrix.shape[0], dtype=bool)
+
+    cols = [positions[option] for option in selected if option in positions]
+    if 'OTHER' in selected:
+        cols.append(matrix.shape[1] - 1)
+    return matrix[:, cols].any(axis=1)
+
+
+def masks_excluding_each(masks):
+    # For each mask, the AND of all the others, from prefix and suffix products
+    # instead of re-combining every filter once per facet
+    size = len(masks[0])
+    prefix = [np.ones(size, dtype=bool)]
+    for mask in masks[:-1]:
+        prefix.append(prefix[-1] & mask)
+    result = [None] * len(masks)
+    suffix = np.ones(size, dtype=bool)
+    for i in range(len(masks) - 1, -1, -1):
+        result[i] = prefix[i] & suffix
+        suffix = suffix & masks[i]
+    return result
+
+
+def facet_counts(index, column, base_mask):
+    # Responses matching base_mask per filter option of column, with 'ALL'
+    # counting every response that matches base_mask
+    matrix, positions = index[column]
+    counts = np.count_nonzero(matrix[base_mask], axis=0)
+    facets = {option: int(counts[i]) for option, i in positions.items()}
+    facets['OTHER'] = int(counts[-1])
+    facets['ALL'] = int(np.count_nonzero(base_mask))
+    return facets
+
+
+def crosstab(index, row_column, column_column, mask):
+    # Responses matching mask per pair of options of two columns, with the
+    # 'OTHER' column of each as the last row and column
+    rows, row_positions = index[row_column]
+    columns, column_positions = index[column_column]
+    counts = rows[mask].T.astype(np.int64) @ columns[mask].astype(np.int64)
+    return pd.DataFrame(counts, index=[*row_positions, 'OTHER'], columns=[*column_positions, 'OTHER'])
@@ -0,0 +1,282 @@
+import argparse
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+from answer_options import create_answer_options_table
+from connections import open_connection
+from csv_import import hash_responses_batch
+from fulltext import create_fulltext_index
+from near_duplicates import create_duplicate_index, index_duplicate_batch
+from option_vocabulary import create_option_labels_table, normalize_rows
+from response_stats import create_response_stats
+from similar_responses import create_similarity_index, index_terms_batch
+
+# Versioned changes to the responses table, shared by v1.py and main.py. Each
+# migration has a quick schema step and optionally a data backfill that works
+# through the table a batch of rows per short transaction, so the app keeps
+# accepting submissions in between. Applied versions, and how far a backfill
+# got if it was interrupted, are recorded in schema_migrations. The apps only
+# run the schema steps at startup and leave the backfills to a BackfillWorker
+# thread (or to this script), so readers must cope with rows a backfill hasn't
+# reached yet; backfill_position tells them how far it got.
+#
+#     python migrations.py [db_path] [--dry-run] [--batch-size N]
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 500
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'survey_responses.db')
+
+
+def _response_columns(conn):
+    return [info[1] for info in conn.execute("PRAGMA table_info(responses)")]
+
+
+def _create_responses_table(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS responses
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     title TEXT,
+                     q1_problem TEXT,
+                     q2_behavior_change TEXT,
+                     q3_whose_behavior TEXT,
+                     q4_beneficiary TEXT,
+                     q5_current_behavior TEXT,
+                     q6_desired_behavior TEXT,
+                     q7_frictions TEXT,
+                     q7_explain TEXT,
+                     q8_address_problem TEXT,
+                     q9_patient_journey TEXT,
+                     q10_settings TEXT)''')
+
+
+def _add_column(column, definition):
+    # Adding a column with a constant default does not rewrite the table
+    def add(conn):
+        if column not in _response_columns(conn):
+            conn.execute(f"ALTER TABLE responses ADD COLUMN {column} {definition}")
+    return add
+
+
+def _add_content_hash(conn):
+    # Set by imports, and by the backfill for every response already stored:
+    # the table doesn't record which responses were imported, so survey
+    # submissions made before this migration are hashed too, and importing a
+    # file row with the same answers skips it. Of stored responses with the
+    # same answers the lowest id gets the hash and the rest stay NULL.
+    # Submissions made afterwards leave it NULL, as two respondents may give
+    # the same answers, so an import never skips a row because of them.
+    _add_column('content_hash', "BLOB")(conn)
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_responses_content_hash ON responses (content_hash)")
+
+
+def _install_option_triggers(conn):
+    # The backfill relies on the label-aware triggers to keep response_options
+    # and the keyword index in step with the rewritten rows
+    create_option_labels_table(conn)
+    create_answer_options_table(conn)
+    create_fulltext_index(conn)
+
+
+# (version, name, schema step, backfill). A backfill is called as
+# backfill(conn, after_id, batch_size), must not commit, and returns the last
+# id it processed, or None when no rows are left.
+MIGRATIONS = [
+    (1, "create responses table", _create_responses_table, None),
+    (2, "add approved column for the review workflow", _add_column('approved', "INTEGER DEFAULT 0"), None),
+    (3, "add row version for concurrent edits", _add_column('version', "INTEGER NOT NULL DEFAULT 0"), None),
+    (4, "normalize answers and store option codes", _install_option_triggers, normalize_rows),
+    (5, "index responses for near-duplicate detection", create_duplicate_index, index_duplicate_batch),
+    (6, "index response terms for similar-response search", create_similarity_index, index_terms_batch),
+    (7, "add content hash for idempotent imports", _add_content_hash, hash_responses_batch),
+    (8, "keep response counts for the admin overview", create_response_stats, None),
+]
+
+
+def create_migrations_table(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS schema_migrations
+                    (version INTEGER PRIMARY KEY,
+                     name TEXT NOT NULL,
+                     last_id INTEGER,
+                     started_at TEXT,
+                     completed_at TEXT)''')
+    conn.commit()
+
+
+def get_schema_version(conn):
+    # The highest version up to which every migration is complete; later ones
+    # may be complete too while an earlier backfill is still running
+    create_migrations_table(conn)
+    applied = {row[0] for row in conn.execute("SELECT version FROM schema_migrations WHERE completed_at IS NOT NULL")}
+    version = 0
+    for migration in MIGRATIONS:
+        if migration[0] not in applied:
+            break
+        version = migration[0]
+    return version
+
+
+def pending_migrations(conn):
+    create_migrations_table(conn)
+    applied = {row[0] for row in conn.execute("SELECT version FROM schema_migrations WHERE completed_at IS NOT NULL")}
+    return [migration for migration in MIGRATIONS if migration[0] not in applied]
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+
+def migrate(conn, batch_size=DEFAULT_BATCH_SIZE, progress=None, backfills=True, stopped=None):
+    # Apply pending migrations in order, resuming an interrupted backfill where
+    # it stopped. progress(version, name, last_id) is called after each batch.
+    # Without backfills only the schema steps run, and migrations with a
+    # backfill are left pending; the schema steps don't depend on earlier
+    # backfills. A set stopped Event ends the run between batches. Returns the
+    # versions applied.
+    applied = []
+    for version, name, schema, backfill in pending_migrations(conn):
+        with conn:
+            conn.execute("INSERT OR IGNORE INTO schema_migrations (version, name, started_at) VALUES (?, ?, ?)",
+                         (version, name, _now()))
+        last_id = conn.execute("SELECT last_id FROM schema_migrations WHERE version = ?", (version,)).fetchone()[0]
+
+        # last_id stays NULL until the schema step has run
+        if last_id is None:
+            schema(conn)
+            last_id = 0
+            with conn:
+                conn.execute("UPDATE schema_migrations SET last_id = ? WHERE version = ?", (last_id, version))
+
+        if backfill is not None and not backfills:
+            continue
+        while backfill is not None:
+            if stopped is not None and stopped.is_set():
+                return applied
+            with conn:
+                # Taken before the batch is read, so a concurrent edit can't
+                # land between the read and the rewrite
+                conn.execute("BEGIN IMMEDIATE")
+                next_id = backfill(conn, last_id, batch_size)
+                if next_id is None:
+                    break
+                conn.execute("UPDATE schema_migrations SET last_id = ? WHERE version = ?", (next_id, version))
+            last_id = next_id
+            if progress:
+                progress(version, name, last_id)
+
+        with conn:
+            conn.execute("UPDATE schema_migrations SET completed_at = ? WHERE version = ?", (_now(), version))
+        applied.append(version)
+    return applied
+
+
+def backfill_position(conn, backfill):
+    # The last id reached by a backfill function whose migration is still
+    # pending (0 before its first batch), or None once it is complete
+    version = next(migration[0] for migration in MIGRATIONS if migration[3] is backfill)
+    row = conn.execute("SELECT last_id, completed_at FROM schema_migrations WHERE version = ?", (version,)).fetchone()
+    if row is None or row[1] is not None:
+        return None
+    return row[0] or 0
+
+
+class BackfillWorker:
+    # Runs the pending backfills on a thread with its own connection, one
+    # short transaction per batch, so the app serves requests meanwhile. An
+    # interrupted run resumes on the next start.
+    def __init__(self, db_path, batch_size=DEFAULT_BATCH_SIZE, busy_timeout=5000):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.busy_timeout = busy_timeout
+        self.error = None
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="schema-backfill", daemon=True)
+        self._thread.start()
+
+    def done(self):
+        return not self._thread.is_alive()
+
+    def stop(self, timeout=None):
+        self._stopped.set()
+        self._thread.join(timeout)
+
+    def _run(self):
+        conn = open_connection(self.db_path, self.busy_timeout)
+        try:
+            migrate(conn, self.batch_size, stopped=self._stopped)
+        except sqlite3.Error as e:
+            logger.warning("Backfilling migrations failed: %s", e)
+            self.error = e
+        finally:
+            conn.close()
+
+
+def estimate_migrations(conn, batch_size=DEFAULT_BATCH_SIZE):
+    # Dry run: apply the pending schema steps to a scratch copy of the
+    # database, as they commit and later backfills need the tables of earlier
+    # ones, then time one batch of each pending backfill there and
+    # extrapolate to the rows it has left. Schema steps are not timed; they
+    # don't rewrite the table. Returns a list of
+    # (version, name, rows, estimated_seconds).
+    with tempfile.TemporaryDirectory() as scratch:
+        copy = open_connection(os.path.join(scratch, 'estimate.db'))
+        try:
+            conn.backup(copy)
+            return _estimate_pending(copy, batch_size)
+        finally:
+            copy.close()
+
+
+def _estimate_pending(conn, batch_size):
+    estimates = []
+    for version, name, schema, backfill in pending_migrations(conn):
+        row = conn.execute("SELECT last_id FROM schema_migrations WHERE version = ?", (version,)).fetchone()
+        if row is None or row[0] is None:
+            schema(conn)
+        if backfill is None:
+            estimates.append((version, name, 0, 0.0))
+            continue
+
+        after_id = (row[0] or 0) if row else 0
+        rows = conn.execute("SELECT COUNT(*) FROM responses WHERE id > ?", (after_id,)).fetchone()[0]
+        with conn:
+            start = time.perf_counter()
+            backfill(conn, after_id, batch_size)
+            elapsed = time.perf_counter() - start
+
+        sampled = min(rows, batch_size)
+        estimates.append((version, name, rows, elapsed / sampled * rows if sampled else 0.0))
+    return estimates
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Apply pending schema migrations to the survey database.")
+    parser.add_argument('db_path', nargs='?', default=DEFAULT_DB_PATH)
+    parser.add_argument('--dry-run', action='store_true', help="estimate how long pending migrations take, without applying them")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help="rows per backfill transaction")
+    args = parser.parse_args()
+
+    conn = open_connection(args.db_path)
+    print(f"Schema version: {get_schema_version(conn)}")
+
+    if args.dry_run:
+        for version, name, rows, seconds in estimate_migrations(conn, args.batch_size):
+            if rows:
+                print(f"  {version}: {name} - {rows} rows, about {seconds:.1f}s")
+            else:
+                print(f"  {version}: {name} - schema change only")
+    else:
+        def report(version, name, last_id):
+            print(f"  {version}: {name} - through id {last_id}", end='\r')
+
+        start = time.perf_counter()
+        applied = migrate(conn, args.batch_size, progress=report)
+        print(' ' * 80, end='\r')
+        print(f"Applied {len(applied)} migration(s) in {time.perf_counter() - start:.1f}s; "
+              f"schema version is now {get_schema_version(conn)}")
+    conn.close()
@@ -0,0 +1,226 @@
+import hashlib
+import re
+import zlib
+
+import numpy as np
+import pandas as pd
+
+# Near-duplicate detection over the free-text answers with MinHash and
+# locality-sensitive hashing. Each response's problem and desired behaviour is
+# reduced to a MinHash signature, split into bands; responses that agree on a
+# whole band share an LSH bucket and become candidates, and candidates whose
+# signatures agree on at least DUPLICATE_THRESHOLD of their rows are flagged
+# for review. A response is only ever compared with its bucket neighbours, so
+# indexing the whole table is near-linear rather than pairwise.
+#
+# Triggers queue new and edited responses in duplicate_queue, and
+# update_duplicate_index works through the queue, in the app from the
+# background index worker (index_worker.py).
+
+DUPLICATE_TEXT_COLUMNS = ['q1_problem', 'q6_desired_behavior']
+
+SHINGLE_SIZE = 5  # Characters per shingle, robust to typos and small edits
+NUM_PERMUTATIONS = 64
+BANDS = 16  # 16 bands of 4 rows: pairs at 0.8 similarity share a bucket with probability > 0.999
+ROWS_PER_BAND = NUM_PERMUTATIONS // BANDS
+
+DUPLICATE_THRESHOLD = 0.8
+
+# Candidates checked and flags kept per response, so large clusters of copies
+# stay bounded
+MAX_CANDIDATES = 200
+MAX_FLAGS_PER_RESPONSE = 5
+
+# Universal hash functions (a * x + b) mod p. The seed is fixed: stored
+# signatures are only comparable with signatures from the same functions.
+_PRIME = np.uint64(4294967291)  # Largest prime below 2**32
+_rng = np.random.default_rng(1729)
+_A = _rng.integers(1, 2**31, NUM_PERMUTATIONS, dtype=np.uint64)
+_B = _rng.integers(0, 2**32, NUM_PERMUTATIONS, dtype=np.uint64)
+
+
+def shingles(text):
+    # Hashes of the character shingles of text, after collapsing whitespace
+    text = re.sub(r'\s+', ' ', (text or '').upper()).strip()
+    if not text:
+        return np.empty(0, dtype=np.uint64)
+    grams = {text[i:i + SHINGLE_SIZE] for i in range(max(1, len(text) - SHINGLE_SIZE + 1))}
+    return np.fromiter((zlib.crc32(gram.encode('utf-8')) for gram in grams), dtype=np.uint64, count=len(grams))
+
+
+def minhash_signature(text):
+    # None for empty text, which is never flagged
+    hashes = shingles(text)
+    if hashes.size == 0:
+        return None
+    return ((_A[:, None] * hashes[None, :] + _B[:, None]) % _PRIME).min(axis=1).astype(np.uint32)
+
+
+def band_buckets(signature):
+    buckets = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND].tobytes()
+        digest = hashlib.blake2b(rows, digest_size=8).digest()
+        buckets.append((band, int.from_bytes(digest, 'big', signed=True)))
+    return buckets
+
+
+def response_text(values):
+    # values of DUPLICATE_TEXT_COLUMNS for one response
+    return " ".join(str(value) for value in values if value)
+
+
+def create_duplicate_index(conn):
+    c = conn.cursor()
+    c.executescript(f"""
+        CREATE TABLE IF NOT EXISTS response_minhash
+            (response_id INTEGER PRIMARY KEY,
+             signature BLOB NOT NULL);
+
+        CREATE TABLE IF NOT EXISTS response_lsh
+            (band INTEGER NOT NULL,
+             bucket INTEGER NOT NULL,
+             response_id INTEGER NOT NULL,
+             PRIMARY KEY (band, bucket, response_id)) WITHOUT ROWID;
+
+        CREATE INDEX IF NOT EXISTS idx_response_lsh_response_id ON response_lsh (response_id);
+
+        CREATE TABLE IF NOT EXISTS duplicate_flags
+            (response_id INTEGER NOT NULL,
+             duplicate_of INTEGER NOT NULL,
+             similarity REAL NOT NULL,
+             dismissed INTEGER NOT NULL DEFAULT 0,
+             PRIMARY KEY (response_id, duplicate_of)) WITHOUT ROWID;
+
+        CREATE INDEX IF NOT EXISTS idx_duplicate_flags_duplicate_of ON duplicate_flags (duplicate_of);
+
+        CREATE TABLE IF NOT EXISTS duplicate_queue
+            (response_id INTEGER PRIMARY KEY);
+
+        CREATE TRIGGER IF NOT EXISTS responses_duplicates_insert AFTER INSERT ON responses
+        BEGIN
+            INSERT OR IGNORE INTO duplicate_queue (response_id) VALUES (NEW.id);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS responses_duplicates_update
+        AFTER UPDATE OF {', '.join(DUPLICATE_TEXT_COLUMNS)} ON responses
+        BEGIN
+            INSERT OR IGNORE INTO duplicate_queue (response_id) VALUES (NEW.id);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS responses_duplicates_delete AFTER DELETE ON responses
+        BEGIN
+            DELETE FROM response_minhash WHERE response_id = OLD.id;
+            DELETE FROM response_lsh WHERE response_id = OLD.id;
+            DELETE FROM duplicate_flags WHERE response_id = OLD.id OR duplicate_of = OLD.id;
+            DELETE FROM duplicate_queue WHERE response_id = OLD.id;
+        END;
+    """)
+    conn.commit()
+
+
+def index_response(conn, response_id, text):
+    # (Re)index one response and flag its near duplicates, without committing.
+    # Flags keep the newer response first; dismissed ones are kept as they are.
+    conn.execute("DELETE FROM response_minhash WHERE response_id = ?", (response_id,))
+    conn.execute("DELETE FROM response_lsh WHERE response_id = ?", (response_id,))
+    conn.execute("DELETE FROM duplicate_flags WHERE (response_id = ? OR duplicate_of = ?) AND dismissed = 0",
+                 (response_id, response_id))
+
+    signature = minhash_signature(text)
+    if signature is None:
+        return
+
+    buckets = band_buckets(signature)
+    # Joined against the bucket list so each band is one primary-key lookup
+    candidates = [row[0] for row in conn.execute(
+        f"""SELECT DISTINCT response_lsh.response_id
+            FROM (VALUES {', '.join(['(?, ?)'] * len(buckets))}) AS wanted
+            JOIN response_lsh ON response_lsh.band = wanted.column1 AND response_lsh.bucket = wanted.column2
+            WHERE response_lsh.response_id != ?
+            LIMIT ?""",
+        [value for bucket in buckets for value in bucket] + [response_id, MAX_CANDIDATES])]
+
+    if candidates:
+        rows = conn.execute(f"""SELECT response_id, signature FROM response_minhash
+                                WHERE response_id IN ({', '.join('?' * len(candidates))})""", candidates).fetchall()
+        ids = np.array([row[0] for row in rows])
+        signatures = np.frombuffer(b"".join(row[1] for row in rows), dtype=np.uint32).reshape(len(rows), -1)
+        similarity = (signatures == signature).mean(axis=1)
+        best = np.argsort(-similarity, kind='stable')[:MAX_FLAGS_PER_RESPONSE]
+        conn.executemany("""INSERT OR IGNORE INTO duplicate_flags (response_id, duplicate_of, similarity)
+                            VALUES (?, ?, ?)""",
+                         [(max(response_id, int(ids[i])), min(response_id, int(ids[i])), float(similarity[i]))
+                          for i in best if similarity[i] >= DUPLICATE_THRESHOLD])
+
+    conn.execute("INSERT INTO response_minhash (response_id, signature) VALUES (?, ?)",
+                 (response_id, signature.tobytes()))
+    conn.executemany("INSERT INTO response_lsh (band, bucket, response_id) VALUES (?, ?, ?)",
+                     [(band, bucket, response_id) for band, bucket in buckets])
+
+
+def index_duplicate_batch(conn, after_id, batch_size):
+    # Backfill for the migration runner: index the next batch of responses
+    # after after_id, without committing. Returns the last id, or None when done.
+    rows = conn.execute(f"""SELECT id, {', '.join(DUPLICATE_TEXT_COLUMNS)} FROM responses
+                            WHERE id > ? ORDER BY id LIMIT ?""", (after_id, batch_size)).fetchall()
+    if not rows:
+        return None
+    for row in rows:
+        index_response(conn, row[0], response_text(row[1:]))
+    conn.execute("DELETE FROM duplicate_queue WHERE response_id > ? AND response_id <= ?", (after_id, rows[-1][0]))
+    return rows[-1][0]
+
+
+def update_duplicate_index(conn, batch_size=500, max_batches=None):
+    # Index queued responses, at most max_batches batches. Each batch is
+    # committed, so conn must not be in the middle of the caller's own
+    # transaction. Returns how many were indexed.
+    indexed = batches = 0
+    while max_batches is None or batches < max_batches:
+        rows = conn.execute(f"""SELECT duplicate_queue.response_id, {', '.join(DUPLICATE_TEXT_COLUMNS)}
+                                FROM duplicate_queue JOIN responses ON responses.id = duplicate_queue.response_id
+                                ORDER BY duplicate_queue.response_id LIMIT ?""", (batch_size,)).fetchall()
+        if not rows:
+            break
+        with conn:
+            for row in rows:
+                index_response(conn, row[0], response_text(row[1:]))
+            conn.executemany("DELETE FROM duplicate_queue WHERE response_id = ?", [(row[0],) for row in rows])
+        indexed += len(rows)
+        batches += 1
+    return indexed
+
+
+def count_duplicate_queue(conn, backfill_after=None):
+    # Responses waiting to be checked. While the migration backfill is still
+    # running, every response after backfill_after, the last id it reached,
+    # is waiting too.
+    if backfill_after is None:
+        return conn.execute("SELECT COUNT(*) FROM duplicate_queue").fetchone()[0]
+    return conn.execute("""SELECT (SELECT COUNT(*) FROM duplicate_queue WHERE response_id <= ?)
+                                  + (SELECT COUNT(*) FROM responses WHERE id > ?)""",
+                        (backfill_after, backfill_after)).fetchone()[0]
+
+
+def count_duplicate_flags(conn):
+    return conn.execute("SELECT COUNT(*) FROM duplicate_flags WHERE dismissed = 0").fetchone()[0]
+
+
+def get_duplicate_flags(conn, limit=20):
+    # Open flags with both responses' text, most similar first
+    return pd.read_sql_query("""
+        SELECT duplicate_flags.response_id, duplicate_flags.duplicate_of, duplicate_flags.similarity,
+               newer.title AS title, newer.q1_problem AS q1_problem,
+               older.title AS duplicate_title, older.q1_problem AS duplicate_q1_problem
+        FROM duplicate_flags
+        JOIN responses AS newer ON newer.id = duplicate_flags.response_id
+        JOIN responses AS older ON older.id = duplicate_flags.duplicate_of
+        WHERE duplicate_flags.dismissed = 0
+        ORDER BY duplicate_flags.similarity DESC, duplicate_flags.response_id DESC
+        LIMIT ?""", conn, params=[limit])
+
+
+def dismiss_duplicate_flag(conn, response_id, duplicate_of):
+    conn.execute("UPDATE duplicate_flags SET dismissed = 1 WHERE response_id = ? AND duplicate_of = ?",
+                 (response_id, duplicate_of))
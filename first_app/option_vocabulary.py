@@ -0,0 +1,170 @@
+import json
+
+import pandas as pd
+
+# The predefined answers of the multi-select questions, as shown in the survey.
+# Stored answers keep a predefined option as its small integer code (1-based
+# position in these lists); anything else, e.g. "Other" and the elaborations,
+# is kept as normalized text. Option labels are only looked up for display.
+
+ROLE_OPTIONS = ["Administrative Staff", "Dietician", "Educator", "Media",
+                "Nurse", "Nurse Practitioner", "Patient", "Pharmacist",
+                "Physician", "Public Health", "Social Worker", "Student"]
+
+QUESTION_OPTIONS = {
+    'q3_whose_behavior': ROLE_OPTIONS,
+    'q4_beneficiary': ROLE_OPTIONS,
+    'q7_frictions': ["Ambiguity: unclear guidance to users to adopt desired behaviour",
+                     "Low motivation or awareness: don't know, understand or appreciate the values of desired behaviour",
+                     "Systemic corporation: the desired behaviour involves some changes to upstream/downstream practice in the first place",
+                     "Complexity: nuances or variations of implementing interventions in real life",
+                     "Research lagging behind: Researchers and/or healthcare practitioners need further understanding",
+                     "Tech/tools constraints: the desired behaviour change is restricted due to underequipped or inaccessible technology/device/tools"],
+    'q9_patient_journey': ["Stage 1: Prevention, Trigger Event",
+                           "Stage 2: Initial Visit, Diagnosis",
+                           "Stage 3: Treatment, Clinical Care",
+                           "Stage 4: Follow-Up, Ongoing Care"],
+    'q10_settings': ["Primary Care",
+                     "Hospital Care",
+                     "Home and Long-Term Care",
+                     "Community Care"],
+}
+
+# Free-text answers, stored trimmed and uppercased
+NORMALIZED_TEXT_COLUMNS = ['title', 'q1_problem', 'q2_behavior_change', 'q5_current_behavior',
+                           'q6_desired_behavior', 'q7_explain', 'q8_address_problem']
+
+# Display labels by code, and codes by label
+OPTION_LABELS = {column: [option.upper() for option in options] for column, options in QUESTION_OPTIONS.items()}
+OPTION_CODES = {column: {label: code for code, label in enumerate(labels, start=1)}
+                for column, labels in OPTION_LABELS.items()}
+
+
+def _label_fragments(labels):
+    # Older imports split answers on the commas inside labels ("STAGE 1:
+    # PREVENTION", "TRIGGER EVENT"), and some exports keep only the part before
+    # the colon ("STAGE 1"). Fragment -> code, for fragments of only one label.
+    codes = {}
+    for code, label in enumerate(labels, start=1):
+        pieces = [piece.strip() for piece in label.split(',')]
+        pieces += [piece.split(':')[0].strip() for piece in pieces if ':' in piece]
+        for piece in set(pieces) - {label, ''}:
+            codes.setdefault(piece, set()).add(code)
+    return {piece: found.pop() for piece, found in codes.items() if len(found) == 1}
+
+
+# Label fragments by column, only used to repair legacy and imported answers
+OPTION_FRAGMENTS = {column: _label_fragments(labels) for column, labels in OPTION_LABELS.items()}
+
+
+def normalize_text(value):
+    return value.strip().upper() if isinstance(value, str) else value
+
+
+def option_code(column, answer, repair=False):
+    # The code of a predefined option, or None for any other answer. Only the
+    # exact label is an option, so free text such as "Staff" stays text; with
+    # repair, whole fragments of one label (see OPTION_FRAGMENTS) are too.
+    if isinstance(answer, int):
+        return answer if 0 < answer <= len(OPTION_LABELS[column]) else None
+    text = normalize_text(answer)
+    code = OPTION_CODES[column].get(text)
+    if code is None and repair:
+        code = OPTION_FRAGMENTS[column].get(text)
+    return code
+
+
+def encode_answers(column, answers, repair=False):
+    encoded = []
+    for answer in answers:
+        code = option_code(column, answer, repair)
+        value = code if code is not None else normalize_text(answer)
+        if value != '' and value not in encoded:
+            encoded.append(value)
+    return encoded
+
+
+def dump_answers(column, answers, repair=False):
+    # Compact JSON as stored in the responses table
+    return json.dumps(encode_answers(column, answers, repair), separators=(',', ':'))
+
+
+def decode_answers(column, answers):
+    labels = OPTION_LABELS[column]
+    return [labels[answer - 1] if isinstance(answer, int) and 0 < answer <= len(labels) else answer
+            for answer in answers]
+
+
+def load_answers(value):
+    # Parse a stored multi-select cell; text that is not a JSON list is a single answer
+    if value is None or (isinstance(value, float) and value != value):
+        return []
+    try:
+        answers = json.loads(value)
+    except (TypeError, json.JSONDecodeError):
+        return [value] if value else []
+    return answers if isinstance(answers, list) else [answers]
+
+
+def decode_frame(df):
+    # Copy of df with stored multi-select cells turned into lists of labels
+    df = df.copy()
+    for column in QUESTION_OPTIONS:
+        if column in df.columns:
+            df[column] = df[column].map(lambda value: decode_answers(column, value if isinstance(value, list)
+                                                                     else load_answers(value)))
+    return df
+
+
+def option_label_sql(column):
+    # SQL for the label of the current json_each answer of column
+    return f"""COALESCE((SELECT label FROM option_labels WHERE question = '{column}'
+                          AND code = json_each.value AND json_each.type = 'integer'), json_each.value)"""
+
+
+def create_option_labels_table(conn):
+    # Labels by code for the triggers and SQL readers, refreshed from
+    # QUESTION_OPTIONS on every start
+    c = conn.cursor()
+    c.execute("""CREATE TABLE IF NOT EXISTS option_labels
+                     (question TEXT NOT NULL,
+                      code INTEGER NOT NULL,
+                      label TEXT NOT NULL,
+                      PRIMARY KEY (question, code)) WITHOUT ROWID""")
+    c.executemany("INSERT OR REPLACE INTO option_labels (question, code, label) VALUES (?, ?, ?)",
+                  [(column, code, label) for column, labels in OPTION_LABELS.items()
+                   for code, label in enumerate(labels, start=1)])
+    conn.commit()
+
+
+def normalize_row(row):
+    # Normalized values of the stored columns in row (a dict), with legacy
+    # label fragments repaired
+    normalized = {}
+    for column in QUESTION_OPTIONS:
+        if column in row and row[column] is not None:
+            normalized[column] = dump_answers(column, load_answers(row[column]), repair=True)
+    for column in NORMALIZED_TEXT_COLUMNS:
+        if column in row:
+            normalized[column] = normalize_text(row[column])
+    return normalized
+
+
+def normalize_rows(conn, after_id, batch_size):
+    # Rewrite the next batch of rows after after_id with normalized text and
+    # option codes, without committing. Returns the last id of the batch, or
+    # None once there are no rows left.
+    columns = list(QUESTION_OPTIONS) + NORMALIZED_TEXT_COLUMNS
+    batch = pd.read_sql_query(f"SELECT id, {', '.join(columns)} FROM responses WHERE id > ? ORDER BY id LIMIT ?",
+                              conn, params=[after_id, batch_size])
+    if batch.empty:
+        return None
+
+    updates = []
+    for row in batch.astype(object).where(batch.notna(), None).to_dict('records'):
+        normalized = normalize_row(row)
+        if any(normalized[column] != row[column] for column in normalized):
+            updates.append((*(normalized.get(column, row[column]) for column in columns), row['id']))
+    assignments = ", ".join(f"{column} = ?" for column in columns)
+    conn.executemany(f"UPDATE responses SET {assignments} WHERE id = ?", updates)
+    return int(batch['id'].iloc[-1])
@@ -0,0 +1,79 @@
+import pandas as pd
+import streamlit as st
+
+# Paging for the responses tables so only the visible page is fetched and sent
+# to the browser. SQL-backed views page by id (keyset pagination): each page
+# starts after the last id of the previous one, so deep pages cost the same
+# as the first. Views that already hold their rows in memory just slice them.
+
+PAGE_SIZES = [25, 50, 100, 250]
+
+
+def count_responses(conn, where="1", params=()):
+    return conn.execute(f"SELECT COUNT(*) FROM responses WHERE {where}", list(params)).fetchone()[0]
+
+
+def fetch_page(conn, after_id, page_size, where="1", params=(), columns="*"):
+    query = f"SELECT {columns} FROM responses WHERE ({where}) AND id > ? ORDER BY id LIMIT ?"
+    return pd.read_sql_query(query, conn, params=[*params, after_id, page_size])
+
+
+def fetch_row_numbers(conn, row_numbers, where="1", params=()):
+    # Rows by their 1-based position in id order, as numbered across pages
+    placeholders = ', '.join('?' * len(row_numbers))
+    query = f"""SELECT * FROM (SELECT *, ROW_NUMBER() OVER (ORDER BY id) AS row_number
+                               FROM responses WHERE {where})
+                WHERE row_number IN ({placeholders}) ORDER BY row_number"""
+    df = pd.read_sql_query(query, conn, params=[*params, *row_numbers])
+    return df.drop(columns=['row_number'])
+
+
+def _reset(key):
+    st.session_state[key]['page'] = 0
+    st.session_state[key]['starts'] = [0]
+
+
+def _move(key, step):
+    st.session_state[key]['page'] += step
+
+
+def pager(key, total_rows, signature=None, keyset=False):
+    # Page size selector and previous/next buttons. signature identifies the
+    # current filters; paging restarts at the first page when it changes.
+    # keyset views can only move one page past the last one they recorded
+    # with record_page_end; views that slice their rows go to any page.
+    # Returns (page_number, page_size), page_number counting from 0.
+    state = st.session_state.get(key)
+    if state is None or state['signature'] != signature:
+        state = st.session_state[key] = {'page': 0, 'starts': [0], 'signature': signature}
+
+    page_size = st.selectbox("Rows per page", PAGE_SIZES, key=f"{key}_page_size", on_change=_reset, args=(key,))
+    page_count = max(1, -(-total_rows // page_size))
+    state['page'] = min(state['page'], page_count - 1)
+    if keyset:
+        state['page'] = min(state['page'], len(state['starts']) - 1)
+
+    col1, col2, col3 = st.columns([1, 3, 1])
+    with col1:
+        st.button("Previous", key=f"{key}_previous", disabled=state['page'] == 0,
+                  on_click=_move, args=(key, -1))
+    with col2:
+        st.write(f"Page {state['page'] + 1} of {page_count} ({total_rows} responses)")
+    with col3:
+        st.button("Next", key=f"{key}_next", disabled=state['page'] >= page_count - 1,
+                  on_click=_move, args=(key, 1))
+    return state['page'], page_size
+
+
+def page_start_id(key):
+    # The id the current page starts after, for fetch_page
+    state = st.session_state[key]
+    return state['starts'][state['page']]
+
+
+def record_page_end(key, page_df):
+    # Remember where the next page starts once the current one is fetched
+    state = st.session_state[key]
+    del state['starts'][state['page'] + 1:]
+    if not page_df.empty:
+        state['starts'].append(int(page_df['id'].iloc[-1]))
@@ -0,0 +1,106 @@
+import pandas as pd
+
+# Counters for the admin overview kept current by triggers, so the dashboard
+# reads a few rows instead of counting the whole responses table. Per-option
+# counts follow response_options, which create_answer_options_table keeps in
+# sync with the multi-select answers. Created by a migration (see
+# migrations.py), after the tables it counts.
+
+
+def create_response_stats(conn):
+    c = conn.cursor()
+    c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'response_stats'")
+    exists = c.fetchone() is not None
+    has_approved = 'approved' in [info[1] for info in c.execute("PRAGMA table_info(responses)")]
+
+    c.executescript("""
+        CREATE TABLE IF NOT EXISTS response_stats
+            (name TEXT PRIMARY KEY,
+             value INTEGER NOT NULL) WITHOUT ROWID;
+
+        CREATE TABLE IF NOT EXISTS response_option_counts
+            (question TEXT NOT NULL,
+             option TEXT NOT NULL,
+             count INTEGER NOT NULL,
+             PRIMARY KEY (question, option)) WITHOUT ROWID;
+
+        CREATE TRIGGER IF NOT EXISTS response_stats_insert AFTER INSERT ON responses
+        BEGIN
+            UPDATE response_stats SET value = value + 1 WHERE name = 'total';
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS response_stats_delete AFTER DELETE ON responses
+        BEGIN
+            UPDATE response_stats SET value = value - 1 WHERE name = 'total';
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS response_option_counts_insert AFTER INSERT ON response_options
+        BEGIN
+            INSERT INTO response_option_counts (question, option, count) VALUES (NEW.question, NEW.option, 1)
+            ON CONFLICT (question, option) DO UPDATE SET count = count + 1;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS response_option_counts_delete AFTER DELETE ON response_options
+        BEGIN
+            UPDATE response_option_counts SET count = count - 1
+            WHERE question = OLD.question AND option = OLD.option;
+        END;
+    """)
+
+    if has_approved:
+        c.executescript("""
+            CREATE TRIGGER IF NOT EXISTS response_stats_insert_approved AFTER INSERT ON responses
+            WHEN NEW.approved = 1
+            BEGIN
+                UPDATE response_stats SET value = value + 1 WHERE name = 'approved';
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS response_stats_delete_approved AFTER DELETE ON responses
+            WHEN OLD.approved = 1
+            BEGIN
+                UPDATE response_stats SET value = value - 1 WHERE name = 'approved';
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS response_stats_update_approved AFTER UPDATE OF approved ON responses
+            WHEN (NEW.approved = 1) != (OLD.approved = 1)
+            BEGIN
+                UPDATE response_stats SET value = value + (CASE WHEN NEW.approved = 1 THEN 1 ELSE -1 END)
+                WHERE name = 'approved';
+            END;
+        """)
+
+    if not exists:
+        rebuild_response_stats(conn)
+    conn.commit()
+
+
+def rebuild_response_stats(conn):
+    c = conn.cursor()
+    has_approved = 'approved' in [info[1] for info in c.execute("PRAGMA table_info(responses)")]
+    approved_count = "(SELECT COUNT(*) FROM responses WHERE approved = 1)" if has_approved else "0"
+
+    c.execute("DELETE FROM response_stats")
+    c.execute(f"""INSERT INTO response_stats (name, value)
+                  VALUES ('total', (SELECT COUNT(*) FROM responses)),
+                         ('approved', {approved_count})""")
+    c.execute("DELETE FROM response_option_counts")
+    c.execute("""INSERT INTO response_option_counts (question, option, count)
+                 SELECT question, option, COUNT(*) FROM response_options GROUP BY question, option""")
+    conn.commit()
+
+
+def get_response_counts(conn):
+    # Total, approved and unapproved responses in one lookup
+    stats = dict(conn.execute("SELECT name, value FROM response_stats").fetchall())
+    total = stats.get('total', 0)
+    approved = stats.get('approved', 0)
+    return total, approved, total - approved
+
+
+def get_option_counts(conn, question=None):
+    query = "SELECT question, option, count FROM response_option_counts WHERE count > 0"
+    params = []
+    if question:
+        query += " AND question = ?"
+        params.append(question)
+    return pd.read_sql_query(query + " ORDER BY question, count DESC", conn, params=params)
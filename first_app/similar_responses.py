@@ -0,0 +1,262 @@
+import re
+import threading
+import zlib
+
+import numpy as np
+
+# "Similar opportunities": responses compared by the cosine similarity of
+# their TF-IDF vectors over the problem and behaviour text. Each response's
+# hashed term frequencies are stored in response_terms, kept current through
+# similarity_queue the same way as the near-duplicate index; every change gets
+# a new seq, so the in-memory index only reads rows changed since it last looked.
+
+SIMILARITY_TEXT_COLUMNS = ['title', 'q1_problem', 'q5_current_behavior', 'q6_desired_behavior']
+
+NUM_FEATURES = 2 ** 18  # Terms are hashed into this many features
+
+STOP_WORDS = frozenset("""A AN AND ARE AS AT BE BY FOR FROM HAS HAVE IN IS IT ITS OF ON OR THAT THE THEIR
+                          THEM THEY THIS TO WAS WERE WILL WITH""".split())
+
+# The delta is merged into the sorted bulk once it holds this many vectors,
+# or this fraction of the index if that is more
+MIN_MERGE = 1000
+MERGE_FRACTION = 0.05
+
+
+def term_frequencies(text):
+    # Sorted hashed term ids of text and their sublinear term frequencies
+    tokens = [token for token in re.findall(r'[A-Z0-9]+', (text or '').upper())
+              if len(token) > 1 and token not in STOP_WORDS]
+    hashed = np.fromiter((zlib.crc32(token.encode('utf-8')) % NUM_FEATURES for token in tokens),
+                         dtype=np.uint32, count=len(tokens))
+    terms, counts = np.unique(hashed, return_counts=True)
+    return terms, (1 + np.log(counts)).astype(np.float32)
+
+
+def response_text(values):
+    # values of SIMILARITY_TEXT_COLUMNS for one response
+    return " ".join(str(value) for value in values if value)
+
+
+def create_similarity_index(conn):
+    columns = ', '.join(SIMILARITY_TEXT_COLUMNS)
+    c = conn.cursor()
+    c.executescript(f"""
+        CREATE TABLE IF NOT EXISTS response_terms
+            (response_id INTEGER PRIMARY KEY,
+             seq INTEGER NOT NULL,
+             terms BLOB,
+             tf BLOB);
+
+        CREATE INDEX IF NOT EXISTS idx_response_terms_seq ON response_terms (seq);
+
+        CREATE TABLE IF NOT EXISTS similarity_queue
+            (response_id INTEGER PRIMARY KEY);
+
+        CREATE TRIGGER IF NOT EXISTS responses_similarity_insert AFTER INSERT ON responses
+        BEGIN
+            INSERT OR IGNORE INTO similarity_queue (response_id) VALUES (NEW.id);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS responses_similarity_update AFTER UPDATE OF {columns} ON responses
+        BEGIN
+            INSERT OR IGNORE INTO similarity_queue (response_id) VALUES (NEW.id);
+        END;
+
+        -- Deleted responses leave a row without terms, so readers see the change
+        CREATE TRIGGER IF NOT EXISTS responses_similarity_delete AFTER DELETE ON responses
+        BEGIN
+            UPDATE response_terms SET terms = NULL, tf = NULL,
+                                      seq = (SELECT MAX(seq) + 1 FROM response_terms)
+            WHERE response_id = OLD.id;
+            DELETE FROM similarity_queue WHERE response_id = OLD.id;
+        END;
+    """)
+    conn.commit()
+
+
+def index_terms(conn, response_id, text):
+    # Store the term frequencies of one response, without committing
+    terms, tf = term_frequencies(text)
+    conn.execute("""INSERT INTO response_terms (response_id, seq, terms, tf)
+                    VALUES (?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM response_terms), ?, ?)
+                    ON CONFLICT (response_id) DO UPDATE
+                    SET seq = excluded.seq, terms = excluded.terms, tf = excluded.tf""",
+                 (response_id, terms.tobytes(), tf.tobytes()))
+
+
+def index_terms_batch(conn, after_id, batch_size):
+    # Backfill for the migration runner: index the next batch of responses
+    # after after_id, without committing. Returns the last id, or None when done.
+    rows = conn.execute(f"""SELECT id, {', '.join(SIMILARITY_TEXT_COLUMNS)} FROM responses
+                            WHERE id > ? ORDER BY id LIMIT ?""", (after_id, batch_size)).fetchall()
+    if not rows:
+        return None
+    for row in rows:
+        index_terms(conn, row[0], response_text(row[1:]))
+    conn.execute("DELETE FROM similarity_queue WHERE response_id > ? AND response_id <= ?", (after_id, rows[-1][0]))
+    return rows[-1][0]
+
+
+def update_similarity_index(conn, batch_size=500, max_batches=None):
+    # Index queued responses, at most max_batches batches. Each batch is
+    # committed, so conn must not be in the middle of the caller's own
+    # transaction. Returns how many were indexed.
+    indexed = batches = 0
+    while max_batches is None or batches < max_batches:
+        rows = conn.execute(f"""SELECT similarity_queue.response_id, {', '.join(SIMILARITY_TEXT_COLUMNS)}
+                                FROM similarity_queue JOIN responses ON responses.id = similarity_queue.response_id
+                                ORDER BY similarity_queue.response_id LIMIT ?""", (batch_size,)).fetchall()
+        if not rows:
+            break
+        with conn:
+            for row in rows:
+                index_terms(conn, row[0], response_text(row[1:]))
+            conn.executemany("DELETE FROM similarity_queue WHERE response_id = ?", [(row[0],) for row in rows])
+        indexed += len(rows)
+        batches += 1
+    return indexed
+
+
+def awaiting_similarity_index(conn, response_id):
+    # Queued after a change, or not reached yet by the migration backfill
+    return conn.execute("""SELECT EXISTS (SELECT 1 FROM similarity_queue WHERE response_id = ?)
+                                  OR NOT EXISTS (SELECT 1 FROM response_terms WHERE response_id = ?)""",
+                        (response_id, response_id)).fetchone()[0] == 1
+
+
+class SimilarityIndex:
+    # The TF-IDF matrix in memory, shared by all sessions. Each vector has a
+    # slot. The bulk of the nonzeros is sorted by term, so a query only reads
+    # the postings of its own terms; vectors added since the last merge sit in
+    # a small unsorted delta that is scanned in full. Replaced and deleted
+    # vectors keep their slot, masked out, and still count towards document
+    # frequencies until the next merge.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._ids = []  # Response id of each slot
+        self._slot_of = {}  # Response id -> slot of its current vector
+        self._dead = []
+        self._df = np.zeros(NUM_FEATURES, dtype=np.int64)
+
+        self._terms = np.empty(0, dtype=np.int32)
+        self._slots = np.empty(0, dtype=np.int32)
+        self._tf = np.empty(0, dtype=np.float32)
+        self._indptr = np.zeros(NUM_FEATURES + 1, dtype=np.int64)
+        self._norms = np.empty(0, dtype=np.float32)
+
+        self._delta = []  # (slot, terms, tf) added since the last merge
+        self._view = None  # Arrays for queries, rebuilt after a change
+
+    def similar(self, conn, response_id, limit=10):
+        # The responses most similar to response_id, as (response_id, similarity)
+        # pairs, most similar first
+        with self._lock:
+            self._refresh(conn)
+            row = conn.execute("SELECT terms, tf FROM response_terms WHERE response_id = ?", (response_id,)).fetchone()
+            if row is None or not row[0]:
+                return []
+            return self._query(np.frombuffer(row[0], dtype=np.uint32).astype(np.int64),
+                               np.frombuffer(row[1], dtype=np.float32), limit, exclude=response_id)
+
+    def _refresh(self, conn):
+        rows = conn.execute("SELECT response_id, seq, terms, tf FROM response_terms WHERE seq > ? ORDER BY seq",
+                            (self._seq,)).fetchall()
+        if not rows:
+            return
+        for response_id, seq, terms, tf in rows:
+            slot = self._slot_of.pop(response_id, None)
+            if slot is not None:
+                self._dead.append(slot)
+            if terms:
+                self._add(response_id, np.frombuffer(terms, dtype=np.uint32).astype(np.int32),
+                          np.frombuffer(tf, dtype=np.float32))
+        self._seq = rows[-1][1]
+        self._view = None
+        if len(self._delta) + len(self._dead) >= max(MIN_MERGE, MERGE_FRACTION * len(self._slot_of)):
+            self._merge()
+
+    def _add(self, response_id, terms, tf):
+        slot = len(self._ids)
+        self._ids.append(response_id)
+        self._slot_of[response_id] = slot
+        self._df[terms] += 1
+        self._delta.append((slot, terms, tf))
+
+    def _prepare(self):
+        # Concatenated delta, the norms of its vectors under the current idf,
+        # and which slots are live
+        count = len(self._ids)
+        idf = (np.log((1 + count) / (1 + self._df)) + 1).astype(np.float32)
+        if self._delta:
+            delta_slots = np.concatenate([np.full(len(terms), slot, dtype=np.int32) for slot, terms, _ in self._delta])
+            delta_terms = np.concatenate([terms for _, terms, _ in self._delta])
+            delta_tf = np.concatenate([tf for _, _, tf in self._delta])
+        else:
+            delta_slots = np.empty(0, dtype=np.int32)
+            delta_terms = np.empty(0, dtype=np.int32)
+            delta_tf = np.empty(0, dtype=np.float32)
+
+        weights = delta_tf * idf[delta_terms]
+        norms = np.concatenate([self._norms, np.sqrt(np.bincount(delta_slots - len(self._norms), weights=weights ** 2,
+                                                                  minlength=count - len(self._norms)))])
+        alive = np.ones(count, dtype=bool)
+        alive[self._dead] = False
+        self._view = (np.array(self._ids, dtype=np.int64), alive, norms, idf, delta_slots, delta_terms, delta_tf)
+        return self._view
+
+    def _merge(self):
+        # Rebuild the sorted bulk from the live vectors, renumbering the
+        # slots and recomputing document frequencies and norms
+        ids, alive, _, _, delta_slots, delta_terms, delta_tf = self._prepare()
+        renumbered = np.cumsum(alive, dtype=np.int64) - 1
+        bulk_live = alive[self._slots]
+        delta_live = alive[delta_slots]
+        terms = np.concatenate([self._terms[bulk_live], delta_terms[delta_live]])
+        slots = renumbered[np.concatenate([self._slots[bulk_live], delta_slots[delta_live]])].astype(np.int32)
+        tf = np.concatenate([self._tf[bulk_live], delta_tf[delta_live]])
+
+        ids = ids[alive]
+        self._df = np.bincount(terms, minlength=NUM_FEATURES).astype(np.int64)
+        idf = np.log((1 + len(ids)) / (1 + self._df)) + 1
+        self._norms = np.sqrt(np.bincount(slots, weights=(tf * idf[terms]) ** 2, minlength=len(ids))).astype(np.float32)
+
+        order = np.argsort(terms, kind='stable')
+        self._terms, self._slots, self._tf = terms[order], slots[order], tf[order]
+        self._indptr = np.searchsorted(self._terms, np.arange(NUM_FEATURES + 1))
+        self._ids = ids.tolist()
+        self._slot_of = {response_id: slot for slot, response_id in enumerate(self._ids)}
+        self._dead = []
+        self._delta = []
+        self._view = None
+
+    def _query(self, terms, tf, limit, exclude):
+        ids, alive, norms, idf, delta_slots, delta_terms, delta_tf = self._view or self._prepare()
+        if not len(ids):
+            return []
+
+        # Each document term contributes tf * idf(t)^2 * query weight(t) / norms
+        query = tf * idf[terms]
+        coefficients = np.zeros(NUM_FEATURES, dtype=np.float32)
+        coefficients[terms] = query / np.linalg.norm(query) * idf[terms]
+
+        # Postings of the query's terms in the bulk, each a contiguous run,
+        # then the whole delta
+        starts, ends = self._indptr[terms], self._indptr[terms + 1]
+        slots = np.concatenate([self._slots[start:end] for start, end in zip(starts, ends)])
+        weights = np.concatenate([self._tf[start:end] for start, end in zip(starts, ends)])
+        weights *= np.repeat(coefficients[terms], ends - starts)
+        scores = np.zeros(len(ids))
+        scores += np.bincount(slots, weights=weights, minlength=len(ids))
+        scores += np.bincount(delta_slots, weights=delta_tf * coefficients[delta_terms], minlength=len(ids))
+
+        scores = np.divide(scores, norms, out=np.zeros_like(scores), where=(norms > 0) & alive)
+        if exclude in self._slot_of:
+            scores[self._slot_of[exclude]] = 0
+
+        limit = min(limit, len(ids))
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(int(ids[slot]), float(scores[slot])) for slot in top if scores[slot] > 0]
@@ -0,0 +1,86 @@
+import os
+import sys
+import time
+
+import pytest
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+# The app's modules import each other as top-level modules, so the app
+# directory goes on the path the same way Streamlit puts it there. Run from
+# the app directory:
+#
+#     python -m pytest -q
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+
+from answer_options import create_answer_options_table  # noqa: E402
+from connections import open_connection  # noqa: E402
+from csv_import import import_csv  # noqa: E402
+from fulltext import create_fulltext_index  # noqa: E402
+from migrations import migrate  # noqa: E402
+from option_vocabulary import create_option_labels_table  # noqa: E402
+from write_counter import create_write_counter  # noqa: E402
+
+# The vendor export shipped with the app, 68 responses
+SAMPLE_CSV = os.path.join(APP_DIR, 'Opportunity Map Survey Responses - Sheet1 (1).csv')
+
+APP_TIMEOUT = 60
+
+
+def create_schema(conn):
+    # The same setup as the apps' initialize_database
+    migrate(conn)
+    create_option_labels_table(conn)
+    create_answer_options_table(conn)
+    create_fulltext_index(conn)
+    create_write_counter(conn)
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    # An empty database that the apps under test use; cached resources such
+    # as the connection pool are dropped so they don't point at another test's
+    path = str(tmp_path / 'survey_responses.db')
+    monkeypatch.setenv('SURVEY_DB_PATH', path)
+    st.cache_resource.clear()
+    yield path
+    st.cache_resource.clear()
+
+
+@pytest.fixture
+def conn(db_path):
+    conn = open_connection(db_path)
+    create_schema(conn)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def sample_db(conn, db_path):
+    # The sample export imported once
+    import_csv(conn, SAMPLE_CSV)
+    return db_path
+
+
+def app_test(script='v1.py', **session_state):
+    at = AppTest.from_file(os.path.join(APP_DIR, script), default_timeout=APP_TIMEOUT)
+    for key, value in session_state.items():
+        at.session_state[key] = value
+    return at
+
+
+def by_label(widgets, label):
+    return next(widget for widget in widgets if widget.label == label)
+
+
+def wait_until(condition, timeout=10):
+    # For work done by background threads
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("Timed out waiting for the background work")
+        time.sleep(0.02)
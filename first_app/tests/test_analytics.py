@@ -0,0 +1,112 @@
+import logging
+
+import pandas as pd
+import pytest
+import streamlit as st
+
+import analytics
+from analytics import AnalyticsStore
+from option_vocabulary import OPTION_LABELS
+from write_counter import get_data_version
+
+from conftest import app_test
+
+pytest.importorskip('duckdb')
+
+FILTER_OPTIONS = {column: ['ALL'] + labels + ['OTHER'] for column, labels in OPTION_LABELS.items()}
+
+
+def option_ids(conn, question, option):
+    return [row[0] for row in conn.execute("""SELECT response_id FROM response_options
+                                              WHERE question = ? AND option = ? ORDER BY response_id""",
+                                           (question, option))]
+
+
+def test_filters_match_the_stored_answers(conn, sample_db):
+    store = AnalyticsStore(sample_db, FILTER_OPTIONS)
+    store.refresh(get_data_version(conn))
+    assert store.available() and store.count() == 68
+
+    selections = {column: [] for column in FILTER_OPTIONS}
+    selections['q10_settings'] = ['COMMUNITY CARE']
+    ids, behavior_change_counts, facets = store.filter('', None, 'ALL', selections)
+    expected = option_ids(conn, 'q10_settings', 'COMMUNITY CARE')
+    assert list(ids) == expected
+    assert behavior_change_counts['ALL'] == len(expected)
+    assert facets['q10_settings']['COMMUNITY CARE'] == len(expected)
+
+    rows = store.rows(pd.Index(expected[:2]))
+    assert list(rows['id']) == expected[:2]
+    assert all(isinstance(answers, list) for answers in rows['q10_settings'])
+
+
+def test_failed_build_is_logged_and_retried_with_backoff(conn, sample_db, monkeypatch, caplog):
+    build = analytics.build_analytics_db
+    attempts = []
+
+    def failing_build(*args, **kwargs):
+        attempts.append(1)
+        raise analytics.duckdb.Error("out of memory")
+
+    monkeypatch.setattr(analytics, 'build_analytics_db', failing_build)
+    store = AnalyticsStore(sample_db, FILTER_OPTIONS)
+    version = get_data_version(conn)
+    with caplog.at_level(logging.WARNING, logger='analytics'):
+        store.refresh(version)
+    assert not store.available()
+    assert "Building the analytics copy failed" in caplog.text
+    assert isinstance(store.error, analytics.duckdb.Error)
+
+    store.refresh(version)  # Within the backoff
+    assert len(attempts) == 1
+
+    monkeypatch.setattr(analytics, 'build_analytics_db', build)
+    store._retry_at = 0.0
+    store.refresh(version)
+    assert store.available() and store.error is None
+
+
+def facet_labels(at):
+    return {column: [at.multiselect(key=f'filter_{column}').format_func(option) for option in options]
+            for column, options in FILTER_OPTIONS.items()}
+
+
+def run_dashboard():
+    at = app_test('v1.py', page='scientist')
+    at.run()
+    at.multiselect(key='filter_q10_settings').set_value(['COMMUNITY CARE']).run()
+    assert not at.exception
+    return at
+
+
+def test_dashboard_filters_through_duckdb_like_pandas(sample_db, monkeypatch):
+    filtered = []
+    store_filter = AnalyticsStore.filter
+
+    def recorded_filter(self, *args):
+        filtered.append(args)
+        return store_filter(self, *args)
+
+    monkeypatch.setattr(AnalyticsStore, 'filter', recorded_filter)
+    expected = facet_labels(run_dashboard())
+    assert not filtered
+
+    monkeypatch.setattr(analytics, 'ENABLED', True)
+    st.cache_resource.clear()  # The store is created once per server
+    at = run_dashboard()
+    assert filtered and not at.warning
+    assert facet_labels(at) == expected
+
+
+def test_dashboard_falls_back_to_pandas_when_the_build_fails(sample_db, monkeypatch):
+    monkeypatch.setattr(analytics, 'ENABLED', True)
+
+    def failing_build(*args, **kwargs):
+        raise analytics.duckdb.Error("out of memory")
+
+    monkeypatch.setattr(analytics, 'build_analytics_db', failing_build)
+    at = app_test('v1.py', page='scientist')
+    at.run()
+    assert not at.exception
+    assert "The analytics database is unavailable" in at.warning[0].value
+    assert at.dataframe
@@ -0,0 +1,59 @@
+import threading
+
+import pytest
+
+from connections import ConnectionPool
+
+SUBMITTERS = 8
+SUBMISSIONS = 20
+
+
+def synchronous(conn):
+    return conn.execute("PRAGMA synchronous").fetchone()[0]
+
+
+def test_durable_connections_commit_with_full_sync(conn, db_path):
+    pool = ConnectionPool(db_path, size=1)
+    with pool.connection(durable=True) as durable:
+        assert synchronous(durable) == 2  # FULL
+        with pool.connection() as nested:
+            assert nested is durable
+    with pool.connection() as reused:
+        assert reused is durable
+        assert synchronous(reused) == 1  # NORMAL
+    pool.close()
+
+
+def test_failed_block_is_rolled_back(conn, db_path):
+    pool = ConnectionPool(db_path)
+    with pytest.raises(RuntimeError):
+        with pool.connection(durable=True) as pooled:
+            pooled.execute("INSERT INTO responses (title) VALUES ('ROLLED BACK')")
+            raise RuntimeError
+    assert conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] == 0
+    pool.close()
+
+
+def test_concurrent_submits_through_the_pool(conn, db_path):
+    pool = ConnectionPool(db_path, size=4)
+    ids, errors = [], []
+
+    def submitter(number):
+        try:
+            for submission in range(SUBMISSIONS):
+                with pool.connection(durable=True) as pooled:
+                    ids.append(pooled.execute("INSERT INTO responses (title) VALUES (?)",
+                                              (f"SUBMITTER {number} #{submission}",)).lastrowid)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=submitter, args=(number,)) for number in range(SUBMITTERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(set(ids)) == SUBMITTERS * SUBMISSIONS
+    assert conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] == SUBMITTERS * SUBMISSIONS
+    pool.close()
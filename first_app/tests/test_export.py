@@ -0,0 +1,75 @@
+import csv
+import io
+
+import pyarrow.parquet as pq
+import pytest
+from streamlit.runtime.media_file_manager import MediaFileManager
+
+from conftest import app_test
+
+
+@pytest.fixture
+def deferred_downloads(monkeypatch):
+    # The media file manager behind each deferred download, by file id. The
+    # app test's runtime is gone once a run finishes, so the managers are
+    # kept here to serve the download the way the server does on a click.
+    managers = {}
+    add_deferred = MediaFileManager.add_deferred
+
+    def record(self, *args, **kwargs):
+        file_id = add_deferred(self, *args, **kwargs)
+        managers[file_id] = self
+        return file_id
+
+    monkeypatch.setattr(MediaFileManager, 'add_deferred', record)
+    return managers
+
+
+def download(managers, button):
+    file_id = button.proto.deferred_file_id
+    manager = managers[file_id]
+    url = manager.execute_deferred(file_id)
+    return manager._storage.get_file(url.rsplit('/', 1)[-1]).content
+
+
+def test_download_button_serves_the_filtered_responses(sample_db, deferred_downloads):
+    at = app_test(page='scientist', logged_in=False)
+    at.run()
+    button = at.get('download_button')[0]
+    assert button.proto.label == "Download filtered responses (68)"
+
+    rows = list(csv.reader(io.StringIO(download(deferred_downloads, button).decode())))
+    assert rows[0][0] == 'id'
+    assert len(rows) == 69
+
+
+def test_download_button_follows_the_filters(sample_db, deferred_downloads):
+    at = app_test(page='scientist', logged_in=False)
+    at.run()
+    at.selectbox(key='filter_q2_behavior_change').set_value('YES').run()
+    button = at.get('download_button')[0]
+    count = int(button.proto.label.rsplit('(', 1)[1].rstrip(')'))
+    assert count < 68
+
+    rows = list(csv.reader(io.StringIO(download(deferred_downloads, button).decode())))
+    assert len(rows) == count + 1
+
+
+def test_download_button_exports_parquet(sample_db, deferred_downloads):
+    at = app_test(page='scientist', logged_in=False)
+    at.run()
+    at.selectbox(key='export_format').set_value('Parquet').run()
+    button = at.get('download_button')[0]
+
+    table = pq.read_table(io.BytesIO(download(deferred_downloads, button)))
+    assert table.num_rows == 68
+    assert table.column('id').to_pylist() == list(range(1, 69))
+
+
+def test_expired_pdf_export_is_cleared(sample_db):
+    # A job id from before a server restart
+    at = app_test('v1.py', page='scientist', export_job='0' * 64)
+    at.run()
+    assert not at.exception
+    assert at.session_state.export_job is None
+    assert "The PDF export is no longer available. Please create it again." in [info.value for info in at.info]
@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from membership import build_membership_index, facet_counts, masks_excluding_each, multiselect_mask
+from option_vocabulary import OPTION_LABELS
+
+from conftest import app_test
+
+
+@pytest.fixture
+def ids(conn, sample_db):
+    return pd.Index([row[0] for row in conn.execute("SELECT id FROM responses ORDER BY id")])
+
+
+@pytest.fixture
+def index(conn, ids):
+    return build_membership_index(conn, ids, {column: ['ALL', *labels, 'OTHER']
+                                              for column, labels in OPTION_LABELS.items()})
+
+
+def answered(conn, ids, column, options):
+    # Mask of the responses with any of options, straight from SQLite
+    rows = conn.execute(f"""SELECT DISTINCT response_id FROM response_options
+                            WHERE question = ? AND option IN ({', '.join('?' * len(options))})""",
+                        (column, *options)).fetchall()
+    return ids.isin([row[0] for row in rows])
+
+
+def answered_other(conn, ids, column):
+    labels = OPTION_LABELS[column]
+    rows = conn.execute(f"""SELECT DISTINCT response_id FROM response_options
+                            WHERE question = ? AND option NOT IN ({', '.join('?' * len(labels))})""",
+                        (column, *labels)).fetchall()
+    return ids.isin([row[0] for row in rows])
+
+
+def test_multiselect_mask_matches_stored_options(conn, ids, index):
+    mask = multiselect_mask(index, 'q3_whose_behavior', ['PHYSICIAN'])
+    assert np.count_nonzero(mask) == 50
+    assert (mask == answered(conn, ids, 'q3_whose_behavior', ['PHYSICIAN'])).all()
+
+    mask = multiselect_mask(index, 'q3_whose_behavior', ['NURSE', 'PHARMACIST'])
+    assert (mask == answered(conn, ids, 'q3_whose_behavior', ['NURSE', 'PHARMACIST'])).all()
+
+
+def test_multiselect_mask_other_and_all(conn, ids, index):
+    mask = multiselect_mask(index, 'q3_whose_behavior', ['OTHER'])
+    assert mask.any()
+    assert (mask == answered_other(conn, ids, 'q3_whose_behavior')).all()
+
+    assert multiselect_mask(index, 'q3_whose_behavior', ['ALL', 'NURSE']).all()
+    assert multiselect_mask(index, 'q3_whose_behavior', []).all()
+
+
+def test_facet_counts(conn, ids, index):
+    everything = np.ones(len(ids), dtype=bool)
+    facets = facet_counts(index, 'q3_whose_behavior', everything)
+    assert facets['ALL'] == 68
+    assert facets['PHYSICIAN'] == 50
+    assert facets['OTHER'] == np.count_nonzero(answered_other(conn, ids, 'q3_whose_behavior'))
+
+    physicians = multiselect_mask(index, 'q3_whose_behavior', ['PHYSICIAN'])
+    facets = facet_counts(index, 'q10_settings', physicians)
+    assert facets['ALL'] == 50
+    for label in OPTION_LABELS['q10_settings']:
+        expected = physicians & answered(conn, ids, 'q10_settings', [label])
+        assert facets[label] == np.count_nonzero(expected)
+
+
+def test_masks_excluding_each():
+    rng = np.random.default_rng(0)
+    masks = [rng.random(40) < 0.7 for _ in range(5)]
+    for i, excluded in enumerate(masks_excluding_each(masks)):
+        others = [mask for j, mask in enumerate(masks) if j != i]
+        assert (excluded == np.logical_and.reduce(others)).all()
+
+
+def test_dashboard_filters_and_counts(sample_db):
+    at = app_test(page='scientist', logged_in=False)
+    at.run()
+    whose_behavior = at.multiselect(key='filter_q3_whose_behavior')
+    assert whose_behavior.format_func('PHYSICIAN') == "PHYSICIAN (50)"
+
+    whose_behavior.select('PHYSICIAN').run()
+    assert not at.exception
+    assert any(markdown.value == "Page 1 of 2 (50 responses)" for markdown in at.markdown)
+    assert at.get('download_button')[0].proto.label == "Download filtered responses (50)"
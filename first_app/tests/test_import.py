@@ -0,0 +1,137 @@
+import pandas as pd
+import pytest
+
+import loadingscript
+from csv_import import import_csv, import_file, match_headers, read_headers
+
+from conftest import SAMPLE_CSV
+
+
+def response_count(conn):
+    return conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+def test_importing_again_inserts_nothing(conn, sample_db):
+    counts = import_csv(conn, SAMPLE_CSV, chunksize=7)
+    assert counts == {'inserted': 0, 'updated': 0, 'skipped': 68}
+    assert response_count(conn) == 68
+
+
+def test_repeats_within_a_file_are_skipped(conn, tmp_path):
+    sample = pd.read_csv(SAMPLE_CSV, dtype=str)
+    path = tmp_path / 'repeated.csv'
+    pd.concat([sample, sample.head(5)]).to_csv(path, index=False)
+    assert import_csv(conn, str(path)) == {'inserted': 68, 'updated': 0, 'skipped': 5}
+    assert response_count(conn) == 68
+
+
+def test_same_responses_from_another_format_are_skipped(conn, sample_db, tmp_path):
+    path = tmp_path / 'responses.parquet'
+    pd.read_csv(SAMPLE_CSV, dtype=str).to_parquet(path, index=False)
+    assert import_file(conn, str(path), 'parquet')['inserted'] == 0
+    assert response_count(conn) == 68
+
+
+def test_update_titles_of_imported_responses(conn, sample_db, tmp_path):
+    sample = pd.read_csv(SAMPLE_CSV, dtype=str)
+    sample.iloc[0, 1] = "A new title"
+    path = tmp_path / 'retitled.csv'
+    sample.to_csv(path, index=False)
+
+    assert import_csv(conn, str(path))['updated'] == 0
+    counts = import_csv(conn, str(path), update_titles=True)
+    assert counts == {'inserted': 0, 'updated': 1, 'skipped': 67}
+    assert conn.execute("SELECT title FROM responses WHERE id = 1").fetchone()[0] == "A NEW TITLE"
+    assert response_count(conn) == 68
+
+
+def test_loading_script_restart_does_not_duplicate(conn, db_path, capsys):
+    args = [SAMPLE_CSV, '--db', db_path, '--workers', '1']
+    assert loadingscript.main(args) == 0
+    assert loadingscript.main(args + ['--restart']) == 0
+    assert "0 rows inserted, 0 updated, 68 already stored" in capsys.readouterr().out
+    assert response_count(conn) == 68
+
+
+def test_import_repairs_split_labels_but_keeps_other_answers(conn, tmp_path):
+    sample = pd.read_csv(SAMPLE_CSV, dtype=str).head(1)
+    sample['4 who will the primary beneficiary of this behaviour change be'] = "Patient, Staff"
+    sample['9 at which stage of the patient journey map does this problem arise'] = "Stage 1: Prevention, Trigger Event"
+    sample['10 does this problem manifest itself in any of the following settings'] = "Home, Health"
+    path = tmp_path / 'labels.csv'
+    sample.to_csv(path, index=False)
+
+    assert import_csv(conn, str(path))['inserted'] == 1
+    row = conn.execute("SELECT q4_beneficiary, q9_patient_journey, q10_settings FROM responses").fetchone()
+    assert row == ('[7,"STAFF"]', '[1]', '["HOME","HEALTH"]')
+
+
+def test_loading_script_resume_keeps_rejected_counts(conn, db_path, tmp_path, monkeypatch, capsys):
+    sample = pd.read_csv(SAMPLE_CSV, dtype=str).head(10)
+    sample.iloc[[1, 7], 3] = "Maybe"  # Q2 answers that are rejected, one per chunk
+    path = tmp_path / 'rejects.csv'
+    sample.to_csv(path, index=False)
+    args = [str(path), '--db', db_path, '--workers', '1', '--chunk-size', '5']
+
+    insert_rows = loadingscript.insert_rows
+    chunks = []
+
+    def interrupted_insert(*insert_args):
+        chunks.append(1)
+        if len(chunks) == 2:
+            raise KeyboardInterrupt
+        return insert_rows(*insert_args)
+
+    monkeypatch.setattr(loadingscript, 'insert_rows', interrupted_insert)
+    assert loadingscript.main(args) == 1
+    monkeypatch.setattr(loadingscript, 'insert_rows', insert_rows)
+    assert loadingscript.main(args) == 0
+
+    out = capsys.readouterr().out
+    assert "resuming after 5 rows" in out
+    assert "8 rows inserted, 0 updated, 0 already stored" in out
+    assert "2 rows rejected: unknown behavior change answer" in out
+    assert response_count(conn) == 8
+
+
+def test_checkpoints_from_before_rejected_counts_are_upgraded(conn):
+    conn.execute("""CREATE TABLE import_checkpoints
+                    (source TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, chunk_size INTEGER NOT NULL,
+                     chunks_done INTEGER NOT NULL DEFAULT 0, rows_read INTEGER NOT NULL DEFAULT 0,
+                     rows_inserted INTEGER NOT NULL DEFAULT 0, rows_updated INTEGER NOT NULL DEFAULT 0,
+                     rows_skipped INTEGER NOT NULL DEFAULT 0, started_at TEXT, completed_at TEXT)""")
+    conn.execute("INSERT INTO import_checkpoints (source, fingerprint, chunk_size) VALUES ('old.csv', '1:1', 5)")
+    loadingscript.create_checkpoints_table(conn)
+    assert conn.execute("SELECT rows_rejected FROM import_checkpoints").fetchone() == ('{}',)
+
+
+def test_excel_import_matches_the_csv_import(conn, sample_db, tmp_path):
+    pytest.importorskip('openpyxl')
+    path = tmp_path / 'responses.xlsx'
+    pd.read_csv(SAMPLE_CSV, dtype=str).to_excel(path, index=False)
+    # The same responses as the CSV already loaded, read in several chunks
+    assert import_file(conn, str(path), 'xlsx', chunksize=10) == {'inserted': 0, 'updated': 0, 'skipped': 68}
+    assert response_count(conn) == 68
+
+
+def test_excel_headers_and_cells(conn, tmp_path):
+    openpyxl = pytest.importorskip('openpyxl')
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(["Title (generated by manual input from admin)", None, "2 Will a change in behavior address this problem",
+                  "10 Does this problem manifest itself in any of the following settings", "Notes"])
+    sheet.append(["First", "ignored", "Yes", "Primary Care, Home"])
+    sheet.append([2024, None, None, None, "short row"])
+    path = tmp_path / 'responses.xlsx'
+    workbook.save(path)
+
+    with open(path, 'rb') as f:
+        headers = read_headers(f, 'xlsx')
+    assert headers == ["Title (generated by manual input from admin)", "2 Will a change in behavior address this problem",
+                       "10 Does this problem manifest itself in any of the following settings", "Notes"]
+    columns, missing, unmatched = match_headers(headers)
+    assert unmatched == ["Notes"]
+
+    assert import_file(conn, str(path), 'xlsx')['inserted'] == 2
+    rows = conn.execute("SELECT title, q2_behavior_change, q10_settings FROM responses ORDER BY id").fetchall()
+    assert rows == [("FIRST", "YES", '[1,"HOME"]'), ("2024", "", '[]')]
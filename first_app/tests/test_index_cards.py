@@ -0,0 +1,72 @@
+import io
+import os
+import time
+
+from pypdf import PdfReader
+
+import index_cards
+from index_cards import card_fields, prune_card_cache, render_cards, write_index_cards_pdf
+
+from conftest import app_test, by_label
+
+
+def sample_cards(conn, count):
+    rows = conn.execute(f"SELECT {', '.join(index_cards.CARD_FIELDS)} FROM responses ORDER BY id LIMIT ?",
+                        (count,)).fetchall()
+    return [card_fields(dict(zip(index_cards.CARD_FIELDS, row))) for row in rows]
+
+
+def test_cards_are_rendered_once_and_merged(conn, sample_db, tmp_path):
+    cards = sample_cards(conn, 3)
+    cache_dir = str(tmp_path / 'cards')
+    progress = []
+    render_cards(cards, cache_dir, progress=lambda done, total: progress.append((done, total)))
+    assert progress[0] == (0, 3) and progress[-1] == (3, 3)
+    assert len(os.listdir(cache_dir)) == 3
+
+    progress.clear()
+    output = io.BytesIO()
+    write_index_cards_pdf(cards, output, cache_dir, progress=lambda done, total: progress.append((done, total)))
+    assert progress == [(3, 3)]
+    assert len(PdfReader(io.BytesIO(output.getvalue())).pages) >= 3
+
+
+def test_prune_removes_only_cards_unused_for_the_ttl(conn, sample_db, tmp_path):
+    cache_dir = str(tmp_path / 'cards')
+    old, recent = render_cards(sample_cards(conn, 2), cache_dir)
+    stale = time.time() - index_cards.CARD_CACHE_TTL - 60
+    os.utime(old, (stale, stale))
+    leftover = os.path.join(cache_dir, 'partial.tmp')
+    open(leftover, 'wb').close()
+    os.utime(leftover, (stale, stale))
+
+    prune_card_cache(cache_dir)
+    assert os.listdir(cache_dir) == [os.path.basename(recent)]
+
+
+def test_reused_cards_are_kept_from_expiring(conn, sample_db, tmp_path):
+    cache_dir = str(tmp_path / 'cards')
+    cards = sample_cards(conn, 1)
+    path, = render_cards(cards, cache_dir)
+    stale = time.time() - index_cards.CARD_CACHE_TTL - 60
+    os.utime(path, (stale, stale))
+
+    render_cards(cards, cache_dir)
+    prune_card_cache(cache_dir)
+    assert os.path.exists(path)
+
+
+def test_project_manager_export_uses_the_card_cache(conn, sample_db, tmp_path, monkeypatch):
+    with conn:
+        conn.execute("UPDATE responses SET approved = 1 WHERE id <= 5")
+    cache_dir = str(tmp_path / 'cards')
+    # The cache directory is bound as a default argument when the module loads
+    monkeypatch.setattr(index_cards.create_index_cards_pdf, '__defaults__', (cache_dir,))
+
+    at = app_test('main.py', page='scientist')
+    at.run()
+    by_label(at.text_input, "Enter response numbers to download (comma-separated, e.g., 1,3,5):").set_value("1,3")
+    by_label(at.button, "Download Selected Responses").click().run()
+    assert not at.exception
+    assert at.get('download_button')[0].proto.label == "Download PDF"
+    assert len(os.listdir(cache_dir)) == 2
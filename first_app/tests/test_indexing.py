@@ -0,0 +1,86 @@
+from index_worker import IndexWorker
+from near_duplicates import count_duplicate_queue, update_duplicate_index
+from similar_responses import update_similarity_index
+
+from conftest import app_test, by_label, wait_until
+
+
+def similarity_queue(conn):
+    return conn.execute("SELECT COUNT(*) FROM similarity_queue").fetchone()[0]
+
+
+def test_imports_are_queued_for_indexing(conn, sample_db):
+    assert count_duplicate_queue(conn) == 68
+    assert similarity_queue(conn) == 68
+
+
+def test_indexing_is_bounded_by_batches(conn, sample_db):
+    assert update_duplicate_index(conn, batch_size=10, max_batches=2) == 20
+    assert count_duplicate_queue(conn) == 48
+    assert update_similarity_index(conn, batch_size=10, max_batches=1) == 10
+    assert similarity_queue(conn) == 58
+    assert update_duplicate_index(conn) == 48
+    assert count_duplicate_queue(conn) == 0
+
+
+def minhash_count(conn):
+    return conn.execute("SELECT COUNT(*) FROM response_minhash").fetchone()[0]
+
+
+def test_worker_indexes_queued_responses_when_notified(conn, sample_db, db_path):
+    worker = IndexWorker(db_path, batch_size=10, poll_interval=60)
+    try:
+        worker.notify()
+        wait_until(lambda: count_duplicate_queue(conn) == similarity_queue(conn) == 0)
+    finally:
+        worker.stop(timeout=10)
+    assert minhash_count(conn) == 68
+    assert conn.execute("SELECT COUNT(*) FROM response_terms").fetchone()[0] == 68
+    assert worker.error is None
+
+
+def test_worker_polls_for_responses_queued_elsewhere(conn, sample_db, db_path):
+    worker = IndexWorker(db_path, poll_interval=0.05)
+    try:
+        wait_until(lambda: count_duplicate_queue(conn) == similarity_queue(conn) == 0)
+    finally:
+        worker.stop(timeout=10)
+
+
+def test_edit_only_queues_and_the_worker_indexes(conn, sample_db):
+    update_duplicate_index(conn)
+    update_similarity_index(conn)
+    signature = conn.execute("SELECT signature FROM response_minhash WHERE response_id = 1").fetchone()[0]
+
+    at = app_test(page='project_manager', logged_in=True)
+    at.run()
+    at.text_input(key='1_q1_problem').set_value("Patients forget to take their medication on time")
+    by_label(at.button, "Update Submission").click().run()
+    assert not at.exception
+    wait_until(lambda: count_duplicate_queue(conn) == 0)
+    wait_until(lambda: conn.execute("SELECT signature FROM response_minhash WHERE response_id = 1").fetchone()
+               not in (None, (signature,)))
+
+
+def test_edit_is_searchable_by_similarity_once_the_worker_indexed_it(conn, sample_db):
+    update_similarity_index(conn)
+    seq = conn.execute("SELECT seq FROM response_terms WHERE response_id = 1").fetchone()[0]
+
+    at = app_test(page='project_manager', logged_in=True)
+    at.run()
+    at.text_input(key='1_title').set_value("Edited title")
+    by_label(at.button, "Update Submission").click().run()
+    assert not at.exception
+    wait_until(lambda: similarity_queue(conn) == 0)
+    assert conn.execute("SELECT seq FROM response_terms WHERE response_id = 1").fetchone()[0] > seq
+
+
+def test_show_similar_after_the_worker_indexed_the_responses(conn, sample_db):
+    at = app_test(page='scientist', logged_in=False)
+    at.run()
+    wait_until(lambda: similarity_queue(conn) == 0)
+    by_label(at.text_input, "Enter a response number to find similar opportunities:").set_value("1")
+    by_label(at.button, "Show Similar").click().run()
+    assert not at.exception
+    similar = next(frame.value for frame in at.dataframe if 'Similarity' in frame.value.columns)
+    assert 0 < len(similar) <= 10
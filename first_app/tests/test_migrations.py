@@ -0,0 +1,173 @@
+import os
+import shutil
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from conftest import APP_DIR, SAMPLE_CSV, app_test, wait_until
+from connections import open_connection
+from csv_import import hash_responses_batch, import_csv
+from migrations import (MIGRATIONS, BackfillWorker, backfill_position, estimate_migrations, get_schema_version, migrate,
+                        pending_migrations)
+from near_duplicates import count_duplicate_queue, index_duplicate_batch
+from response_stats import get_response_counts
+from similar_responses import awaiting_similarity_index
+
+# The database shipped with the app: the baseline responses table only
+BASELINE_DB = os.path.join(APP_DIR, 'survey_responses.db')
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+CONTENT_HASH_VERSION = next(migration[0] for migration in MIGRATIONS if migration[3] is hash_responses_batch)
+
+
+@pytest.fixture
+def baseline_db(tmp_path):
+    path = str(tmp_path / 'baseline.db')
+    shutil.copyfile(BASELINE_DB, path)
+    return path
+
+
+def tables(path):
+    conn = open_connection(path)
+    try:
+        return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    finally:
+        conn.close()
+
+
+def test_dry_run_on_baseline_schema(baseline_db):
+    before = tables(baseline_db)
+    result = subprocess.run([sys.executable, 'migrations.py', baseline_db, '--dry-run'],
+                            cwd=APP_DIR, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    lines = result.stdout.splitlines()
+    assert lines[0] == "Schema version: 0"
+    assert len(lines) == 1 + len(MIGRATIONS)
+    assert lines[-2].startswith("  7: add content hash for idempotent imports - 68 rows, about ")
+    assert lines[-1] == f"  {LATEST_VERSION}: keep response counts for the admin overview - schema change only"
+    # Nothing but the migrations bookkeeping is added to the database
+    assert tables(baseline_db) - before == {'schema_migrations'}
+
+
+def test_dry_run_on_empty_database(tmp_path):
+    conn = open_connection(str(tmp_path / 'empty.db'))
+    estimates = estimate_migrations(conn)
+    assert [estimate[0] for estimate in estimates] == [migration[0] for migration in MIGRATIONS]
+    assert all(rows == 0 for _, _, rows, _ in estimates)
+    assert get_schema_version(conn) == 0
+    conn.close()
+
+
+def test_migrate_baseline_schema(baseline_db):
+    conn = open_connection(baseline_db)
+    assert migrate(conn, batch_size=20) == [migration[0] for migration in MIGRATIONS]
+    assert get_schema_version(conn) == LATEST_VERSION
+    assert conn.execute("SELECT COUNT(*) FROM responses WHERE content_hash IS NULL").fetchone()[0] == 0
+    assert migrate(conn) == []
+    assert estimate_migrations(conn) == []
+    conn.close()
+
+
+def test_migrate_resumes_an_interrupted_backfill(baseline_db):
+    conn = open_connection(baseline_db)
+    migrate(conn)
+    with conn:
+        conn.execute("UPDATE responses SET content_hash = NULL WHERE id > 30")
+        conn.execute("UPDATE schema_migrations SET last_id = 30, completed_at = NULL WHERE version = ?",
+                     (CONTENT_HASH_VERSION,))
+    assert [estimate[2] for estimate in estimate_migrations(conn)] == [38]
+    assert migrate(conn, batch_size=10) == [CONTENT_HASH_VERSION]
+    assert conn.execute("SELECT COUNT(*) FROM responses WHERE content_hash IS NULL").fetchone()[0] == 0
+    conn.close()
+
+
+def test_migration_repairs_comma_split_labels(baseline_db):
+    conn = open_connection(baseline_db)
+    with conn:
+        row_id = conn.execute("""INSERT INTO responses (title, q4_beneficiary, q9_patient_journey, q10_settings)
+                                 VALUES ('Legacy', '["Staff"]', '["Stage 1: Prevention", " Trigger Event"]',
+                                         '["Home", "Primary Care"]')""").lastrowid
+    migrate(conn)
+    row = conn.execute("SELECT q4_beneficiary, q9_patient_journey, q10_settings FROM responses WHERE id = ?",
+                       (row_id,)).fetchone()
+    assert row == ('["STAFF"]', '[1]', '["HOME",1]')
+    conn.close()
+
+
+def test_import_after_migration_skips_earlier_survey_submissions(baseline_db):
+    conn = open_connection(baseline_db)
+    columns = "title, q1_problem, q2_behavior_change, q3_whose_behavior, q4_beneficiary, q5_current_behavior, " \
+              "q6_desired_behavior, q7_frictions, q7_explain, q8_address_problem, q9_patient_journey, q10_settings"
+    with conn:
+        # The same answers submitted again through the survey before the migration
+        copy_id = conn.execute(f"INSERT INTO responses ({columns}) SELECT {columns} FROM responses WHERE id = 1").lastrowid
+    migrate(conn)
+    hashed = conn.execute("SELECT id FROM responses WHERE content_hash IS NOT NULL AND id IN (1, ?)",
+                          (copy_id,)).fetchall()
+    assert hashed == [(1,)]
+    assert import_csv(conn, SAMPLE_CSV) == {'inserted': 0, 'updated': 0, 'skipped': 68}
+
+    # Responses without a hash, like the copy or submissions made after the
+    # migration, don't stop a file with their answers from being imported
+    with conn:
+        conn.execute("DELETE FROM responses WHERE id = 1")
+    assert import_csv(conn, SAMPLE_CSV)['inserted'] == 1
+    assert conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] == 69
+    conn.close()
+
+
+def test_startup_runs_schema_steps_only(baseline_db):
+    conn = open_connection(baseline_db)
+    migrate(conn, backfills=False)
+    backfilled = [migration[0] for migration in MIGRATIONS if migration[3] is not None]
+    assert [migration[0] for migration in pending_migrations(conn)] == backfilled
+    assert 'content_hash' in [info[1] for info in conn.execute("PRAGMA table_info(responses)")]
+    assert backfill_position(conn, hash_responses_batch) == 0
+
+    # Readers count the responses the backfills haven't reached as waiting
+    assert count_duplicate_queue(conn, backfill_position(conn, index_duplicate_batch)) == 68
+    assert awaiting_similarity_index(conn, 1)
+    conn.close()
+
+
+def test_backfill_worker_stops_between_batches_and_resumes(baseline_db):
+    conn = open_connection(baseline_db)
+    migrate(conn, backfills=False)
+    stopped = threading.Event()
+    stopped.set()
+    assert migrate(conn, stopped=stopped) == []
+
+    worker = BackfillWorker(baseline_db, batch_size=20)
+    wait_until(worker.done)
+    assert worker.error is None
+    assert get_schema_version(conn) == LATEST_VERSION
+    assert backfill_position(conn, hash_responses_batch) is None
+    assert conn.execute("SELECT COUNT(*) FROM responses WHERE content_hash IS NULL").fetchone()[0] == 0
+    assert not awaiting_similarity_index(conn, 1)
+    conn.close()
+
+
+def test_app_starts_before_backfills_finish(db_path):
+    shutil.copyfile(BASELINE_DB, db_path)
+    at = app_test('v1.py', page='scientist')
+    at.run()
+    assert not at.exception
+
+    conn = open_connection(db_path)
+    wait_until(lambda: get_schema_version(conn) == LATEST_VERSION, timeout=30)
+    assert conn.execute("SELECT COUNT(*) FROM duplicate_queue").fetchone()[0] == 0
+    conn.close()
+
+
+def test_response_stats_are_a_migration(baseline_db):
+    conn = open_connection(baseline_db)
+    migrate(conn, backfills=False)
+    assert get_schema_version(conn) == 3  # The option normalization backfill is pending
+    assert get_response_counts(conn) == (68, 0, 68)
+    with conn:
+        conn.execute("UPDATE responses SET approved = 1 WHERE id <= 3")
+        conn.execute("DELETE FROM responses WHERE id = 68")
+    assert get_response_counts(conn) == (67, 3, 64)
+    conn.close()
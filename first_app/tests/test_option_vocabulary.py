@@ -0,0 +1,16 @@
+from option_vocabulary import dump_answers, option_code
+
+
+def test_submitted_answers_only_match_whole_labels():
+    assert dump_answers('q4_beneficiary', ["Patient", "Staff"]) == '[7,"STAFF"]'
+    assert dump_answers('q10_settings', ["Home", "Health"]) == '["HOME","HEALTH"]'
+    assert dump_answers('q9_patient_journey', ["Stage 1: Prevention, Trigger Event", "Stage 1"]) == '[1,"STAGE 1"]'
+
+
+def test_repair_matches_whole_label_fragments():
+    assert option_code('q9_patient_journey', " Trigger Event", repair=True) == 1
+    assert option_code('q9_patient_journey', "Stage 1: Prevention", repair=True) == 1
+    assert option_code('q9_patient_journey', "Stage 2", repair=True) == 2
+    assert option_code('q9_patient_journey', "Prevent", repair=True) is None
+    assert option_code('q10_settings', "Home", repair=True) is None
+    assert option_code('q4_beneficiary', "Staff", repair=True) is None
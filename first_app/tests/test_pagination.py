@@ -0,0 +1,39 @@
+from conftest import app_test, by_label
+
+
+def page_caption(at):
+    return next(markdown.value for markdown in at.markdown if markdown.value.startswith("Page "))
+
+
+def test_scientist_dashboard_pages_forward_and_back(sample_db):
+    at = app_test(page='scientist', logged_in=False)
+    at.run()
+    assert page_caption(at) == "Page 1 of 3 (68 responses)"
+
+    by_label(at.button, "Next").click().run()
+    by_label(at.button, "Next").click().run()
+    assert not at.exception
+    assert page_caption(at) == "Page 3 of 3 (68 responses)"
+    assert list(at.dataframe[0].value.index) == list(range(51, 69))
+
+    by_label(at.button, "Previous").click().run()
+    assert page_caption(at) == "Page 2 of 3 (68 responses)"
+    assert at.dataframe[0].value.index[0] == 26
+
+
+def test_scientist_dashboard_restarts_paging_when_filters_change(sample_db):
+    at = app_test(page='scientist', logged_in=False)
+    at.run()
+    by_label(at.button, "Next").click().run()
+    at.selectbox(key='filter_q2_behavior_change').set_value('YES').run()
+    assert page_caption(at).startswith("Page 1 of ")
+
+
+def test_project_manager_pages_by_id(sample_db):
+    at = app_test(page='project_manager', logged_in=True)
+    at.run()
+    assert page_caption(at) == "Page 1 of 3 (68 responses)"
+    by_label(at.button, "Next").click().run()
+    by_label(at.button, "Next").click().run()
+    assert not at.exception
+    assert page_caption(at) == "Page 3 of 3 (68 responses)"
@@ -0,0 +1,66 @@
+from connections import open_connection
+
+from conftest import app_test, by_label
+
+
+def stored_row(db_path, response_id):
+    conn = open_connection(db_path)
+    try:
+        return conn.execute("SELECT title, version, content_hash FROM responses WHERE id = ?",
+                            (response_id,)).fetchone()
+    finally:
+        conn.close()
+
+
+def test_imported_row_edit_form_leaves_out_the_content_hash(sample_db):
+    at = app_test(page='project_manager', logged_in=True)
+    at.run()
+    assert stored_row(sample_db, 1)[2] is not None
+    assert 'content_hash' not in [text_input.label for text_input in at.text_input]
+    assert 'title' in [text_input.label for text_input in at.text_input]
+
+
+def test_update_without_changes_on_imported_row(sample_db):
+    at = app_test(page='project_manager', logged_in=True)
+    at.run()
+    by_label(at.button, "Update Submission").click().run()
+    assert not at.exception
+    assert [info.value for info in at.info] == ["No changes to save."]
+    assert stored_row(sample_db, 1)[1] == 0
+
+
+def test_update_imported_row(sample_db):
+    at = app_test(page='project_manager', logged_in=True)
+    at.run()
+    at.text_input(key='1_title').set_value("Edited title")
+    by_label(at.button, "Update Submission").click().run()
+    assert not at.exception
+    assert [success.value for success in at.success] == ["Submission 1 updated successfully!"]
+    title, version, _ = stored_row(sample_db, 1)
+    assert (title, version) == ("EDITED TITLE", 1)
+
+
+def test_review_leaves_out_the_content_hash(sample_db):
+    at = app_test('main.py', page='project_manager', pm_logged_in=True)
+    at.run()
+    assert not at.exception
+    assert "Response 1" in [subheader.value for subheader in at.subheader]
+    shown = [markdown.value for markdown in at.markdown]
+    assert any(value.startswith("title: ") for value in shown)
+    assert not any(value.startswith("content_hash") for value in shown)
+
+
+def test_update_after_someone_else_saved_is_a_conflict(sample_db):
+    at = app_test(page='project_manager', logged_in=True)
+    at.run()
+    title = stored_row(sample_db, 1)[0]
+    conn = open_connection(sample_db)
+    with conn:
+        conn.execute("UPDATE responses SET version = version + 1 WHERE id = 1")
+    conn.close()
+
+    at.text_input(key='1_title').set_value("Edited title")
+    by_label(at.button, "Update Submission").click().run()
+    assert not at.exception
+    assert at.error[0].value.startswith("Submission 1 was changed by someone else")
+    assert stored_row(sample_db, 1)[:2] == (title, 1)
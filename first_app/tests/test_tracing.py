@@ -0,0 +1,89 @@
+import json
+import threading
+
+import pytest
+
+import connections
+import tracing
+from connections import open_connection
+
+from conftest import app_test
+
+
+@pytest.fixture
+def tracing_enabled(monkeypatch, tmp_path):
+    log_path = tmp_path / 'trace.jsonl'
+    monkeypatch.setattr(tracing, 'ENABLED', True)
+    monkeypatch.setattr(tracing, 'LOG_PATH', str(log_path))
+    monkeypatch.setattr(connections, 'TRACING_ENABLED', True)
+    tracing.reset()
+    yield log_path
+    tracing.reset()
+
+
+def test_statements_differing_in_literals_share_a_name():
+    assert (tracing.statement_name("SELECT *\n  FROM responses WHERE id IN (1, 2, 3) AND title = 'A'")
+            == "SELECT * FROM responses WHERE id IN (?, ...) AND title = ?")
+    assert len(tracing.statement_name("SELECT " + ", ".join(["title"] * 50))) == tracing.STATEMENT_LENGTH
+
+
+def test_rerun_records_nested_spans_and_sql_rows(conn, sample_db, tracing_enabled):
+    @tracing.traced()
+    def load_titles(traced_conn):
+        return traced_conn.execute("SELECT title FROM responses WHERE id <= 5").fetchall()
+
+    traced_conn = open_connection(sample_db)
+    assert isinstance(traced_conn, tracing.TracedConnection)
+    with tracing.trace_rerun('scientist'):
+        with tracing.span("load"):
+            assert len(load_titles(traced_conn)) == 5
+    traced_conn.close()
+
+    rerun, = tracing.recent_reruns()
+    assert rerun['page'] == 'scientist'
+    assert [(record['name'], record['kind'], record['depth']) for record in rerun['spans']] == [
+        ("load", 'span', 0),
+        ("load_titles", 'function', 1),
+        ("SELECT title FROM responses WHERE id <= ?", 'sql', 2)]
+    assert rerun['spans'][2]['rows'] == 5
+
+    stats = tracing.span_stats()
+    assert set(stats['kind']) == {'span', 'function', 'sql', 'rerun'}
+    assert json.loads(tracing_enabled.read_text().splitlines()[0])['page'] == 'scientist'
+
+
+def test_spans_outside_a_rerun_are_aggregated(tracing_enabled):
+    # As in the group-commit and index worker threads
+    def work():
+        with tracing.span("background"):
+            pass
+
+    thread = threading.Thread(target=work)
+    thread.start()
+    thread.join()
+    assert not tracing.recent_reruns()
+    stats = tracing.span_stats()
+    assert stats.loc[stats['span'] == "background", 'samples'].item() == 1
+
+
+def test_disabled_tracing_adds_nothing(monkeypatch):
+    monkeypatch.setattr(tracing, 'ENABLED', False)
+    monkeypatch.setattr(connections, 'TRACING_ENABLED', False)
+
+    def func():
+        return 1
+
+    assert tracing.traced()(func) is func
+    assert tracing.span("noop") is tracing.trace_rerun('home')
+    assert type(open_connection(':memory:')) is not tracing.TracedConnection
+
+
+def test_trace_panel_shows_the_app_reruns(sample_db, tracing_enabled):
+    at = app_test('main.py', page='project_manager', pm_logged_in=True)
+    at.run()
+    at.run()
+    assert not at.exception
+    pages = [rerun['page'] for rerun in tracing.recent_reruns()]
+    assert pages == ['project_manager', 'project_manager']
+    assert any(record['kind'] == 'sql' for record in tracing.recent_reruns()[-1]['spans'])
+    assert at.dataframe  # The p50/p95 table of the panel
@@ -0,0 +1,51 @@
+import sqlite3
+import threading
+
+import pytest
+
+from write_queue import GroupCommitWriter
+
+INSERT = "INSERT INTO responses (title) VALUES (?)"
+
+
+def test_concurrent_submits_are_all_committed(conn, db_path):
+    writer = GroupCommitWriter(db_path, max_latency=0.05)
+    ids = []
+
+    def submitter(number):
+        for submission in range(10):
+            ids.append(writer.submit(INSERT, (f"SUBMITTER {number} #{submission}",)))
+
+    threads = [threading.Thread(target=submitter, args=(number,)) for number in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(ids)) == 80
+    assert conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] == 80
+
+
+def test_bad_row_only_fails_its_own_submission(conn, db_path):
+    # A long enough wait puts all three submissions in one batch
+    writer = GroupCommitWriter(db_path, max_latency=0.5)
+    results = {}
+
+    def submit(name, query, params):
+        try:
+            results[name] = writer.submit(query, params)
+        except sqlite3.Error as e:
+            results[name] = e
+
+    threads = [threading.Thread(target=submit, args=('first', INSERT, ("FIRST",))),
+               threading.Thread(target=submit, args=('bad', "INSERT INTO responses (no_such_column) VALUES (?)", (1,))),
+               threading.Thread(target=submit, args=('last', INSERT, ("LAST",)))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert isinstance(results['bad'], sqlite3.OperationalError)
+    titles = {row[0] for row in conn.execute("SELECT title FROM responses")}
+    assert titles == {"FIRST", "LAST"}
+    assert conn.execute("SELECT title FROM responses WHERE id = ?", (results['first'],)).fetchone() == ("FIRST",)
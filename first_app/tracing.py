@@ -0,0 +1,260 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+from functools import wraps
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+# Timing spans for the hot paths. Each rerun of a page records a span for the
+# functions marked @traced, the blocks wrapped in span(), and every SQL
+# statement with the rows it returned or changed. Finished reruns feed the
+# per-span p50/p95 figures in the admin panel and, optionally, a JSON-lines
+# log with one line per rerun.
+#
+# Enable with SURVEY_TRACING=1, log with SURVEY_TRACE_LOG=path. When disabled,
+# traced() returns the function itself, span() and trace_rerun() a shared null
+# context, and connections are plain sqlite3 connections.
+
+ENABLED = os.environ.get('SURVEY_TRACING', '0') == '1'
+LOG_PATH = os.environ.get('SURVEY_TRACE_LOG')
+
+SAMPLES_PER_SPAN = 1000  # Most recent durations kept per span for the percentiles
+RECENT_RERUNS = 20
+STATEMENT_LENGTH = 120  # SQL spans are named after the statement, cut to this length
+
+_NULL_CONTEXT = nullcontext()
+
+_local = threading.local()
+_lock = threading.Lock()
+_samples = defaultdict(lambda: deque(maxlen=SAMPLES_PER_SPAN))  # (kind, name) -> (seconds, rows)
+_recent = deque(maxlen=RECENT_RERUNS)
+
+
+def _start_span(name, kind, rows=None):
+    # The span's record, added to this thread's rerun if one is being traced
+    trace = getattr(_local, 'trace', None)
+    record = {'name': name, 'kind': kind, 'depth': 0, 'start': 0.0, 'seconds': 0.0, 'rows': rows}
+    if trace is not None:
+        record['depth'] = trace['depth']
+        record['start'] = time.perf_counter() - trace['started']
+        trace['spans'].append(record)
+    return trace, record
+
+
+def _end_span(trace, record):
+    # Spans outside a traced rerun, e.g. in the group-commit thread, are
+    # aggregated right away
+    if trace is None:
+        _aggregate([record])
+
+
+def _aggregate(records):
+    with _lock:
+        for record in records:
+            _samples[(record['kind'], record['name'])].append((record['seconds'], record['rows']))
+
+
+@contextmanager
+def _span(name, kind):
+    trace, record = _start_span(name, kind)
+    if trace is not None:
+        trace['depth'] += 1
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record['seconds'] = time.perf_counter() - start
+        if trace is not None:
+            trace['depth'] -= 1
+        _end_span(trace, record)
+
+
+def span(name):
+    return _span(name, 'span') if ENABLED else _NULL_CONTEXT
+
+
+def traced(name=None):
+    def decorate(func):
+        if not ENABLED:
+            return func
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with _span(name or func.__name__, 'function'):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+@contextmanager
+def _rerun(page):
+    trace = {'page': page, 'time': datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
+             'started': time.perf_counter(), 'depth': 0, 'spans': []}
+    _local.trace = trace
+    try:
+        yield
+    finally:
+        _local.trace = None
+        trace['seconds'] = time.perf_counter() - trace['started']
+        _finish(trace)
+
+
+def trace_rerun(page):
+    # Collects the spans of one script run of page
+    return _rerun(page) if ENABLED else _NULL_CONTEXT
+
+
+def _finish(trace):
+    _aggregate(trace['spans'] + [{'name': trace['page'], 'kind': 'rerun', 'seconds': trace['seconds'], 'rows': None}])
+    entry = {'time': trace['time'], 'page': trace['page'], 'seconds': trace['seconds'],
+             'spans': [{key: record[key] for key in ('name', 'kind', 'depth', 'start', 'seconds', 'rows')}
+                       for record in trace['spans']]}
+    with _lock:
+        _recent.append(entry)
+        if LOG_PATH:
+            with open(LOG_PATH, 'a') as f:
+                f.write(json.dumps(entry) + "\n")
+
+
+def statement_name(sql):
+    # Statements that differ only in literals or the length of an IN list
+    # share a span
+    sql = re.sub(r'\s+', ' ', sql).strip()
+    sql = re.sub(r"'[^']*'|\b\d+\b", '?', sql)
+    sql = re.sub(r'\?(, ?\?)+', '?, ...', sql)
+    return sql if len(sql) <= STATEMENT_LENGTH else sql[:STATEMENT_LENGTH - 3] + '...'
+
+
+class TracedCursor(sqlite3.Cursor):
+    # Each statement is a span; fetching its rows adds to the same span
+    _record = None
+
+    def _execute(self, method, sql, *args):
+        trace, record = _start_span(statement_name(sql), 'sql', rows=0)
+        start = time.perf_counter()
+        try:
+            return method(sql, *args)
+        finally:
+            record['seconds'] = time.perf_counter() - start
+            record['rows'] = max(self.rowcount, 0)
+            self._record = record
+            _end_span(trace, record)
+
+    def _fetched(self, start, rows):
+        if self._record is not None:
+            self._record['seconds'] += time.perf_counter() - start
+            self._record['rows'] += rows
+
+    def execute(self, sql, parameters=()):
+        return self._execute(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._execute(super().executemany, sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self._execute(super().executescript, sql_script)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(start, row is not None)
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        start = time.perf_counter()
+        rows = super().fetchmany(*args, **kwargs)
+        self._fetched(start, len(rows))
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(start, len(rows))
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        row = super().__next__()
+        self._fetched(start, 1)
+        return row
+
+
+class TracedConnection(sqlite3.Connection):
+    # Connection.execute and friends don't go through cursor(), so they are
+    # routed through a traced cursor here
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+
+def span_stats():
+    # p50/p95 per span over its recent samples, most total time first
+    with _lock:
+        samples = {key: list(values) for key, values in _samples.items()}
+    rows = []
+    for (kind, name), values in samples.items():
+        seconds = np.array([value[0] for value in values]) * 1000
+        counts = [value[1] for value in values if value[1] is not None]
+        rows.append({'span': name, 'kind': kind, 'samples': len(values),
+                     'p50 ms': np.percentile(seconds, 50), 'p95 ms': np.percentile(seconds, 95),
+                     'total ms': seconds.sum(), 'rows p50': np.median(counts) if counts else None})
+    columns = ['span', 'kind', 'samples', 'p50 ms', 'p95 ms', 'total ms', 'rows p50']
+    return pd.DataFrame(rows, columns=columns).sort_values('total ms', ascending=False, ignore_index=True)
+
+
+def recent_reruns():
+    with _lock:
+        return list(_recent)
+
+
+def reset():
+    with _lock:
+        _samples.clear()
+        _recent.clear()
+
+
+def show_trace_panel():
+    # Admin-only: call from the project manager views
+    with st.expander("Performance traces"):
+        if not ENABLED:
+            st.write("Tracing is off. Start the app with SURVEY_TRACING=1 to record timings.")
+            return
+
+        stats = span_stats()
+        if stats.empty:
+            st.write("No traced reruns yet.")
+            return
+        st.dataframe(stats, hide_index=True, column_config={
+            column: st.column_config.NumberColumn(format="%.1f") for column in ('p50 ms', 'p95 ms', 'total ms')})
+
+        # Spans of one recent rerun, nested as they ran
+        reruns = recent_reruns()[::-1]
+        choice = st.selectbox("Recent reruns", range(len(reruns)), key='trace_rerun',
+                              format_func=lambda i: f"{reruns[i]['time']} {reruns[i]['page']} "
+                                                    f"({reruns[i]['seconds'] * 1000:.0f} ms)")
+        spans = pd.DataFrame([{'span': " " * record['depth'] + record['name'], 'kind': record['kind'],
+                               'start ms': record['start'] * 1000, 'ms': record['seconds'] * 1000,
+                               'rows': record['rows']} for record in reruns[choice or 0]['spans']],
+                             columns=['span', 'kind', 'start ms', 'ms', 'rows'])
+        st.dataframe(spans, hide_index=True, column_config={
+            column: st.column_config.NumberColumn(format="%.1f") for column in ('start ms', 'ms')})
+
+        if st.button("Reset traces", key='reset_traces'):
+            reset()
+            st.rerun()
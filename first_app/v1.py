@@ -1,47 +1,113 @@
 import streamlit as st
-import sqlite3
 import pandas as pd
-import json
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib import colors
-import io
-import re
+import numpy as np
 import os
 
+from analytics import ENABLED as ANALYTICS_ENABLED, AnalyticsStore
+from answer_options import MULTISELECT_COLUMNS, create_answer_options_table
+from connections import ConnectionPool
+from data_export import EXPORT_FORMATS, export_file
+from export_jobs import ExportJobManager
+from fulltext import create_fulltext_index, search_response_ids, search_submissions
+from index_cards import card_fields
+from index_worker import IndexWorker
+from membership import build_membership_index, crosstab, facet_counts, masks_excluding_each, multiselect_mask
+from migrations import BackfillWorker, backfill_position, migrate
+from near_duplicates import (count_duplicate_flags, count_duplicate_queue, dismiss_duplicate_flag, get_duplicate_flags,
+                             index_duplicate_batch)
+from option_vocabulary import (OPTION_LABELS, QUESTION_OPTIONS, create_option_labels_table, decode_answers,
+                               decode_frame, dump_answers, load_answers, normalize_text)
+from pagination import count_responses, fetch_page, page_start_id, pager, record_page_end
+from similar_responses import SimilarityIndex, awaiting_similarity_index
+from write_counter import create_write_counter, get_data_version
+from tracing import show_trace_panel, span, trace_rerun, traced
+from write_queue import GroupCommitWriter
+
 st.set_page_config(page_title="BEAR's North Star", page_icon="🐻", layout="wide")
 
 # Get the directory of the current script
 script_dir = os.path.dirname(os.path.abspath(__file__))
 
-# Connect to the SQLite database in the same directory as the script
-db_path = os.path.join(script_dir, 'survey_responses.db')
+# Connect to the SQLite database in the same directory as the script, unless
+# SURVEY_DB_PATH points elsewhere (e.g. a benchmark database)
+db_path = os.environ.get('SURVEY_DB_PATH', os.path.join(script_dir, 'survey_responses.db'))
+
+# Pool of WAL-mode connections shared by all sessions; every database call
+# checks one out for the duration of its work
+@st.cache_resource
+def get_connection_pool():
+    return ConnectionPool(db_path)
+
+pool = get_connection_pool()
+
+# Set up the schema once per server process
+@st.cache_resource
+def initialize_database():
+    with pool.connection() as conn:
+        # Bring the responses table up to the current schema version; the
+        # backfills of new migrations run in the background (see below)
+        migrate(conn, backfills=False)
+
+        # Option codes of the multi-select answers and their labels
+        create_option_labels_table(conn)
+
+        # Child table of multi-select answers, kept in sync by triggers
+        create_answer_options_table(conn)
+
+        # FTS5 index over the free-text answers for the keyword filter
+        fulltext_enabled = create_fulltext_index(conn)
+
+        # Write counter that the cached responses frame is keyed on
+        create_write_counter(conn)
+    return fulltext_enabled
+
+fulltext_enabled = initialize_database()
+
+# Rewrites existing rows for migrations added since the last start, a batch
+# per transaction, while the app serves requests; stopped when the resource
+# is released and resumed on the next start
+@st.cache_resource(on_release=lambda worker: worker.stop())
+def get_backfill_worker():
+    return BackfillWorker(db_path)
+
+backfill_worker = get_backfill_worker()
 
-# Initialize SQLite database
+# Optional group commit for survey submissions, e.g. during workshops where
+# many people submit at once. Enable with SURVEY_GROUP_COMMIT=1; batch size and
+# the longest a submission waits for others (in ms) are configurable.
 @st.cache_resource
-def get_database_connection():
-    return sqlite3.connect(db_path, check_same_thread=False)
-
-conn = get_database_connection()
-c = conn.cursor()
-
-# Create the table if it doesn't exist
-c.execute('''CREATE TABLE IF NOT EXISTS responses
-             (id INTEGER PRIMARY KEY AUTOINCREMENT,
-              title TEXT,
-              q1_problem TEXT,
-              q2_behavior_change TEXT,
-              q3_whose_behavior TEXT,
-              q4_beneficiary TEXT,
-              q5_current_behavior TEXT,
-              q6_desired_behavior TEXT,
-              q7_frictions TEXT,
-              q7_explain TEXT,
-              q8_address_problem TEXT,
-              q9_patient_journey TEXT,
-              q10_settings TEXT)''')
-conn.commit()
+def get_survey_writer():
+    if os.environ.get('SURVEY_GROUP_COMMIT', '0') != '1':
+        return None
+    return GroupCommitWriter(db_path,
+                             max_batch=int(os.environ.get('SURVEY_GROUP_COMMIT_BATCH', '100')),
+                             max_latency=float(os.environ.get('SURVEY_GROUP_COMMIT_LATENCY_MS', '5')) / 1000)
+
+survey_writer = get_survey_writer()
+
+# Background workers for index-card PDF exports
+@st.cache_resource
+def get_export_jobs():
+    return ExportJobManager()
+
+export_jobs = get_export_jobs()
+
+# Background thread that flags near duplicates of new and edited responses
+# and computes their similarity vectors, so submits and edits only queue them;
+# stopped when the resource is released
+@st.cache_resource(on_release=lambda worker: worker.stop())
+def get_index_worker():
+    return IndexWorker(db_path)
+
+index_worker = get_index_worker()
+
+# In-memory TF-IDF index behind "Show Similar", shared by all sessions; each
+# query first applies the vectors the index worker stored since the last one
+@st.cache_resource
+def get_similarity_index():
+    return SimilarityIndex()
+
+similarity_index = get_similarity_index()
 
 def main():
     if 'page' not in st.session_state:
@@ -49,20 +115,26 @@ def main():
     if 'logged_in' not in st.session_state:
         st.session_state.logged_in = False
 
-    show_sidebar()
-
-    if st.session_state.page == 'home':
-        show_home()
-    elif st.session_state.page == 'problem':
-        show_problem_survey()
-    elif st.session_state.page == 'scientist':
-        show_scientist_dashboard()
-    elif st.session_state.page == 'project_manager':
-        if st.session_state.logged_in:
-            show_project_manager_view()
-        else:
-            show_login()
+    # Timing spans of this rerun, when tracing is enabled
+    with trace_rerun(st.session_state.page):
+        show_sidebar()
+
+        if st.session_state.page == 'home':
+            show_home()
+        elif st.session_state.page == 'problem':
+            show_problem_survey()
+        elif st.session_state.page == 'scientist':
+            show_scientist_dashboard()
+        elif st.session_state.page == 'project_manager':
+            if st.session_state.logged_in:
+                show_project_manager_view()
+            else:
+                show_login()
 
+# Most search matches offered in the submission picker
+PICKER_SEARCH_LIMIT = 50
+
+@traced()
 def show_login():
     st.sidebar.title("Project Manager Login")
     email = st.sidebar.text_input("Email")
@@ -74,11 +146,25 @@ def show_login():
         else:
             st.sidebar.error("Incorrect email or password")
 
+@traced()
 def show_project_manager_view():
     st.title("Project Manager Dashboard")
 
-    # Load all submissions
-    df = pd.read_sql_query("SELECT id, title, q1_problem FROM responses", conn)
+    # Search by title or problem, or page through all submissions; either way
+    # only a page of submissions is loaded
+    search = st.text_input("Search submissions by title, problem or ID:", key="pm_search")
+    if search:
+        with pool.connection() as conn:
+            df = search_submissions(conn, search, limit=PICKER_SEARCH_LIMIT, use_fts=fulltext_enabled)
+        if df.empty:
+            st.write("No submissions match your search.")
+    else:
+        with pool.connection() as conn:
+            total_submissions = count_responses(conn)
+        _, page_size = pager('pm_page', total_submissions, keyset=True)
+        with pool.connection() as conn:
+            df = fetch_page(conn, page_start_id('pm_page'), page_size, columns="id, title, q1_problem")
+        record_page_end('pm_page', df)
 
     # Function to safely get the title or use a fallback
     def get_title(row):
@@ -90,10 +176,11 @@ def show_project_manager_view():
             return "No title or problem description available"
 
     # Create a selection box for choosing which submission to edit
+    labels = {row['id']: f"ID {row['id']}: {get_title(row)}..." for row in df.to_dict('records')}
     selected_id = st.selectbox(
         "Select a submission to edit:", 
-        options=df['id'].tolist(),
-        format_func=lambda x: f"ID {x}: {get_title(df[df['id']==x].iloc[0])}..."
+        options=list(labels),
+        format_func=labels.get
     )
 
     if selected_id:
@@ -105,81 +192,123 @@ def show_project_manager_view():
         st.success(f"New submission added successfully! ID: {new_id}")
         st.rerun()
 
+    # Responses flagged as near duplicates of each other
+    show_duplicate_review()
+
+    # Timing spans and SQL statements of recent reruns
+    show_trace_panel()
+
+# Most flagged pairs listed at once in the duplicate review
+DUPLICATE_REVIEW_LIMIT = 20
+
+@traced()
+def show_duplicate_review():
+    # New responses are checked by the index worker, and those stored before
+    # the duplicate index by its migration backfill; those neither has
+    # reached yet are counted
+    with pool.connection() as conn:
+        unchecked = count_duplicate_queue(conn, backfill_position(conn, index_duplicate_batch))
+        total_flags = count_duplicate_flags(conn)
+        flags = get_duplicate_flags(conn, limit=DUPLICATE_REVIEW_LIMIT)
+
+    with st.expander(f"Possible duplicates ({total_flags})"):
+        if unchecked:
+            st.caption(f"{unchecked} responses are still waiting to be checked.")
+        if flags.empty:
+            st.write("No possible duplicates to review.")
+
+        for flag in flags.to_dict('records'):
+            newer, older = flag['response_id'], flag['duplicate_of']
+            st.markdown(f"**ID {newer}** looks like **ID {older}** ({flag['similarity']:.0%} similar)")
+            col1, col2 = st.columns(2)
+            with col1:
+                st.caption(f"ID {newer}: {flag['title'] or ''}")
+                st.write(flag['q1_problem'])
+                if st.button(f"Delete ID {newer}", key=f"delete_duplicate_{newer}_{older}"):
+                    delete_submission(newer)
+                    st.rerun()
+            with col2:
+                st.caption(f"ID {older}: {flag['duplicate_title'] or ''}")
+                st.write(flag['duplicate_q1_problem'])
+                if st.button("Not duplicates", key=f"dismiss_duplicate_{newer}_{older}"):
+                    with pool.connection() as conn:
+                        dismiss_duplicate_flag(conn, newer, older)
+                    st.rerun()
+
+def load_submission(submission_id):
+    with pool.connection() as conn:
+        df = pd.read_sql_query("SELECT * FROM responses WHERE id = ?", conn, params=[submission_id])
+    return df.iloc[0].to_dict() if not df.empty else None
+
+@traced()
 def edit_submission(submission_id):
-    query = f"SELECT * FROM responses WHERE id = {submission_id}"
-    df = pd.read_sql_query(query, conn)
-    row = df.iloc[0]
+    # The row is read once and kept in the session while it is being edited;
+    # its version is what the update is checked against
+    base_key = f"edit_base_{submission_id}"
+    if st.session_state.get(base_key) is None:
+        st.session_state[base_key] = load_submission(submission_id)
+    if st.session_state[base_key] is None:
+        st.warning(f"Submission {submission_id} no longer exists.")
+        return
+    row = dict(st.session_state[base_key])
 
     st.subheader(f"Editing Submission {submission_id}")
 
-    json_columns = ['q3_whose_behavior', 'q4_beneficiary', 'q7_frictions', 'q9_patient_journey', 'q10_settings']
-    for col in json_columns:
-        if col in df.columns:
-            row[col] = safe_json_loads(row[col])
+    for col in MULTISELECT_COLUMNS:
+        if col in row:
+            row[col] = load_answers(row[col])
 
     edited_row = {}
+    initial_values = {}
 
-    def simple_match_defaults(stored_values, options):
+    def option_defaults(col, stored_values):
+        # Predefined options by label; any other answer shows as "OTHER"
         default_values = []
-        for val in stored_values:
-            val = val.upper()
-            if val in options:
-                default_values.append(val)
-            else:
-                # Check if any option contains this value as a substring
-                matched = False
-                for option in options:
-                    if val in option:
-                        default_values.append(option)
-                        matched = True
-                        break
-                if not matched:
-                    default_values.append("OTHER")
+        for value in decode_answers(col, stored_values):
+            value = value if value in OPTION_LABELS[col] else "OTHER"
+            if value not in default_values:
+                default_values.append(value)
         return default_values
 
-    for col in df.columns:
-        if col == 'id':
-            continue
+    # Only the answers are edited; bookkeeping columns such as the content
+    # hash stay out of the form
+    for col in EDITABLE_COLUMNS:
         if col == 'q2_behavior_change':
+            initial_values[col] = 'YES' if row[col] == 'YES' else 'NO'
             edited_row[col] = st.radio(col, options=['YES', 'NO'], index=0 if row[col] == 'YES' else 1, key=f"{submission_id}_{col}")
-        elif col in ['q3_whose_behavior', 'q4_beneficiary']:
-            options = ['ALL', 'ADMINISTRATIVE STAFF', 'DIETICIAN', 'EDUCATOR', 'MEDIA', 
-                       'NURSE', 'NURSE PRACTITIONER', 'PATIENT', 'PHARMACIST', 
-                       'PHYSICIAN', 'PUBLIC HEALTH', 'SOCIAL WORKER', 'STUDENT', 'OTHER']
-            default_values = simple_match_defaults(row[col], options)
-            edited_row[col] = st.multiselect(col, options=options, default=default_values, key=f"{submission_id}_{col}")
-        elif col == 'q7_frictions':
-            options = ['ALL', 
-                       "AMBIGUITY: UNCLEAR GUIDANCE TO USERS TO ADOPT DESIRED BEHAVIOUR",
-                       "LOW MOTIVATION OR AWARENESS: DON'T KNOW, UNDERSTAND OR APPRECIATE THE VALUES OF DESIRED BEHAVIOUR",
-                       "SYSTEMIC CORPORATION: THE DESIRED BEHAVIOUR INVOLVES SOME CHANGES TO UPSTREAM/DOWNSTREAM PRACTICE IN THE FIRST PLACE",
-                       "COMPLEXITY: NUANCES OR VARIATIONS OF IMPLEMENTING INTERVENTIONS IN REAL LIFE",
-                       "RESEARCH LAGGING BEHIND: RESEARCHERS AND/OR HEALTHCARE PRACTITIONERS NEED FURTHER UNDERSTANDING",
-                       "TECH/TOOLS CONSTRAINTS: THE DESIRED BEHAVIOUR CHANGE IS RESTRICTED DUE TO UNDEREQUIPPED OR INACCESSIBLE TECHNOLOGY/DEVICE/TOOLS",
-                       "OTHER"]
-            default_values = simple_match_defaults(row[col], options)
-            edited_row[col] = st.multiselect(col, options=options, default=default_values, key=f"{submission_id}_{col}")
-        elif col == 'q9_patient_journey':
-            options = ['ALL', 
-                       "STAGE 1: PREVENTION, TRIGGER EVENT",
-                       "STAGE 2: INITIAL VISIT, DIAGNOSIS",
-                       "STAGE 3: TREATMENT, CLINICAL CARE",
-                       "STAGE 4: FOLLOW-UP, ONGOING CARE",
-                       "OTHER"]
-            default_values = simple_match_defaults(row[col], options)
-            edited_row[col] = st.multiselect(col, options=options, default=default_values, key=f"{submission_id}_{col}")
-        elif col == 'q10_settings':
-            options = ['ALL', "PRIMARY CARE", "HOSPITAL CARE", "HOME AND LONG-TERM CARE", "COMMUNITY CARE", "OTHER"]
-            default_values = simple_match_defaults(row[col], options)
+        elif col in MULTISELECT_COLUMNS:
+            options = OPTION_LABELS[col] + ["OTHER"]
+            default_values = option_defaults(col, row[col])
+            initial_values[col] = default_values
             edited_row[col] = st.multiselect(col, options=options, default=default_values, key=f"{submission_id}_{col}")
         else:
+            initial_values[col] = row[col]
             edited_row[col] = st.text_input(col, value=row[col], key=f"{submission_id}_{col}")
 
+    if st.session_state.get(f"edit_conflict_{submission_id}"):
+        st.error(f"Submission {submission_id} was changed by someone else since you opened it. "
+                 "Reload it to see their changes before saving yours.")
+        if st.button("Reload Submission", key=f"reload_{submission_id}"):
+            st.session_state[base_key] = None
+            st.session_state[f"edit_conflict_{submission_id}"] = False
+            for col in EDITABLE_COLUMNS:
+                st.session_state.pop(f"{submission_id}_{col}", None)
+            st.rerun()
+
     col1, col2, col3 = st.columns(3)
     with col1:
         if st.button(f"Update Submission", key=f"update_{submission_id}"):
-            update_submission(submission_id, edited_row)
-            st.success(f"Submission {submission_id} updated successfully!")
+            # Only write the fields that were actually changed
+            changes = {col: value for col, value in edited_row.items() if value != initial_values[col]}
+            status = update_submission(submission_id, changes, row['version'])
+            if status == 'unchanged':
+                st.info("No changes to save.")
+            elif status == 'updated':
+                st.session_state[base_key] = None  # Re-read the new version on the next rerun
+                st.success(f"Submission {submission_id} updated successfully!")
+            else:
+                st.session_state[f"edit_conflict_{submission_id}"] = True
+                st.rerun()
 
     with col2:
         if st.button(f"Delete Submission", key=f"delete_{submission_id}"):
@@ -191,40 +320,46 @@ def edit_submission(submission_id):
         if st.button("Back to Submission List", key="back_to_list"):
             st.rerun()
 
-def update_submission(submission_id, data):
-    query = """UPDATE responses SET
-               title = ?, q1_problem = ?, q2_behavior_change = ?,
-               q3_whose_behavior = ?, q4_beneficiary = ?, q5_current_behavior = ?,
-               q6_desired_behavior = ?, q7_frictions = ?, q7_explain = ?,
-               q8_address_problem = ?, q9_patient_journey = ?, q10_settings = ?
-               WHERE id = ?"""
-    c.execute(query, (data['title'], data['q1_problem'], data['q2_behavior_change'],
-                      json.dumps(data['q3_whose_behavior']), json.dumps(data['q4_beneficiary']),
-                      data['q5_current_behavior'], data['q6_desired_behavior'],
-                      json.dumps(data['q7_frictions']), data['q7_explain'],
-                      data['q8_address_problem'], json.dumps(data['q9_patient_journey']),
-                      json.dumps(data['q10_settings']), submission_id))
-    conn.commit()
+def update_submission(submission_id, changes, expected_version):
+    # Writes only the changed columns, and only if nobody else has updated the
+    # row since it was read. Returns 'updated', 'conflict', or 'unchanged'
+    # when no editable column changed, in which case nothing is written.
+    columns = [col for col in changes if col in EDITABLE_COLUMNS]
+    if not columns:
+        return 'unchanged'
+    values = [dump_answers(col, changes[col]) if col in MULTISELECT_COLUMNS else normalize_text(changes[col])
+              for col in columns]
+    assignments = ", ".join(f"{col} = ?" for col in columns)
+    query = f"UPDATE responses SET {assignments}, version = version + 1 WHERE id = ? AND version = ?"
+    with pool.connection() as conn:
+        updated = conn.execute(query, (*values, submission_id, expected_version)).rowcount
+    # Triggers queued the edit; the index worker re-indexes it
+    index_worker.notify()
+    return 'updated' if updated == 1 else 'conflict'
+
+EDITABLE_COLUMNS = ['title', 'q1_problem', 'q2_behavior_change', 'q3_whose_behavior', 'q4_beneficiary',
+                    'q5_current_behavior', 'q6_desired_behavior', 'q7_frictions', 'q7_explain',
+                    'q8_address_problem', 'q9_patient_journey', 'q10_settings']
 
 def delete_submission(submission_id):
-    c.execute("DELETE FROM responses WHERE id = ?", (submission_id,))
-    conn.commit()
+    with pool.connection() as conn:
+        conn.execute("DELETE FROM responses WHERE id = ?", (submission_id,))
 
 def add_new_submission():
-    # Get the current maximum ID
-    c.execute("SELECT MAX(id) FROM responses")
-    max_id = c.fetchone()[0]
-    new_id = max_id + 1 if max_id is not None else 1
-
-    # Insert new submission with the new ID
-    c.execute("""INSERT INTO responses (id, title, q1_problem, q2_behavior_change, q3_whose_behavior,
-                 q4_beneficiary, q5_current_behavior, q6_desired_behavior, q7_frictions,
-                 q7_explain, q8_address_problem, q9_patient_journey, q10_settings)
-                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-              (new_id, 'New Submission', '', 'YES', '[]', '[]', '', '', '[]', '', '', '[]', '[]'))
-    conn.commit()
+    with pool.connection() as conn:
+        # Get the current maximum ID
+        max_id = conn.execute("SELECT MAX(id) FROM responses").fetchone()[0]
+        new_id = max_id + 1 if max_id is not None else 1
+
+        # Insert new submission with the new ID
+        conn.execute("""INSERT INTO responses (id, title, q1_problem, q2_behavior_change, q3_whose_behavior,
+                        q4_beneficiary, q5_current_behavior, q6_desired_behavior, q7_frictions,
+                        q7_explain, q8_address_problem, q9_patient_journey, q10_settings)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                     (new_id, 'NEW SUBMISSION', '', 'YES', '[]', '[]', '', '', '[]', '', '', '[]', '[]'))
     return new_id
 
+@traced()
 def show_home():
     st.markdown("<h1 style='text-align: center;'>BEAR's North Star</h1>", unsafe_allow_html=True)
     st.markdown("<h3 style='text-align: center; font-style: italic;'>An opportunity map for behavioural interventions in healthcare.</h3>", unsafe_allow_html=True)
@@ -250,6 +385,29 @@ def show_home():
                 st.session_state.page = 'scientist'
                 st.rerun()
 
+INSERT_SURVEY_RESPONSE = """
+    INSERT INTO responses (
+        q1_problem, q2_behavior_change, q3_whose_behavior, q4_beneficiary,
+        q5_current_behavior, q6_desired_behavior, q7_frictions, q7_explain,
+        q8_address_problem, q9_patient_journey, q10_settings
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+def save_survey_response(values):
+    # Goes through the group-commit writer when it is enabled, otherwise
+    # commits directly; either way returns once the row is on disk
+    if survey_writer is not None:
+        response_id = survey_writer.submit(INSERT_SURVEY_RESPONSE, values)
+    else:
+        with pool.connection(durable=True) as conn:
+            response_id = conn.execute(INSERT_SURVEY_RESPONSE, values).lastrowid
+
+    # Triggers queued the new response; the index worker flags its near
+    # duplicates for the PM and makes it searchable by similarity
+    index_worker.notify()
+    return response_id
+
+@traced()
 def show_problem_survey():
     st.title("Have a Behavioural Problem?")
     
@@ -260,15 +418,11 @@ def show_problem_survey():
                       ["Yes", "No"])
         
         q3 = st.multiselect("Q3. Whose behaviour should primarily be changed?", 
-                            ["Administrative Staff", "Dietician", "Educator", "Media", 
-                             "Nurse", "Nurse Practitioner", "Patient", "Pharmacist", 
-                             "Physician", "Public Health", "Social Worker", "Student", "Other"])
+                            QUESTION_OPTIONS['q3_whose_behavior'] + ["Other"])
         q3_elaborate = st.text_area("Elaborate on your answer to question 3:", key="q3_elaborate")
         
         q4 = st.multiselect("Q4. Who will the primary beneficiary of this behaviour change be?",
-                            ["Administrative Staff", "Dietician", "Educator", "Media", 
-                             "Nurse", "Nurse Practitioner", "Patient", "Pharmacist", 
-                             "Physician", "Public Health", "Social Worker", "Student", "Other"])
+                            QUESTION_OPTIONS['q4_beneficiary'] + ["Other"])
         q4_elaborate = st.text_area("Elaborate on your answer to question 4:", key="q4_elaborate")
         
         q5 = st.text_area("Q5. CURRENT BEHAVIOUR: What are they currently doing?")
@@ -276,197 +430,225 @@ def show_problem_survey():
         q6 = st.text_area("Q6. DESIRED BEHAVIOUR: What should they be doing that might solve the problem?")
         
         q7 = st.multiselect("Q7. Why might they not be doing the desired behavior? What might the frictions be?",
-                            ["Ambiguity: unclear guidance to users to adopt desired behaviour",
-                             "Low motivation or awareness: don't know, understand or appreciate the values of desired behaviour",
-                             "Systemic corporation: the desired behaviour involves some changes to upstream/downstream practice in the first place",
-                             "Complexity: nuances or variations of implementing interventions in real life",
-                             "Research lagging behind: Researchers and/or healthcare practitioners need further understanding",
-                             "Tech/tools constraints: the desired behaviour change is restricted due to underequipped or inaccessible technology/device/tools",
-                             "Other"])
+                            QUESTION_OPTIONS['q7_frictions'] + ["Other"])
         q7_elaborate = st.text_area("Elaborate on your answer to question 7:", key="q7_elaborate")
         
         q8 = st.text_area("Q8. How will the behaviour change address the problem?")
         
         q9 = st.multiselect("Q9. At which stage of the patient journey map does this problem arise?",
-                            ["Stage 1: Prevention, Trigger Event",
-                             "Stage 2: Initial Visit, Diagnosis",
-                             "Stage 3: Treatment, Clinical Care",
-                             "Stage 4: Follow-Up, Ongoing Care",
-                             "Other"])
+                            QUESTION_OPTIONS['q9_patient_journey'] + ["Other"])
         q9_elaborate = st.text_area("Elaborate on your answer to question 9:", key="q9_elaborate")
         
         q10 = st.multiselect("Q10. Does this problem manifest itself in any of the following settings?",
-                             ["Primary Care",
-                              "Hospital Care",
-                              "Home and Long-Term Care",
-                              "Community Care",
-                              "Other"])
+                             QUESTION_OPTIONS['q10_settings'] + ["Other"])
         q10_elaborate = st.text_area("Elaborate on your answer to question 10:", key="q10_elaborate")
         
         submitted = st.form_submit_button("Submit")
         
         if submitted:
-            c.execute("""
-                INSERT INTO responses (
-                    q1_problem, q2_behavior_change, q3_whose_behavior, q4_beneficiary,
-                    q5_current_behavior, q6_desired_behavior, q7_frictions, q7_explain,
-                    q8_address_problem, q9_patient_journey, q10_settings
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                q1.upper(),
-                q2.upper(),
-                json.dumps([x.upper() for x in q3] + [f"Elaboration: {q3_elaborate.upper()}"]),
-                json.dumps([x.upper() for x in q4] + [f"Elaboration: {q4_elaborate.upper()}"]),
-                q5.upper(),
-                q6.upper(),
-                json.dumps([x.upper() for x in q7] + [f"Elaboration: {q7_elaborate.upper()}"]),
-                q7_elaborate.upper(),  # This is the existing q7_explain field
-                q8.upper(),
-                json.dumps([x.upper() for x in q9] + [f"Elaboration: {q9_elaborate.upper()}"]),
-                json.dumps([x.upper() for x in q10] + [f"Elaboration: {q10_elaborate.upper()}"])
+            save_survey_response((
+                normalize_text(q1),
+                normalize_text(q2),
+                dump_answers('q3_whose_behavior', q3 + [f"Elaboration: {q3_elaborate}"]),
+                dump_answers('q4_beneficiary', q4 + [f"Elaboration: {q4_elaborate}"]),
+                normalize_text(q5),
+                normalize_text(q6),
+                dump_answers('q7_frictions', q7 + [f"Elaboration: {q7_elaborate}"]),
+                normalize_text(q7_elaborate),  # This is the existing q7_explain field
+                normalize_text(q8),
+                dump_answers('q9_patient_journey', q9 + [f"Elaboration: {q9_elaborate}"]),
+                dump_answers('q10_settings', q10 + [f"Elaboration: {q10_elaborate}"])
             ))
-            conn.commit()
             st.success("Survey submitted successfully!")
 
     if st.button("Back to Home", key="problem_back_survey_button"):
         st.session_state.page = 'home'
         st.rerun()
 
-def safe_json_loads(x):
-    try:
-        return json.loads(x)
-    except json.JSONDecodeError:
-        return x  # Return the original string if it's not valid JSON
-    except TypeError:
-        return x  # Return the original value if it's not a string
+# Options offered by the scientist dashboard multi-select filters
+FILTER_OPTIONS = {col: ['ALL'] + labels + ['OTHER'] for col, labels in OPTION_LABELS.items()}
+
+# Labels of the scientist dashboard multi-select filters
+FILTER_LABELS = {
+    'q3_whose_behavior': "Whose Behavior",
+    'q4_beneficiary': "Beneficiary",
+    'q7_frictions': "Frictions",
+    'q9_patient_journey': "Patient Journey Stage",
+    'q10_settings': "Settings",
+}
+
+# Cached as a resource so reruns share one frame instead of copying it; the
+# dashboard only ever selects from it and must not modify it in place.
+@st.cache_resource(max_entries=1, show_spinner=False)
+def load_responses(data_version):
+    with pool.connection() as conn:
+        df = pd.read_sql_query("SELECT * FROM responses ORDER BY id", conn)
+    
+    # Answers are normalized on write; multi-select cells are parsed into
+    # lists of option codes and only decoded to labels for display
+    with span("parse answers"):
+        for col in MULTISELECT_COLUMNS:
+            if col in df.columns:
+                df[col] = df[col].map(load_answers)
+    
+    return df.set_index('id', drop=False).rename_axis(None)
+
+@st.cache_resource(max_entries=1, show_spinner=False)
+def load_membership_index(data_version):
+    with pool.connection() as conn:
+        return build_membership_index(conn, load_responses(data_version).index, FILTER_OPTIONS)
 
+# Optional DuckDB copy that the dashboard filters instead of the cached frame
+@st.cache_resource
+def get_analytics_store():
+    return AnalyticsStore(db_path, FILTER_OPTIONS) if ANALYTICS_ENABLED else None
+
+@traced()
+def filter_loaded_responses(responses, data_version, keyword, matching_ids, selected_behavior_change, selections):
+    # The dashboard filters over the cached frame. Returns (ids of the
+    # matching responses in display order, counts per behavior change answer,
+    # facet counts per multi-select column, mask of the matching rows).
+    keyword_mask = np.ones(len(responses), dtype=bool)
+    with span("keyword filter"):
+        if matching_ids is not None:
+            keyword_mask = responses.index.isin(matching_ids)
+        elif keyword:
+            # Fall back to scanning every cell when SQLite was built without FTS5
+            keyword_mask = decode_frame(responses).apply(lambda row: row.astype(str).str.contains(keyword, case=False).any(), axis=1).to_numpy()
+    
+    with span("load membership index"):
+        membership_index = load_membership_index(data_version)
+    
+    with span("multiselect filters"):
+        masks = [keyword_mask]
+        if selected_behavior_change and selected_behavior_change != 'ALL':
+            masks.append((responses['q2_behavior_change'] == selected_behavior_change).to_numpy())
+        else:
+            masks.append(np.ones(len(responses), dtype=bool))
+        masks += [multiselect_mask(membership_index, column, selected) for column, selected in selections.items()]
+    
+    with span("facet counts"):
+        base_masks = masks_excluding_each(masks)
+        behavior_change_counts = responses['q2_behavior_change'][base_masks[1]].value_counts()
+        behavior_change_counts['ALL'] = int(np.count_nonzero(base_masks[1]))
+        facets = {column: facet_counts(membership_index, column, base_mask)
+                  for column, base_mask in zip(FILTER_LABELS, base_masks[2:])}
+    
+    with span("select rows"):
+        mask = np.logical_and.reduce(masks)
+        if matching_ids is not None:
+            ids = matching_ids[matching_ids.isin(responses.index[mask])]
+        else:
+            ids = responses.index[mask]
+    return ids, behavior_change_counts, facets, mask
+
+@traced()
 def show_scientist_dashboard():
     st.title("Behavioural Scientist Dashboard")
     
-    # Load data
-    df = pd.read_sql_query("SELECT * FROM responses", conn)
+    # Parsed and normalized responses, rebuilt only after a write, or the
+    # DuckDB copy when the analytical backend is enabled
+    analytics_store = get_analytics_store()
+    with pool.connection() as conn:
+        data_version = get_data_version(conn)
+    if analytics_store is not None:
+        with span("refresh analytics"):
+            analytics_store.refresh(data_version)
+        if not analytics_store.available():
+            # The first copy failed to build; refresh tries again after a backoff
+            st.warning("The analytics database is unavailable, so the dashboard filters the responses "
+                       "directly for now. Filtering may be slower.")
+            analytics_store = None
+    if analytics_store is not None:
+        total = analytics_store.count()
+    else:
+        with span("load responses"):
+            responses = load_responses(data_version)
+        total = len(responses)
     
-    if df.empty:
+    if not total:
         st.write("No responses yet.")
         return
     
-    # Convert JSON strings back to lists, handling potential errors
-    json_columns = ['q3_whose_behavior', 'q4_beneficiary', 'q7_frictions', 'q9_patient_journey', 'q10_settings']
-    for col in json_columns:
-        if col in df.columns:
-            df[col] = df[col].apply(safe_json_loads)
-    
-    # Normalize responses by converting to uppercase
-    for col in df.columns:
-        if df[col].dtype == 'object':
-            df[col] = df[col].apply(lambda x: [item.upper() if isinstance(item, str) else item for item in x] if isinstance(x, list) else x.upper() if isinstance(x, str) else x)
-    
     # Keyword filter
     keyword = st.text_input("Filter responses by keyword:")
     if keyword:
         keyword = keyword.upper()
     
+    # Keyword filter through the FTS5 index, ranked by relevance
+    matching_ids = None
+    if keyword and fulltext_enabled:
+        with span("keyword search"), pool.connection() as conn:
+            matching_ids = pd.Index(search_response_ids(conn, keyword))
+    
+    # Each filter's options are labelled with how many responses they would
+    # return given the other active filters, so the current selections are
+    # read from the widget state before the widgets are drawn
+    selected_behavior_change = st.session_state.get('filter_q2_behavior_change', 'ALL')
+    selections = {column: st.session_state.get(f"filter_{column}", []) for column in FILTER_LABELS}
+    
+    # ids of the filtered responses in display order; rows(ids) reads them
+    if analytics_store is not None:
+        ids, behavior_change_counts, facets = analytics_store.filter(keyword, matching_ids, selected_behavior_change,
+                                                                     selections)
+        if not analytics_store.is_current(data_version):
+            st.caption(f"Showing responses as of {analytics_store.built_at():%H:%M:%S}; "
+                       "newer changes appear after the next refresh.")
+        rows = analytics_store.rows
+        
+        def crosstab_counts(row_column, column_column):
+            return analytics_store.crosstab(row_column, column_column, ids)
+    else:
+        ids, behavior_change_counts, facets, mask = filter_loaded_responses(
+            responses, data_version, keyword, matching_ids, selected_behavior_change, selections)
+        
+        def rows(ids):
+            return responses.loc[ids[ids.isin(responses.index)]]
+        
+        def crosstab_counts(row_column, column_column):
+            return crosstab(load_membership_index(data_version), row_column, column_column, mask)
+    
     # Multiple choice filters
     st.subheader("Filter by Multiple Choice Questions")
     col1, col2 = st.columns(2)
     
+    def facet_filter(column):
+        st.multiselect(FILTER_LABELS[column], FILTER_OPTIONS[column], key=f"filter_{column}",
+                       format_func=lambda option: f"{option} ({facets[column][option]})")
+    
     with col1:
         # Filter for q2_behavior_change
         behavior_change_options = ['ALL', 'YES', 'NO']
-        selected_behavior_change = st.selectbox("Behavior Change", behavior_change_options)
-        
-        # Filter for q3_whose_behavior
-        whose_behavior_options = ['ALL', 'ADMINISTRATIVE STAFF', 'DIETICIAN', 'EDUCATOR', 'MEDIA', 
-                                  'NURSE', 'NURSE PRACTITIONER', 'PATIENT', 'PHARMACIST', 
-                                  'PHYSICIAN', 'PUBLIC HEALTH', 'SOCIAL WORKER', 'STUDENT', 'OTHER']
-        selected_whose_behavior = st.multiselect("Whose Behavior", whose_behavior_options)
+        st.selectbox("Behavior Change", behavior_change_options, key='filter_q2_behavior_change',
+                     format_func=lambda option: f"{option} ({behavior_change_counts.get(option, 0)})")
         
-        # Filter for q4_beneficiary
-        beneficiary_options = ['ALL', 'ADMINISTRATIVE STAFF', 'DIETICIAN', 'EDUCATOR', 'MEDIA', 
-                               'NURSE', 'NURSE PRACTITIONER', 'PATIENT', 'PHARMACIST', 
-                               'PHYSICIAN', 'PUBLIC HEALTH', 'SOCIAL WORKER', 'STUDENT', 'OTHER']
-        selected_beneficiary = st.multiselect("Beneficiary", beneficiary_options)
+        # Filters for q3_whose_behavior and q4_beneficiary
+        facet_filter('q3_whose_behavior')
+        facet_filter('q4_beneficiary')
     
     with col2:
-        # Filter for q7_frictions
-        friction_options = ['ALL', 
-                            "AMBIGUITY: UNCLEAR GUIDANCE TO USERS TO ADOPT DESIRED BEHAVIOUR",
-                            "LOW MOTIVATION OR AWARENESS: DON'T KNOW, UNDERSTAND OR APPRECIATE THE VALUES OF DESIRED BEHAVIOUR",
-                            "SYSTEMIC CORPORATION: THE DESIRED BEHAVIOUR INVOLVES SOME CHANGES TO UPSTREAM/DOWNSTREAM PRACTICE IN THE FIRST PLACE",
-                            "COMPLEXITY: NUANCES OR VARIATIONS OF IMPLEMENTING INTERVENTIONS IN REAL LIFE",
-                            "RESEARCH LAGGING BEHIND: RESEARCHERS AND/OR HEALTHCARE PRACTITIONERS NEED FURTHER UNDERSTANDING",
-                            "TECH/TOOLS CONSTRAINTS: THE DESIRED BEHAVIOUR CHANGE IS RESTRICTED DUE TO UNDEREQUIPPED OR INACCESSIBLE TECHNOLOGY/DEVICE/TOOLS",
-                            "OTHER"]
-        selected_frictions = st.multiselect("Frictions", friction_options)
-        
-        # Filter for q9_patient_journey
-        journey_options = ['ALL', 
-                           "STAGE 1: PREVENTION, TRIGGER EVENT",
-                           "STAGE 2: INITIAL VISIT, DIAGNOSIS",
-                           "STAGE 3: TREATMENT, CLINICAL CARE",
-                           "STAGE 4: FOLLOW-UP, ONGOING CARE",
-                           "OTHER"]
-        selected_journey = st.multiselect("Patient Journey Stage", journey_options)
-        
-        # Filter for q10_settings
-        settings_options = ['ALL', 
-                            "PRIMARY CARE",
-                            "HOSPITAL CARE",
-                            "HOME AND LONG-TERM CARE",
-                            "COMMUNITY CARE",
-                            "OTHER"]
-        selected_settings = st.multiselect("Settings", settings_options)
-    
-    # Apply filters
-    if keyword:
-        df = df[df.apply(lambda row: row.astype(str).str.contains(keyword, case=False).any(), axis=1)]
-    
-    if selected_behavior_change and selected_behavior_change != 'ALL':
-        df = df[df['q2_behavior_change'] == selected_behavior_change]
-
-    def filter_multiselect(column, selected, options):
-        if not selected or 'ALL' in selected:
-            return pd.Series([True] * len(df))
-        
-        predefined_options = set(options[1:-1])  # Exclude 'ALL' and 'OTHER'
-        
-        def check_row(row):
-            if isinstance(row, list):
-                if 'OTHER' in selected:
-                    return any(item not in predefined_options for item in row)
-                return any(item in selected for item in row)
-            elif isinstance(row, str):
-                if 'OTHER' in selected:
-                    return row not in predefined_options
-                return row in selected
-            return False
-        
-        return df[column].apply(check_row)
-
-    if selected_whose_behavior:
-        df = df[filter_multiselect('q3_whose_behavior', selected_whose_behavior, whose_behavior_options)]
-    
-    if selected_beneficiary:
-        df = df[filter_multiselect('q4_beneficiary', selected_beneficiary, beneficiary_options)]
-    
-    if selected_frictions:
-        df = df[filter_multiselect('q7_frictions', selected_frictions, friction_options)]
-    
-    if selected_journey:
-        df = df[filter_multiselect('q9_patient_journey', selected_journey, journey_options)]
-    
-    if selected_settings:
-        df = df[filter_multiselect('q10_settings', selected_settings, settings_options)]
+        # Filters for q7_frictions, q9_patient_journey and q10_settings
+        facet_filter('q7_frictions')
+        facet_filter('q9_patient_journey')
+        facet_filter('q10_settings')
     
     # Display results in a table format
     st.subheader("Filtered Responses:")
     
-    # Create a display dataframe without the ID column if it exists
-    display_df = df.copy()
-    if 'id' in display_df.columns:
-        display_df = display_df.drop(columns=['id'])
+    # Only the visible page is sent to the browser; rows keep their number in
+    # the whole filtered result so they can be picked for the PDF on any page
+    filters_signature = (keyword, selected_behavior_change,
+                         *(tuple(selected) for selected in selections.values()))
+    page, page_size = pager('scientist_page', len(ids), signature=filters_signature)
+    offset = page * page_size
+    
+    # Create a display dataframe without the ID, approval and version columns
+    with span("decode page"):
+        display_df = decode_frame(rows(ids[offset:offset + page_size]))
+    display_df = display_df.drop(columns=[col for col in ('id', 'approved', 'version', 'content_hash')
+                                          if col in display_df.columns])
     display_df = display_df.reset_index(drop=True)
-    display_df.index += 1  # Start index from 1 instead of 0
+    display_df.index += offset + 1  # Number rows from 1 across pages
     
     # Rename columns for better readability
     new_column_names = {
@@ -487,7 +669,15 @@ def show_scientist_dashboard():
     display_df.rename(columns={col: new_name for col, new_name in new_column_names.items() if col in display_df.columns}, inplace=True)
     
     # Display the table
-    st.dataframe(display_df, height=400)
+    with span("st.dataframe"):
+        st.dataframe(display_df, height=400)
+    
+    # Download the whole filtered result as data; the file is only written
+    # once the button is clicked
+    export_format = st.selectbox("Export format", list(EXPORT_FORMATS), key='export_format')
+    extension, mime = EXPORT_FORMATS[export_format]
+    st.download_button(f"Download filtered responses ({len(ids)})", data=lambda: export_filtered(export_format, ids, rows),
+                       file_name=f"filtered_responses.{extension}", mime=mime, on_click='ignore')
     
     # Input field for response numbers
     response_numbers = st.text_input("Enter response numbers to download index cards in pdf (comma-separated, e.g., 1,3,5):")
@@ -497,15 +687,12 @@ def show_scientist_dashboard():
         if response_numbers:
             try:
                 selected_indices = [int(idx.strip()) for idx in response_numbers.split(',')]
-                selected_df = df.iloc[pd.Index(selected_indices) - 1]  # Adjust for 0-based indexing
+                selected_df = rows(ids[pd.Index(selected_indices) - 1])  # Adjust for 0-based indexing
                 if not selected_df.empty:
-                    pdf = create_index_cards_pdf(selected_df)
-                    st.download_button(
-                        label="Download PDF",
-                        data=pdf,
-                        file_name="selected_responses.pdf",
-                        mime="application/pdf"
-                    )
+                    # Render in the background; progress and the download show below
+                    with span("prepare index cards"):
+                        cards = [card_fields(row) for _, row in selected_df.iterrows()]
+                    st.session_state.export_job = export_jobs.submit(cards)
                 else:
                     st.warning("No valid response numbers found. Please check your input.")
             except (ValueError, IndexError):
@@ -513,10 +700,116 @@ def show_scientist_dashboard():
         else:
             st.warning("No response numbers entered. Please enter at least one response number.")
     
+    if st.session_state.get('export_job'):
+        show_export(st.session_state.export_job)
+    
+    # Option pairs among the filtered responses
+    show_crosstab(crosstab_counts)
+    
+    # Responses similar to one from the table, searched across all responses
+    show_similar_responses(ids, rows)
+    
     if st.button("Back to Home", key="scientist_back"):
         st.session_state.page = 'home'
         st.rerun()
 
+@traced()
+def show_crosstab(crosstab_counts):
+    # Responses per pair of options of two multi-select questions;
+    # crosstab_counts(row_column, column_column) counts the filtered responses
+    if not st.checkbox("Cross-tabulate the filtered responses", key='show_crosstab'):
+        return
+    
+    col1, col2 = st.columns(2)
+    questions = list(FILTER_LABELS)
+    row_column = col1.selectbox("Rows", questions, format_func=FILTER_LABELS.get, key='crosstab_rows')
+    column_column = col2.selectbox("Columns", questions, index=1, format_func=FILTER_LABELS.get,
+                                   key='crosstab_columns')
+    st.dataframe(crosstab_counts(row_column, column_column))
+
+# Most similar responses listed for "Show Similar"
+SIMILAR_RESPONSES_LIMIT = 10
+
+@traced()
+def show_similar_responses(ids, rows):
+    st.subheader("Similar Opportunities")
+    response_number = st.text_input("Enter a response number to find similar opportunities:")
+    
+    if st.button("Show Similar"):
+        try:
+            st.session_state.similar_to = int(ids[int(response_number.strip()) - 1])
+        except (ValueError, IndexError):
+            st.warning("Invalid input. Please enter a response number within the range of responses.")
+    
+    response_id = st.session_state.get('similar_to')
+    if response_id is None:
+        return
+    response = rows(pd.Index([response_id]))
+    if response.empty:
+        return
+    
+    with st.spinner("Finding similar responses..."):
+        with pool.connection() as conn:
+            similar = similarity_index.similar(conn, response_id, limit=SIMILAR_RESPONSES_LIMIT)
+            waiting = awaiting_similarity_index(conn, response_id)
+    similar_rows = rows(pd.Index([similar_id for similar_id, _ in similar]))
+    similar = [(similar_id, score) for similar_id, score in similar if similar_id in similar_rows.index]
+    
+    st.write(f"Responses similar to **{response.at[response_id, 'title'] or f'ID {response_id}'}**:")
+    if not similar:
+        if waiting:
+            st.write("This response is still being indexed; try again shortly.")
+        else:
+            st.write("No similar responses found.")
+        return
+    
+    similar_df = similar_rows.loc[[similar_id for similar_id, _ in similar],
+                                  ['title', 'q1_problem', 'q6_desired_behavior']]
+    similar_df = similar_df.rename(columns={'title': 'Title', 'q1_problem': 'Problem',
+                                            'q6_desired_behavior': 'Desired Behavior'})
+    similar_df.insert(0, 'Similarity', [f"{score:.0%}" for _, score in similar])
+    st.dataframe(similar_df, hide_index=True)
+
+# Runs on a download thread when the button is clicked, not in the script run
+@traced()
+def export_filtered(export_format, ids, rows):
+    with pool.connection() as conn:
+        return export_file(export_format, ids, rows, conn)
+
+@traced()
+def show_export(job_id):
+    job = export_jobs.status(job_id)
+    if job is None or (job['status'] == 'done' and not os.path.exists(job['path'])):
+        # Server restarted or the export expired
+        st.session_state.export_job = None
+        st.info("The PDF export is no longer available. Please create it again.")
+        return
+    
+    if job['status'] == 'done':
+        with open(job['path'], 'rb') as f:
+            st.download_button(
+                label="Download PDF",
+                data=f,
+                file_name="selected_responses.pdf",
+                mime="application/pdf"
+            )
+    elif job['status'] == 'failed':
+        st.error(f"Creating the PDF failed: {job['error']}")
+    else:
+        show_export_progress(job_id)
+
+# Polls the running export without rerunning the whole page, and reruns the
+# page once the PDF is ready so the download button appears
+@st.fragment(run_every=1)
+def show_export_progress(job_id):
+    job = export_jobs.status(job_id)
+    if job is None or job['status'] in ('done', 'failed'):
+        # Gone after a restart; show_export clears it on the rerun
+        st.rerun()
+    st.progress(job['done'] / max(job['total'], 1),
+                text=f"Creating index cards: {job['done']} of {job['total']}")
+
+@traced()
 def show_sidebar():
     with st.sidebar:
         st.title("Navigation")
@@ -537,87 +830,5 @@ def show_sidebar():
                 st.session_state.page = 'home'
                 st.rerun()
 
-def create_index_cards_pdf(df):
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    elements = []
-    
-    styles = getSampleStyleSheet()
-    styles.add(ParagraphStyle(name='SectionTitle', 
-                              fontSize=18, 
-                              textColor=colors.Color(1,0.71,0,1),  # FFB600 in RGB
-                              spaceAfter=10))
-    styles.add(ParagraphStyle(name='Entry', 
-                              fontSize=12, 
-                              spaceAfter=5))
-    
-    def strip_question_number(header):
-        return re.sub(r'^\[?\d+\]?\s*', '', header)
-    
-    for index, row in df.iterrows():
-        # Title Section
-        if row['title']:
-            elements.append(Paragraph(f"<b>Title</b>", styles['SectionTitle']))
-            elements.append(Paragraph(f"{row['title']}", styles['Entry']))
-            elements.append(Spacer(1, 20))
-        
-        # Problem Statement Section
-        problem_statements = []
-        if row['q1_problem']:
-            problem_statements.append(f"<b>{strip_question_number('q1_problem')}:</b> {row['q1_problem']}")
-        if row['q9_patient_journey']:
-            journey = ', '.join(safe_json_loads(row['q9_patient_journey']))
-            problem_statements.append(f"<b>{strip_question_number('q9_patient_journey')}:</b> {journey}")
-        if row['q10_settings']:
-            settings = ', '.join(safe_json_loads(row['q10_settings']))
-            problem_statements.append(f"<b>{strip_question_number('q10_settings')}:</b> {settings}")
-        
-        if problem_statements:
-            elements.append(Paragraph("<b>Problem Statement</b>", styles['SectionTitle']))
-            for statement in problem_statements:
-                elements.append(Paragraph(statement, styles['Entry']))
-            elements.append(Spacer(1, 20))
-        
-        # The Behaviour Change Section
-        behaviour_changes = []
-        if row['q2_behavior_change']:
-            behaviour_changes.append(f"<b>{strip_question_number('q2_behavior_change')}:</b> {row['q2_behavior_change']}")
-        if row['q5_current_behavior']:
-            behaviour_changes.append(f"<b>{strip_question_number('q5_current_behavior').replace('CURRENT BEHAVIOUR', '')}:</b> {row['q5_current_behavior']}")
-        if row['q6_desired_behavior']:
-            behaviour_changes.append(f"<b>{strip_question_number('q6_desired_behavior').replace('DESIRED BEHAVIOUR', '')}:</b> {row['q6_desired_behavior']}")
-        
-        if behaviour_changes:
-            elements.append(Paragraph("<b>The Behaviour Change</b>", styles['SectionTitle']))
-            for change in behaviour_changes:
-                elements.append(Paragraph(change, styles['Entry']))
-            elements.append(Spacer(1, 20))
-        
-        # Barriers to Change Section
-        if row['q7_frictions']:
-            elements.append(Paragraph("<b>Barriers to Change</b>", styles['SectionTitle']))
-            frictions = ', '.join(safe_json_loads(row['q7_frictions']))
-            elements.append(Paragraph(f"<b>{strip_question_number('q7_frictions')}:</b> {frictions}", styles['Entry']))
-            elements.append(Spacer(1, 20))
-        
-        # The Desired Outcome Section
-        desired_outcomes = []
-        if row['q8_address_problem']:
-            desired_outcomes.append(f"<b>{strip_question_number('q8_address_problem')}:</b> {row['q8_address_problem']}")
-        if row['q4_beneficiary']:
-            beneficiary = ', '.join(safe_json_loads(row['q4_beneficiary']))
-            desired_outcomes.append(f"<b>{strip_question_number('q4_beneficiary')}:</b> {beneficiary}")
-        
-        if desired_outcomes:
-            elements.append(Paragraph("<b>The Desired Outcome</b>", styles['SectionTitle']))
-            for outcome in desired_outcomes:
-                elements.append(Paragraph(outcome, styles['Entry']))
-        
-        elements.append(PageBreak())
-    
-    doc.build(elements)
-    buffer.seek(0)
-    return buffer
-
 if __name__ == "__main__":
     main()
\ No newline at end of file
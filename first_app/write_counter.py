@@ -0,0 +1,36 @@
+# A single-row counter that triggers bump on every write to responses. Cached
+# reads are keyed on it, so they are rebuilt only after a real write, whichever
+# connection or process (app, loadingscript.py, sqlite shell) made it.
+
+
+def create_write_counter(conn):
+    c = conn.cursor()
+    c.executescript("""
+        CREATE TABLE IF NOT EXISTS responses_version
+            (id INTEGER PRIMARY KEY CHECK (id = 1),
+             version INTEGER NOT NULL);
+
+        INSERT OR IGNORE INTO responses_version (id, version) VALUES (1, 0);
+
+        CREATE TRIGGER IF NOT EXISTS responses_version_insert AFTER INSERT ON responses
+        BEGIN
+            UPDATE responses_version SET version = version + 1 WHERE id = 1;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS responses_version_update AFTER UPDATE ON responses
+        BEGIN
+            UPDATE responses_version SET version = version + 1 WHERE id = 1;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS responses_version_delete AFTER DELETE ON responses
+        BEGIN
+            UPDATE responses_version SET version = version + 1 WHERE id = 1;
+        END;
+    """)
+    conn.commit()
+
+
+def get_data_version(conn):
+    c = conn.cursor()
+    c.execute("SELECT version FROM responses_version WHERE id = 1")
+    return c.fetchone()[0]
@@ -0,0 +1,65 @@
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+from connections import open_connection
+
+# Group commit for survey submissions. Sessions put their INSERT on a queue and
+# wait; a single background thread collects whatever arrives within a few
+# milliseconds and writes it in one transaction, so a burst of submissions
+# costs one fsync instead of one per response.
+
+
+class GroupCommitWriter:
+    def __init__(self, db_path, max_batch=100, max_latency=0.005, busy_timeout=5000):
+        self.db_path = db_path
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self.busy_timeout = busy_timeout
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="survey-group-commit", daemon=True)
+        self._thread.start()
+
+    def submit(self, query, params, timeout=30):
+        # Blocks until the row is committed and returns its rowid
+        future = Future()
+        self._queue.put((query, params, future))
+        return future.result(timeout)
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_latency
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        conn = open_connection(self.db_path, self.busy_timeout)
+        # Acknowledge only once the commit has reached the disk
+        conn.execute("PRAGMA synchronous = FULL")
+        while True:
+            batch = self._next_batch()
+            try:
+                with conn:
+                    rowids = [conn.execute(query, params).lastrowid for query, params, _ in batch]
+            except sqlite3.Error:
+                # Retry one by one so a bad row only fails its own submission
+                for query, params, future in batch:
+                    try:
+                        with conn:
+                            rowid = conn.execute(query, params).lastrowid
+                    except sqlite3.Error as e:
+                        future.set_exception(e)
+                    else:
+                        future.set_result(rowid)  # Only once committed
+            else:
+                for (_, _, future), rowid in zip(batch, rowids):
+                    future.set_result(rowid)